@@ -3,6 +3,7 @@
 定义统一的数据源接口
 """
 from abc import ABC, abstractmethod
+from operator import itemgetter
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
@@ -36,6 +37,8 @@ class BaseDataSource(ABC):
     """数据源基类"""
     
     name: str = "base"
+    # 同一标的的多个周期能否并发请求（定时同步据此并发拉取各周期，而非逐周期间隔串行）
+    supports_multi_tf: bool = False
     
     @abstractmethod
     def get_kline(
@@ -126,7 +129,7 @@ class BaseDataSource(ABC):
             处理后的K线数据
         """
         # 按时间排序
-        klines.sort(key=lambda x: x['time'])
+        klines.sort(key=itemgetter('time'))
         
         # 过滤时间
         if before_time:
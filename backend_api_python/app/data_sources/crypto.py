@@ -17,6 +17,8 @@ class CryptoDataSource(BaseDataSource):
     """加密货币数据源"""
     
     name = "Crypto/CCXT"
+    # 交易所各周期 K 线为独立接口，权重额度足以并发拉取
+    supports_multi_tf = True
     
     # 时间周期映射
     TIMEFRAME_MAP = CCXTConfig.TIMEFRAME_MAP
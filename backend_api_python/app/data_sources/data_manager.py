@@ -16,6 +16,7 @@ A股数据源管理器 (Data Manager)
 """
 
 import logging
+from operator import itemgetter
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import requests
@@ -262,7 +263,7 @@ class AShareDataManager:
                     continue
         
         # 过滤和排序
-        klines.sort(key=lambda x: x['time'])
+        klines.sort(key=itemgetter('time'))
         if before_time:
             klines = [k for k in klines if k['time'] < before_time]
         if len(klines) > limit:
@@ -344,7 +345,7 @@ class AShareDataManager:
                             continue
         
         # 过滤和排序
-        klines.sort(key=lambda x: x['time'])
+        klines.sort(key=itemgetter('time'))
         if before_time:
             klines = [k for k in klines if k['time'] < before_time]
         if len(klines) > limit:
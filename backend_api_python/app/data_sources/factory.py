@@ -2,6 +2,7 @@
 数据源工厂
 根据市场类型返回对应的数据源
 """
+from operator import itemgetter
 from typing import Dict, List, Any, Optional
 
 from app.data_sources.base import BaseDataSource, RateLimitError
@@ -97,7 +98,7 @@ class DataSourceFactory:
             klines = source.get_kline(symbol, timeframe, limit, before_time)
             
             # 确保数据按时间排序
-            klines.sort(key=lambda x: x['time'])
+            klines.sort(key=itemgetter('time'))
             
             return klines
         except RateLimitError:
@@ -2,6 +2,7 @@
 外汇数据源
 使用 Tiingo 获取外汇数据
 """
+from operator import itemgetter
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 import os
@@ -488,7 +489,7 @@ class ForexDataSource(BaseDataSource):
                 })
             
             # 按时间排序
-            klines.sort(key=lambda x: x['time'])
+            klines.sort(key=itemgetter('time'))
             
             # 如果需要聚合到周线或月线
             if aggregate_to_weekly:
@@ -4,6 +4,7 @@
 1. 加密货币期货（Binance Futures via CCXT）
 2. 传统期货（Yahoo Finance）
 """
+from operator import itemgetter
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import ccxt
@@ -183,7 +184,7 @@ class FuturesDataSource(BaseDataSource):
                     'volume': float(row['Volume'])
                 })
             
-            klines.sort(key=lambda x: x['time'])
+            klines.sort(key=itemgetter('time'))
             if len(klines) > limit:
                 klines = klines[-limit:]
             
@@ -20,6 +20,7 @@ Lookback math uses the same seconds semantics as ``DataSufficiencyResult`` field
 from __future__ import annotations
 
 from collections import defaultdict
+from operator import itemgetter
 from typing import Callable, Dict, List, Optional
 
 from app.services.data_sufficiency_types import (
@@ -58,7 +59,7 @@ def _aggregate_bars_to_interval(bars: List[dict], interval_sec: int) -> List[dic
         buckets[bucket].append(b)
     out: List[dict] = []
     for bucket in sorted(buckets.keys()):
-        group = sorted(buckets[bucket], key=lambda x: x["time"])
+        group = sorted(buckets[bucket], key=itemgetter("time"))
         o, h = group[0]["open"], max(x["high"] for x in group)
         l, c = min(x["low"] for x in group), group[-1]["close"]
         v = sum(int(x.get("volume", 0) or 0) for x in group)
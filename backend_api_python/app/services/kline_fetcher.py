@@ -2,8 +2,20 @@
 K线拉取唯一入口：分层存各周期（1m/5m/15m/30m/1H/4H/1D/1W）到 qd_kline_points。
 优先同周期读库 -> 不足则用低层级数据换算 -> 仍不足则拉网并缓存当前周期。
 """
+import heapq
+import json
+import os
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from functools import partial
+from itertools import pairwise
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
 
 from app.data_sources import DataSourceFactory
 from app.data_sources.base import TIMEFRAME_SECONDS
@@ -12,6 +24,9 @@ from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# K 线按时间取键：C 实现，排序/二分/归并时不走 Python 层 lambda
+_bytime = itemgetter("time")
+
 # ---------------------------------------------------------------------------
 # 市场容差：各市场最大合法无数据间隔（秒）
 # 用于缓存范围命中判断：stored_min <= need_start + gap 且 stored_max >= need_end - gap
@@ -32,7 +47,7 @@ MAX_GAP: Dict[tuple, int] = {
 }
 
 
-def _get_max_gap(market: str, interval_sec: int) -> int:
+def _compute_max_gap(market: str, interval_sec: int) -> int:
     gap = MAX_GAP.get((market, interval_sec))
     if gap is not None:
         return gap
@@ -43,6 +58,21 @@ def _get_max_gap(market: str, interval_sec: int) -> int:
     return MAX_GAP.get((market, 60), 3 * 86400)
 
 
+# 启动时把 (市场, 周期秒数) 全部展开，热路径单次 dict 查找
+_GAP_LUT: Dict[tuple, int] = {
+    (market, sec): _compute_max_gap(market, sec)
+    for market in {m for m, _ in MAX_GAP}
+    for sec in TIMEFRAME_SECONDS.values()
+}
+
+
+def _get_max_gap(market: str, interval_sec: int) -> int:
+    gap = _GAP_LUT.get((market, interval_sec))
+    if gap is None:
+        gap = _compute_max_gap(market, interval_sec)
+    return gap
+
+
 def _range_window_seconds_multiplier(market: str, interval_sec: int) -> float:
     """Scale wall-clock span for ``need_start_ts`` when bars are not 24/7.
 
@@ -111,15 +141,24 @@ def _ensure_range_table() -> None:
         logger.debug("Range table ensure skipped: %s", e)
 
 
+_SELECT_RANGE_SQL = "SELECT min_ts, max_ts FROM qd_kline_ranges WHERE market = ? AND symbol = ? AND interval_sec = ?"
+
+_UPSERT_RANGE_SQL = """INSERT INTO qd_kline_ranges (market, symbol, interval_sec, min_ts, max_ts, updated_at)
+    VALUES (?, ?, ?, ?, ?, NOW())
+    ON CONFLICT (market, symbol, interval_sec)
+    DO UPDATE SET
+      min_ts = LEAST(qd_kline_ranges.min_ts, EXCLUDED.min_ts),
+      max_ts = GREATEST(qd_kline_ranges.max_ts, EXCLUDED.max_ts),
+      updated_at = NOW()
+    RETURNING market"""
+
+
 def _get_range(market: str, symbol: str, interval_sec: int) -> Optional[tuple]:
     _ensure_range_table()
     try:
         with get_db_connection() as db:
             cur = db.cursor()
-            cur.execute(
-                "SELECT min_ts, max_ts FROM qd_kline_ranges WHERE market = ? AND symbol = ? AND interval_sec = ?",
-                (market, symbol, interval_sec),
-            )
+            cur.execute(_SELECT_RANGE_SQL, (market, symbol, interval_sec))
             row = cur.fetchone()
             cur.close()
         if row and row.get("min_ts") is not None:
@@ -136,14 +175,7 @@ def _update_range(market: str, symbol: str, interval_sec: int, data_min_ts: int,
         with get_db_connection() as db:
             cur = db.cursor()
             cur.execute(
-                """INSERT INTO qd_kline_ranges (market, symbol, interval_sec, min_ts, max_ts, updated_at)
-                   VALUES (?, ?, ?, ?, ?, NOW())
-                   ON CONFLICT (market, symbol, interval_sec)
-                   DO UPDATE SET
-                     min_ts = LEAST(qd_kline_ranges.min_ts, EXCLUDED.min_ts),
-                     max_ts = GREATEST(qd_kline_ranges.max_ts, EXCLUDED.max_ts),
-                     updated_at = NOW()
-                   RETURNING market""",
+                _UPSERT_RANGE_SQL,
                 (market, symbol, interval_sec, int(data_min_ts), int(data_max_ts)),
             )
             db.commit()
@@ -165,39 +197,217 @@ LOWER_LEVELS: Dict[str, List[str]] = {
 }
 
 
-def _row_to_kline(row: Dict[str, Any]) -> Dict[str, Any]:
-    """数据库行 -> K 线格式 (time 为秒时间戳)。"""
-    return {
-        'time': int(row['time_sec']),
-        'open': float(row['open_price']),
-        'high': float(row['high_price']),
-        'low': float(row['low_price']),
-        'close': float(row['close_price']),
-        'volume': float(row['volume']),
-    }
+# 点位的列式（SoA）表示：一行 48 字节连续存放，读库->聚合全程不物化 dict，仅在返回前端时转换
+KLINE_FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume')
+KLINE_DTYPE = np.dtype([
+    ('time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'), ('volume', 'f8'),
+])
+
+
+_kline_tuple = itemgetter(*KLINE_FIELDS)
+
+
+def _bars_to_array(bars: List[Dict[str, Any]]) -> np.ndarray:
+    return np.fromiter(map(_kline_tuple, bars), dtype=KLINE_DTYPE, count=len(bars))
+
+
+def _array_to_bars(arr: np.ndarray) -> List[Dict[str, Any]]:
+    return [dict(zip(KLINE_FIELDS, row)) for row in arr.tolist()]
+
+
+def _aggregate_array(arr: np.ndarray, interval_sec: int) -> np.ndarray:
+    """结构化数组按 time//interval_sec 分桶归约（稳定排序后 reduceat），返回同 dtype 的聚合结果。"""
+    if arr.size == 0:
+        return arr
+    arr = arr[np.argsort(arr['time'], kind='stable')]
+    bucket = (arr['time'] // interval_sec) * interval_sec
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    ends = np.append(starts[1:], arr.size) - 1
+    out = np.empty(starts.size, dtype=KLINE_DTYPE)
+    out['time'] = bucket[starts]
+    out['open'] = arr['open'][starts]
+    out['high'] = np.maximum.reduceat(arr['high'], starts)
+    out['low'] = np.minimum.reduceat(arr['low'], starts)
+    out['close'] = arr['close'][ends]
+    out['volume'] = np.add.reduceat(arr['volume'], starts)
+    return out
+
+
+# 少于该根数时走纯 Python 线性扫描（省去转数组开销），否则走 NumPy 向量化归约
+AGG_NUMPY_MIN_BARS = 2000
+
+
+def _aggregate_sorted_scan(bars: List[Dict[str, Any]], interval_sec: int) -> Optional[List[Dict[str, Any]]]:
+    """已按时间升序时单趟扫描、就地归约相邻同桶 bar；发现乱序返回 None 交给通用路径。"""
+    out: List[Dict[str, Any]] = []
+    n = len(bars)
+    i = 0
+    prev_t = None
+    while i < n:
+        b = bars[i]
+        t = b['time']
+        if prev_t is not None and t < prev_t:
+            return None
+        bk = (t // interval_sec) * interval_sec
+        h, l, v = b['high'], b['low'], b['volume']
+        prev_t = t
+        j = i + 1
+        while j < n:
+            bj = bars[j]
+            tj = bj['time']
+            if tj < prev_t:
+                return None
+            if tj - bk >= interval_sec:
+                break
+            if bj['high'] > h:
+                h = bj['high']
+            if bj['low'] < l:
+                l = bj['low']
+            v += bj['volume']
+            prev_t = tj
+            j += 1
+        out.append({'time': bk, 'open': b['open'], 'high': h, 'low': l, 'close': bars[j - 1]['close'], 'volume': v})
+        i = j
+    return out
 
 
 def _aggregate_bars(
     bars_1m: List[Dict[str, Any]],
     interval_sec: int,
 ) -> List[Dict[str, Any]]:
-    """1m 点聚合成指定周期：按 time//interval_sec 分组，OHLCV 标准规则。"""
+    """1m 点聚合成指定周期：按 time//interval_sec 分组，OHLCV 标准规则。dict 列表入参，内部转结构化数组归约。"""
     if not bars_1m or interval_sec <= 60:
         return bars_1m if (interval_sec <= 60) else []
-    from collections import defaultdict
-    buckets = defaultdict(list)
-    for b in bars_1m:
-        t = b['time']
-        bucket = (t // interval_sec) * interval_sec
-        buckets[bucket].append(b)
-    out = []
-    for bucket in sorted(buckets.keys()):
-        group = sorted(buckets[bucket], key=lambda x: x['time'])
-        o, h = group[0]['open'], max(x['high'] for x in group)
-        l, c = min(x['low'] for x in group), group[-1]['close']
-        v = sum(x['volume'] for x in group)
-        out.append({'time': bucket, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v})
-    return out
+    n = len(bars_1m)
+    if n < AGG_NUMPY_MIN_BARS:
+        # 读库结果均 ORDER BY time_sec，常见情形已有序
+        out = _aggregate_sorted_scan(bars_1m, interval_sec)
+        if out is not None:
+            return out
+    return _array_to_bars(_aggregate_array(_bars_to_array(bars_1m), interval_sec))
+
+
+_MISS = object()
+
+
+class _TtlLru:
+    """线程安全的定长 TTL LRU（OrderedDict 实现），未命中返回 _MISS。"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return _MISS
+            if time.monotonic() - hit[0] >= (self.ttl if ttl is None else ttl):
+                del self._data[key]
+                return _MISS
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# 每个 (market, symbol) 的写入代数：缓存键带上代数，写点事务提交后代数 +1，旧键自然失效（LRU 淘汰）
+_POINTS_GEN: Dict[tuple, int] = {}
+_POINTS_GEN_LOCK = threading.Lock()
+
+
+def _points_generation(market: str, symbol: str) -> int:
+    return _POINTS_GEN.get((market, symbol), 0)
+
+
+def _bump_points_generation(market: str, symbol: str) -> None:
+    with _POINTS_GEN_LOCK:
+        _POINTS_GEN[(market, symbol)] = _POINTS_GEN.get((market, symbol), 0) + 1
+
+
+# 读库结果缓存：进行中的区间短 TTL；已收盘区间（end 早于 now-2*interval）数据不再变化，TTL 放长
+# （仍有上限：多进程部署时其它 worker 的写入不会推进本进程代数）
+POINTS_READ_CACHE_TTL = 10
+POINTS_CLOSED_CACHE_TTL = 600
+_POINTS_READ_CACHE = _TtlLru(2048, POINTS_READ_CACHE_TTL)
+_POINTS_CLOSED_CACHE = _TtlLru(1024, POINTS_CLOSED_CACHE_TTL)
+_POINTS_MAX_TS_CACHE = _TtlLru(2048, POINTS_READ_CACHE_TTL)
+
+
+# 读写 SQL 均为模块常量：文本恒定，db 封装的占位符改写按文本记忆化，每进程只做一次。
+# 读点位时库内完成 NUMERIC->float8 转换并按 K 线字段名起别名，游标行即前端 K 线 dict，无需逐字段 int()/float()
+_POINT_COLUMNS_SQL = """time_sec AS time,
+    open_price::float8 AS open, high_price::float8 AS high, low_price::float8 AS low,
+    close_price::float8 AS close, volume::float8 AS volume"""
+
+_SELECT_POINTS_RANGE_SQL = f"""SELECT {_POINT_COLUMNS_SQL}
+    FROM qd_kline_points
+    WHERE market = ? AND symbol = ? AND interval_sec = ?
+    AND time_sec >= ? AND time_sec <= ?
+    ORDER BY time_sec ASC"""
+
+# 旧表结构（无 interval_sec 列）仅存 1m
+_SELECT_POINTS_RANGE_LEGACY_SQL = f"""SELECT {_POINT_COLUMNS_SQL}
+    FROM qd_kline_points
+    WHERE market = ? AND symbol = ?
+    AND time_sec >= ? AND time_sec <= ?
+    ORDER BY time_sec ASC"""
+
+_SELECT_POINTS_AGGREGATED_SQL = """SELECT (time_sec / ?) * ? AS time,
+    ((array_agg(open_price ORDER BY time_sec ASC))[1])::float8 AS open,
+    MAX(high_price)::float8 AS high,
+    MIN(low_price)::float8 AS low,
+    ((array_agg(close_price ORDER BY time_sec DESC))[1])::float8 AS close,
+    SUM(volume)::float8 AS volume
+    FROM qd_kline_points
+    WHERE market = ? AND symbol = ? AND interval_sec = ?
+    AND time_sec >= ? AND time_sec <= ?
+    GROUP BY 1
+    ORDER BY 1 ASC"""
+
+# 最新 N 根：倒序 LIMIT 走 (market, symbol, interval_sec, time_sec) 索引反向扫描，一次往返取到尾部
+_SELECT_POINTS_TAIL_SQL = f"""SELECT {_POINT_COLUMNS_SQL}
+    FROM qd_kline_points
+    WHERE market = ? AND symbol = ? AND interval_sec = ?
+    ORDER BY time_sec DESC
+    LIMIT ?"""
+
+_SELECT_POINTS_TAIL_LEGACY_SQL = f"""SELECT {_POINT_COLUMNS_SQL}
+    FROM qd_kline_points
+    WHERE market = ? AND symbol = ?
+    ORDER BY time_sec DESC
+    LIMIT ?"""
+
+_SELECT_POINTS_MAX_TS_SQL = "SELECT max(time_sec) AS max_ts FROM qd_kline_points WHERE market = ? AND symbol = ?"
+
+
+# 宽范围读取走服务端游标分批拉取（每批 STREAM_ITERSIZE 行），避免 fetchall 一次性物化全部结果
+STREAM_ITERSIZE = 2000
+
+
+def _stream_points(sql: str, params: tuple, as_array: bool = False):
+    """服务端命名游标流式读取点数据（行已是 K 线字段）；as_array=True 直接填充 KLINE_DTYPE 结构化数组。"""
+    with get_db_connection() as db:
+        cur = db.cursor(name="qd_kline_stream")
+        try:
+            cur.itersize = STREAM_ITERSIZE
+            cur.execute(sql, params)
+            if as_array:
+                return np.fromiter(map(_kline_tuple, cur), dtype=KLINE_DTYPE)
+            return list(cur)
+        finally:
+            cur.close()
 
 
 def _read_points_range_from_db(
@@ -207,42 +417,75 @@ def _read_points_range_from_db(
     end_ts: int,
     interval_sec: int = 60,
 ) -> List[Dict[str, Any]]:
-    """qd_kline_points 读取 [start_ts, end_ts]，interval_sec 60=1m, 300=5m。"""
+    """qd_kline_points 读取 [start_ts, end_ts]，interval_sec 60=1m, 300=5m。经进程内 TTL LRU 缓存。"""
+    # 点位时间均为 60 的整数倍：[start, end] 实际覆盖的是 [ceil(start/60), floor(end/60)] 分钟，
+    # 起点向上、终点向下取整后键相同的请求读到的集合相同
+    key = (market, symbol, interval_sec, -(-start_ts // 60), end_ts // 60, _points_generation(market, symbol))
+    closed = end_ts <= int(time.time()) - 2 * interval_sec
+    cache = _POINTS_CLOSED_CACHE if closed else _POINTS_READ_CACHE
+    hit = cache.get(key)
+    if hit is not _MISS:
+        return list(hit)
+    out = _read_points_range_uncached(market, symbol, start_ts, end_ts, interval_sec)
+    if out:
+        cache.put(key, out)
+    return list(out)
+
+
+def _read_points_range_uncached(
+    market: str,
+    symbol: str,
+    start_ts: int,
+    end_ts: int,
+    interval_sec: int = 60,
+    as_array: bool = False,
+):
     try:
-        with get_db_connection() as db:
-            cur = db.cursor()
-            cur.execute(
-                """SELECT time_sec, open_price, high_price, low_price, close_price, volume
-                   FROM qd_kline_points
-                   WHERE market = ? AND symbol = ? AND interval_sec = ?
-                   AND time_sec >= ? AND time_sec <= ?
-                   ORDER BY time_sec ASC""",
-                (market, symbol, interval_sec, start_ts, end_ts),
-            )
-            rows = cur.fetchall()
-            cur.close()
-        return [_row_to_kline(r) for r in rows]
+        return _stream_points(
+            _SELECT_POINTS_RANGE_SQL,
+            (market, symbol, interval_sec, start_ts, end_ts),
+            as_array,
+        )
     except Exception as e:
         if interval_sec == 60:
             try:
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute(
-                        """SELECT time_sec, open_price, high_price, low_price, close_price, volume
-                           FROM qd_kline_points
-                           WHERE market = ? AND symbol = ?
-                           AND time_sec >= ? AND time_sec <= ?
-                           ORDER BY time_sec ASC""",
-                        (market, symbol, start_ts, end_ts),
-                    )
-                    rows = cur.fetchall()
-                    cur.close()
-                return [_row_to_kline(r) for r in rows]
+                return _stream_points(
+                    _SELECT_POINTS_RANGE_LEGACY_SQL,
+                    (market, symbol, start_ts, end_ts),
+                    as_array,
+                )
             except Exception as e2:
                 logger.debug("Points DB range read (legacy) skipped: %s", e2)
         else:
             logger.debug("Points DB range read skipped: %s", e)
-        return []
+        return np.empty(0, dtype=KLINE_DTYPE) if as_array else []
+
+
+def _read_aggregated_points_from_db(
+    market: str,
+    symbol: str,
+    start_ts: int,
+    end_ts: int,
+    lower_sec: int,
+    interval_sec: int,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    库内把 lower_sec 层点位按 time_sec/interval_sec 分桶聚合，只回传聚合后的 K 线（1m->1H 传输量降 60 倍）。
+    open/close 取桶内按时间排序的首/尾值。查询失败返回 None，由调用方回退到 Python 聚合。
+    """
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                _SELECT_POINTS_AGGREGATED_SQL,
+                (interval_sec, interval_sec, market, symbol, lower_sec, start_ts, end_ts),
+            )
+            rows = cur.fetchall()
+            cur.close()
+        return rows
+    except Exception as e:
+        logger.debug("Points DB aggregated read skipped: %s", e)
+        return None
 
 
 def _read_points_range_prefer_1m_then_5m(
@@ -258,15 +501,49 @@ def _read_points_range_prefer_1m_then_5m(
     return _read_points_range_from_db(market, symbol, start_ts, end_ts, interval_sec=300)
 
 
+def _read_points_tail(market: str, symbol: str, interval_sec: int, n: int) -> List[Dict[str, Any]]:
+    """
+    qd_kline_points 该标的最新 n 根（按时间升序返回）。
+    实时请求用它代替「范围读 -> 不足再查 max(time_sec) -> 再范围读」的 2~3 次往返。
+    """
+    key = (market, symbol, interval_sec, "tail", n, _points_generation(market, symbol))
+    hit = _POINTS_READ_CACHE.get(key)
+    if hit is not _MISS:
+        return list(hit)
+    try:
+        out = _stream_points(_SELECT_POINTS_TAIL_SQL, (market, symbol, interval_sec, n))
+    except Exception as e:
+        out = []
+        if interval_sec == 60:
+            try:
+                out = _stream_points(_SELECT_POINTS_TAIL_LEGACY_SQL, (market, symbol, n))
+            except Exception as e2:
+                logger.debug("Points DB tail read (legacy) skipped: %s", e2)
+        else:
+            logger.debug("Points DB tail read skipped: %s", e)
+    out.reverse()
+    if out:
+        _POINTS_READ_CACHE.put(key, out)
+    return list(out)
+
+
 def _read_points_max_time(market: str, symbol: str) -> Optional[int]:
-    """qd_kline_points 该标的最大 time_sec（1m/5m 取最大）。"""
+    """qd_kline_points 该标的最大 time_sec（1m/5m 取最大）。短 TTL 缓存，写点后失效。"""
+    key = (market, symbol, _points_generation(market, symbol))
+    hit = _POINTS_MAX_TS_CACHE.get(key)
+    if hit is not _MISS:
+        return hit
+    out = _read_points_max_time_uncached(market, symbol)
+    if out is not None:
+        _POINTS_MAX_TS_CACHE.put(key, out)
+    return out
+
+
+def _read_points_max_time_uncached(market: str, symbol: str) -> Optional[int]:
     try:
         with get_db_connection() as db:
             cur = db.cursor()
-            cur.execute(
-                "SELECT max(time_sec) AS max_ts FROM qd_kline_points WHERE market = ? AND symbol = ?",
-                (market, symbol),
-            )
+            cur.execute(_SELECT_POINTS_MAX_TS_SQL, (market, symbol))
             row = cur.fetchone()
             cur.close()
         if row and row.get("max_ts") is not None:
@@ -277,89 +554,307 @@ def _read_points_max_time(market: str, symbol: str) -> Optional[int]:
         return None
 
 
+# 冲突时以源数据为准覆盖 OHLCV；值未变的行（重叠回填的已收盘 bar）跳过更新，不产生新行版本/WAL
+_UPSERT_POINTS_SQL = """INSERT INTO qd_kline_points
+    (market, symbol, time_sec, interval_sec, open_price, high_price, low_price, close_price, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (market, symbol, time_sec, interval_sec)
+    DO UPDATE SET
+      open_price = EXCLUDED.open_price,
+      high_price = EXCLUDED.high_price,
+      low_price = EXCLUDED.low_price,
+      close_price = EXCLUDED.close_price,
+      volume = EXCLUDED.volume
+    WHERE (qd_kline_points.open_price, qd_kline_points.high_price, qd_kline_points.low_price,
+           qd_kline_points.close_price, qd_kline_points.volume)
+      IS DISTINCT FROM
+          (EXCLUDED.open_price, EXCLUDED.high_price, EXCLUDED.low_price, EXCLUDED.close_price, EXCLUDED.volume)"""
+
+# 旧表结构（无 interval_sec 列）仅存 1m
+_UPSERT_POINTS_LEGACY_SQL = """INSERT INTO qd_kline_points
+    (market, symbol, time_sec, open_price, high_price, low_price, close_price, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (market, symbol, time_sec)
+    DO UPDATE SET open_price=EXCLUDED.open_price, high_price=EXCLUDED.high_price,
+      low_price=EXCLUDED.low_price, close_price=EXCLUDED.close_price,
+      volume=EXCLUDED.volume
+    WHERE (qd_kline_points.open_price, qd_kline_points.high_price, qd_kline_points.low_price,
+           qd_kline_points.close_price, qd_kline_points.volume)
+      IS DISTINCT FROM
+          (EXCLUDED.open_price, EXCLUDED.high_price, EXCLUDED.low_price, EXCLUDED.close_price, EXCLUDED.volume)"""
+
+
+# K线点位是可从交易所重拉的缓存：写事务内关闭同步提交，COMMIT 不再等 WAL 落盘。
+# 仅影响本事务；宕机最多丢失最近几百毫秒内已提交的写入，不会损坏数据（下次同步会补回）。
+_ASYNC_COMMIT_SQL = "SET LOCAL synchronous_commit TO OFF"
+
+# 单条写入语句 / 单次 executemany 的行数上限，超大回填分块发送，整体仍只提交一次
+WRITE_CHUNK = max(1, int(os.getenv("KLINE_WRITE_CHUNK", "500")))
+
+
+def _executemany_chunked(cur, sql: str, params: List[tuple]) -> None:
+    for i in range(0, len(params), WRITE_CHUNK):
+        cur.executemany(sql, params[i:i + WRITE_CHUNK])
+
+
+def _points_params(
+    market: str, symbol: str, klines: List[Dict[str, Any]], interval_sec: Optional[int]
+) -> tuple:
+    """一次遍历生成批量写入参数并记录时间边界。interval_sec=None 为旧表结构。返回 (params, min_ts, max_ts)。"""
+    params: List[tuple] = []
+    min_ts = max_ts = None
+    for k in klines:
+        t = k.get("time")
+        if t is None:
+            continue
+        t = int(t)
+        if min_ts is None or t < min_ts:
+            min_ts = t
+        if max_ts is None or t > max_ts:
+            max_ts = t
+        ohlcv = (
+            float(k.get("open", 0)), float(k.get("high", 0)),
+            float(k.get("low", 0)), float(k.get("close", 0)), float(k.get("volume", 0)),
+        )
+        if interval_sec is None:
+            params.append((market, symbol, t) + ohlcv)
+        else:
+            params.append((market, symbol, t, interval_sec) + ohlcv)
+    return params, min_ts, max_ts
+
+
+# 单语句批量 upsert：整块 K 线序列化为一个 JSON 参数，由 json_to_recordset 在库内展开
+# （以 WITH 开头，db 封装不会追加 RETURNING id）
+_BULK_UPSERT_POINTS_SQL = """WITH src AS (
+    SELECT r.t, r.o, r.h, r.l, r.c, r.v
+    FROM json_to_recordset(?::json) AS r(t BIGINT, o FLOAT8, h FLOAT8, l FLOAT8, c FLOAT8, v FLOAT8)
+)
+INSERT INTO qd_kline_points
+    (market, symbol, time_sec, interval_sec, open_price, high_price, low_price, close_price, volume)
+SELECT ?, ?, t, ?, o, h, l, c, v FROM src
+ON CONFLICT (market, symbol, time_sec, interval_sec)
+DO UPDATE SET
+  open_price = EXCLUDED.open_price,
+  high_price = EXCLUDED.high_price,
+  low_price = EXCLUDED.low_price,
+  close_price = EXCLUDED.close_price,
+  volume = EXCLUDED.volume
+WHERE (qd_kline_points.open_price, qd_kline_points.high_price, qd_kline_points.low_price,
+       qd_kline_points.close_price, qd_kline_points.volume)
+  IS DISTINCT FROM
+      (EXCLUDED.open_price, EXCLUDED.high_price, EXCLUDED.low_price, EXCLUDED.close_price, EXCLUDED.volume)"""
+
+
+def _bulk_upsert_points(cur, market: str, symbol: str, interval_sec: int, params: List[tuple]) -> None:
+    """按 WRITE_CHUNK 行一条语句写入；同一 time 只保留最后一根（单条 ON CONFLICT 语句不能二次更新同一行）。"""
+    latest = {p[2]: p[4:] for p in params}
+    rows = [
+        {"t": t, "o": o, "h": h, "l": l, "c": c, "v": v}
+        for t, (o, h, l, c, v) in latest.items()
+    ]
+    for i in range(0, len(rows), WRITE_CHUNK):
+        cur.execute(
+            _BULK_UPSERT_POINTS_SQL,
+            (json.dumps(rows[i:i + WRITE_CHUNK]), market, symbol, interval_sec),
+        )
+
+
 def _write_points_to_db(
     market: str,
     symbol: str,
     klines: List[Dict[str, Any]],
     interval_sec: int = 60,
 ) -> None:
-    """写入 qd_kline_points，冲突覆盖。interval_sec 60=1m, 300=5m。"""
+    """写入 qd_kline_points，冲突覆盖。interval_sec 60=1m, 300=5m。JSON 批量单语句写入（失败回退分块 executemany），单事务提交。"""
     if not klines:
         return
     try:
+        params, min_ts, max_ts = _points_params(market, symbol, klines, interval_sec)
         with get_db_connection() as db:
             cur = db.cursor()
-            for k in klines:
-                t = k.get("time")
-                if t is None:
-                    continue
-                cur.execute(
-                    """INSERT INTO qd_kline_points
-                       (market, symbol, time_sec, interval_sec, open_price, high_price, low_price, close_price, volume)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                       ON CONFLICT (market, symbol, time_sec, interval_sec)
-                       DO UPDATE SET
-                         open_price = EXCLUDED.open_price,
-                         high_price = EXCLUDED.high_price,
-                         low_price = EXCLUDED.low_price,
-                         close_price = EXCLUDED.close_price,
-                         volume = EXCLUDED.volume,
-                         created_at = NOW()
-                       RETURNING time_sec""",
-                    (
-                        market, symbol, int(t), interval_sec,
-                        float(k.get("open", 0)), float(k.get("high", 0)),
-                        float(k.get("low", 0)), float(k.get("close", 0)), float(k.get("volume", 0)),
-                    ),
-                )
+            cur.execute(_ASYNC_COMMIT_SQL)
+            try:
+                _bulk_upsert_points(cur, market, symbol, interval_sec, params)
+            except Exception as bulk_err:
+                # 例如含 NaN（JSON 不接受）：回滚后逐行参数 executemany 兜底
+                logger.debug("Kline points bulk upsert fallback: %s %s %s", market, symbol, bulk_err)
+                db.rollback()
+                cur.execute(_ASYNC_COMMIT_SQL)
+                _executemany_chunked(cur, _UPSERT_POINTS_SQL, params)
             db.commit()
             cur.close()
+        # 提交后再推进代数：提交前读到旧行的读者只能缓存在旧代数下，随即失效
+        _bump_points_generation(market, symbol)
         logger.info("Kline points write: %s %s interval_sec=%d count=%d", market, symbol, interval_sec, len(klines))
-        _auto_update_range(market, symbol, klines, interval_sec)
+        if min_ts is not None:
+            _update_range(market, symbol, interval_sec, min_ts, max_ts)
     except Exception as e:
         if interval_sec == 60:
             try:
+                params, min_ts, max_ts = _points_params(market, symbol, klines, None)
                 with get_db_connection() as db:
                     cur = db.cursor()
-                    for k in klines:
-                        t = k.get("time")
-                        if t is None:
-                            continue
-                        cur.execute(
-                            """INSERT INTO qd_kline_points
-                               (market, symbol, time_sec, open_price, high_price, low_price, close_price, volume)
-                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                               ON CONFLICT (market, symbol, time_sec)
-                               DO UPDATE SET open_price=EXCLUDED.open_price, high_price=EXCLUDED.high_price,
-                                 low_price=EXCLUDED.low_price, close_price=EXCLUDED.close_price,
-                                 volume=EXCLUDED.volume, created_at=NOW()
-                               RETURNING time_sec""",
-                            (
-                                market, symbol, int(t),
-                                float(k.get("open", 0)), float(k.get("high", 0)),
-                                float(k.get("low", 0)), float(k.get("close", 0)), float(k.get("volume", 0)),
-                            ),
-                        )
+                    cur.execute(_ASYNC_COMMIT_SQL)
+                    _executemany_chunked(cur, _UPSERT_POINTS_LEGACY_SQL, params)
                     db.commit()
                     cur.close()
+                _bump_points_generation(market, symbol)
                 logger.info("Kline points write (legacy): %s %s count=%d", market, symbol, len(klines))
-                _auto_update_range(market, symbol, klines, interval_sec)
+                if min_ts is not None:
+                    _update_range(market, symbol, interval_sec, min_ts, max_ts)
                 return
             except Exception:
                 pass
         logger.warning("Kline points write failed: %s", e)
 
 
-def _auto_update_range(market: str, symbol: str, klines: List[Dict[str, Any]], interval_sec: int) -> None:
-    ts_list = [int(k["time"]) for k in klines if k.get("time") is not None]
-    if ts_list:
-        _update_range(market, symbol, interval_sec, min(ts_list), max(ts_list))
+# 多标的批量写入：按列绑定为数组（每列一个参数），库内 unnest 还原成行，一条语句覆盖整批标的
+_UNNEST_UPSERT_POINTS_SQL = """WITH src AS (
+    SELECT * FROM unnest(?::text[], ?::text[], ?::bigint[], ?::int[],
+                         ?::float8[], ?::float8[], ?::float8[], ?::float8[], ?::float8[])
+        AS u(m, s, t, iv, o, h, l, c, v)
+)
+INSERT INTO qd_kline_points
+    (market, symbol, time_sec, interval_sec, open_price, high_price, low_price, close_price, volume)
+SELECT m, s, t, iv, o, h, l, c, v FROM src
+ON CONFLICT (market, symbol, time_sec, interval_sec)
+DO UPDATE SET
+  open_price = EXCLUDED.open_price,
+  high_price = EXCLUDED.high_price,
+  low_price = EXCLUDED.low_price,
+  close_price = EXCLUDED.close_price,
+  volume = EXCLUDED.volume
+WHERE (qd_kline_points.open_price, qd_kline_points.high_price, qd_kline_points.low_price,
+       qd_kline_points.close_price, qd_kline_points.volume)
+  IS DISTINCT FROM
+      (EXCLUDED.open_price, EXCLUDED.high_price, EXCLUDED.low_price, EXCLUDED.close_price, EXCLUDED.volume)"""
+
+
+def _dedup_point_rows(batches: List[tuple]) -> tuple:
+    """
+    多标的 K 线去重展平：返回 (rows, bounds)。
+    rows 为 (market, symbol, time, interval_sec, o, h, l, c, v)，同键保留最后一根（单条 ON CONFLICT 不能二次更新同一行）；
+    bounds 为 (market, symbol, interval_sec) -> [min_ts, max_ts]。写入时按块 zip 转置为列数组。
+    """
+    latest: Dict[tuple, tuple] = {}
+    bounds: Dict[tuple, List[int]] = {}
+    for market, symbol, klines, interval_sec in batches:
+        b = None
+        for k in klines:
+            t = k.get("time")
+            if t is None:
+                continue
+            t = int(t)
+            latest[(market, symbol, t, interval_sec)] = (
+                float(k.get("open", 0)), float(k.get("high", 0)),
+                float(k.get("low", 0)), float(k.get("close", 0)), float(k.get("volume", 0)),
+            )
+            if b is None:
+                b = bounds.setdefault((market, symbol, interval_sec), [t, t])
+            if t < b[0]:
+                b[0] = t
+            elif t > b[1]:
+                b[1] = t
+    rows = [key + ohlcv for key, ohlcv in latest.items()]
+    return rows, bounds
+
+
+def _write_points_many(batches: List[tuple]) -> None:
+    """
+    多个 (market, symbol, klines, interval_sec) 共用一个连接、单事务写入：
+    每 WRITE_CHUNK 行一条 unnest 语句（9 个列数组参数），批量失败回退为逐标的 _write_points_to_db。
+    """
+    batches = [b for b in batches if b[2]]
+    if not batches:
+        return
+    rows, bounds = _dedup_point_rows(batches)
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(_ASYNC_COMMIT_SQL)
+            for i in range(0, len(rows), WRITE_CHUNK):
+                cur.execute(_UNNEST_UPSERT_POINTS_SQL, [list(col) for col in zip(*rows[i:i + WRITE_CHUNK])])
+            db.commit()
+            cur.close()
+    except Exception as e:
+        logger.debug("Kline points batch write fallback (%d symbols): %s", len(batches), e)
+        for market, symbol, klines, interval_sec in batches:
+            _write_points_to_db(market, symbol, klines, interval_sec=interval_sec)
+        return
+    for market, symbol in {key[:2] for key in bounds}:
+        _bump_points_generation(market, symbol)
+    logger.info("Kline points batch write: %d symbols, %d rows", len(bounds), len(rows))
+    for (market, symbol, interval_sec), (min_ts, max_ts) in bounds.items():
+        _update_range(market, symbol, interval_sec, min_ts, max_ts)
+
+
+def _slice_tail(pts: List[Dict[str, Any]], lim: int, before_ts: Optional[int]) -> List[Dict[str, Any]]:
+    """取 before_ts 之前（不含）的最后 lim 根。
+
+    约定 pts 已按 time 升序：库读均为 ORDER BY time_sec ASC，合并/聚合结果也按时间有序产出，
+    此处不再重复排序，before_ts 截断点用二分查找定位。
+    """
+    if before_ts is not None:
+        end = bisect_left(pts, before_ts, key=_bytime)
+        return pts[max(0, end - lim):end]
+    return pts[-lim:] if len(pts) > lim else pts
+
+
+def _merge_by_time(
+    base: List[Dict[str, Any]],
+    extra: List[Dict[str, Any]],
+    extra_wins: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    按 time 合并两段 K 线并去重。base 为读库结果（升序无重复），extra 为拉网结果（通常升序）。
+    time 重复时 extra_wins=True 取 extra 中最后一根，否则保留 base（base 无该点时取 extra 中第一根）。
+    extra 整体接在 base 之后（补尾巴的常见情形）时直接追加，否则 heapq.merge 归并，均不做整体排序。
+    """
+    if extra and not all(a["time"] <= b["time"] for a, b in pairwise(extra)):
+        extra = sorted(extra, key=_bytime)
+    if not base or not extra or extra[0]["time"] > base[-1]["time"]:
+        out = list(base)
+        src = extra
+    else:
+        out = []
+        # heapq.merge 稳定：同 time 时 base 的元素先出
+        src = heapq.merge(base, extra, key=_bytime)
+    last_t = out[-1]["time"] if out else None
+    for b in src:
+        t = b["time"]
+        if t == last_t:
+            if extra_wins:
+                out[-1] = b
+            continue
+        out.append(b)
+        last_t = t
+    return out
+
+
+def _older_part(page: List[Dict[str, Any]], before_ts: int) -> List[Dict[str, Any]]:
+    """分页拉取的一页按 time 升序截取早于 before_ts 的部分，使新→旧各页互不重叠。"""
+    if not all(a["time"] <= b["time"] for a, b in pairwise(page)):
+        page = sorted(page, key=_bytime)
+    return page[:bisect_left(page, before_ts, key=_bytime)]
+
+
+def _stitch_pages(pages: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """新→旧顺序收集的互不重叠升序页，按旧→新拼接即整体升序，无需整体排序。"""
+    return [b for page in reversed(pages) for b in page]
 
 
 # 分页拉取单页大小与轮间延时（防限流）
 PAGINATE_CHUNK = 1000
 PAGINATE_DELAY_SEC = 1.0
 PAGINATE_MAX_ROUNDS = 15
+# 每批并发在途页数：1m 页锚点可按分钟网格预推（before_time 依次前移 PAGINATE_CHUNK 分钟），
+# 仅对允许并发请求的源开启；未登记市场保持逐页串行
+PAGINATE_CONCURRENCY: Dict[str, int] = {"Crypto": 4}
+
+
+# 无 1m 数据的品种负缓存（只提供粗粒度数据的源）：TTL 内跳过注定失败的 1m 探测，省一次网络往返
+NO_1M_CACHE_TTL = 300
+_NO_1M = _TtlLru(10000, NO_1M_CACHE_TTL)
 
 
 def _fetch_1m_or_fallback_5m(
@@ -368,10 +863,17 @@ def _fetch_1m_or_fallback_5m(
     limit: int,
     before_time: Optional[int] = None,
 ) -> tuple:
-    """拉网：先 1m，无则 5m。返回 (klines, '1m'|'5m')。"""
-    data = DataSourceFactory.get_kline(market, symbol, "1m", limit, before_time=before_time)
-    if data and len(data) >= min(10, limit):
-        return data, "1m"
+    """拉网：先 1m，无则 5m。返回 (klines, '1m'|'5m')。近期探测过无 1m 的品种直接拉 5m。"""
+    key = (market, symbol)
+    data = None
+    if _NO_1M.get(key) is _MISS:
+        data = DataSourceFactory.get_kline(market, symbol, "1m", limit, before_time=before_time)
+        if data and len(data) >= min(10, limit):
+            return data, "1m"
+        if not data and before_time is None:
+            # 只由实时探测记录完全无 1m 的情况：历史页为空可能只是超出源的 1m 保留期/早于上市，
+            # 不能据此让实时请求改走 5m；条数偏少（如请求窗口贴近上市时间）也不算
+            _NO_1M.put(key, True)
     data5 = DataSourceFactory.get_kline(
         market, symbol, "5m", limit=min(limit, 200), before_time=before_time
     )
@@ -388,333 +890,288 @@ def _fetch_1m_paginated(
     max_bars: int,
     delay_sec: float = PAGINATE_DELAY_SEC,
 ) -> tuple:
-    """分页拉 1m（或回退 5m），每次最多 PAGINATE_CHUNK 根，轮间延时防限流。返回 (merged_klines, '1m'|'5m')。"""
-    by_time: Dict[int, Dict] = {}
+    """
+    分页拉 1m（或回退 5m），每次最多 PAGINATE_CHUNK 根，批间延时防限流。返回 (merged_klines, '1m'|'5m')。
+    首页串行（确认 1m 可用）；之后按 PAGINATE_CONCURRENCY 一批并发拉取预推锚点的若干页，
+    按新→旧顺序消费，遇空页或到达 need_start_ts 即停，多拉/接不上的页直接丢弃；
+    休市缺口导致的页重叠在收页时截掉（每页只留早于已收区间的部分），最终拼接即有序。
+    周期以首页为准：之后某页周期不同（如回退到 5m）即丢弃该页并停止，结果只含同一周期的 K 线。
+    """
+    kept: List[List[Dict[str, Any]]] = []
+    total = 0
     next_before = need_end_ts + 60
-    eff_tf = "1m"
-    for r in range(PAGINATE_MAX_ROUNDS):
-        chunk_limit = min(PAGINATE_CHUNK, max_bars - len(by_time))
-        if chunk_limit <= 0:
-            break
-        fetched, eff_tf = _fetch_1m_or_fallback_5m(
-            market, symbol, chunk_limit, before_time=next_before
-        )
-        if not fetched:
-            break
-        for b in fetched:
-            by_time[b["time"]] = b
-        min_ts = min(b["time"] for b in fetched)
-        if min_ts <= need_start_ts:
-            break
-        next_before = min_ts
-        if r < PAGINATE_MAX_ROUNDS - 1:
-            time.sleep(delay_sec)
-    merged = sorted(by_time.values(), key=lambda x: x["time"])
-    return merged, eff_tf
+    eff_tf: Optional[str] = None
+    width_max = max(1, PAGINATE_CONCURRENCY.get(market, 1))
+    rounds = 0
+    with ThreadPoolExecutor(max_workers=width_max) as pool:
+        while rounds < PAGINATE_MAX_ROUNDS:
+            remaining = max_bars - total
+            chunk_limit = min(PAGINATE_CHUNK, remaining)
+            if chunk_limit <= 0:
+                break
+            width = 1
+            if rounds > 0 and eff_tf == "1m":
+                pages_left = -(-remaining // PAGINATE_CHUNK)
+                width = min(width_max, pages_left, PAGINATE_MAX_ROUNDS - rounds)
+            anchors = [next_before - k * PAGINATE_CHUNK * 60 for k in range(width)]
+            pages = pool.map(
+                lambda bt: _fetch_1m_or_fallback_5m(market, symbol, chunk_limit, before_time=bt),
+                anchors,
+            )
+            rounds += width
+            done = False
+            for k, (fetched, page_tf) in enumerate(pages):
+                if eff_tf is None:
+                    eff_tf = page_tf
+                elif page_tf != eff_tf:
+                    done = True
+                    break
+                page = _older_part(fetched, next_before) if fetched else fetched
+                if not page:
+                    done = True
+                    break
+                kept.append(page)
+                total += len(page)
+                min_ts = page[0]["time"]
+                if min_ts <= need_start_ts:
+                    done = True
+                    break
+                next_before = min_ts
+                # 源单页上限小于 chunk_limit 时本页够不到下一锚点，后续预取页会留洞，丢弃后从 min_ts 续拉
+                if k + 1 < width and min_ts > anchors[k + 1]:
+                    break
+            if done:
+                break
+            if rounds < PAGINATE_MAX_ROUNDS:
+                time.sleep(delay_sec)
+    return _stitch_pages(kept), eff_tf or "1m"
 
 
-def get_kline(
+# 实时请求（before_time=None）结果的进程内短缓存：同一图表多人/高频刷新时摊薄读库与补尾巴开销
+RESPONSE_CACHE_MAX = 512
+RESPONSE_CACHE_TTL_CAP = 30
+_RESPONSE_CACHE = _TtlLru(RESPONSE_CACHE_MAX, RESPONSE_CACHE_TTL_CAP)
+
+
+def clear_kline_caches() -> None:
+    """清空进程内 K 线结果/读库缓存（测试/运维用）。"""
+    for c in (_RESPONSE_CACHE, _POINTS_READ_CACHE, _POINTS_CLOSED_CACHE, _POINTS_MAX_TS_CACHE, _NO_1M):
+        c.clear()
+
+
+# 低层级探测并发度：各层读库互不依赖，同时发出后按 LOWER_LEVELS 顺序取第一个够数的层
+# （每个在途探测占用一个连接池连接；设为 1 退回逐层串行）
+LOWER_PROBE_WORKERS = max(1, int(os.getenv("KLINE_LOWER_PROBE_WORKERS", "4")))
+_PROBE_POOL = ThreadPoolExecutor(max_workers=LOWER_PROBE_WORKERS, thread_name_prefix="kline-probe")
+
+
+def _probe_lower_tier(
+    market: str, symbol: str, start_ts: int, end_ts: int, lower_sec: int, interval_sec: int
+) -> List[Dict[str, Any]]:
+    """读 lower_sec 层 [start_ts, end_ts] 并聚合到 interval_sec。"""
+    agg = _read_aggregated_points_from_db(market, symbol, start_ts, end_ts, lower_sec, interval_sec)
+    if agg is None:
+        # 库内聚合不可用：按列式数组读回原始点位在本地归约，只把聚合结果转成 dict
+        from_lower = _read_points_range_uncached(market, symbol, start_ts, end_ts, lower_sec, as_array=True)
+        agg = _array_to_bars(_aggregate_array(from_lower, interval_sec))
+    return agg
+
+
+def _probe_lower_tiers(
     market: str,
     symbol: str,
-    timeframe: str,
-    limit: int = 1000,
-    before_time: Optional[int] = None,
-) -> List[Dict[str, Any]]:
+    start_ts: int,
+    end_ts: int,
+    interval_sec: int,
+    tiers: tuple,
+    limit: int,
+) -> Optional[tuple]:
+    """tiers 为 ((lower_tf, lower_sec), ...)；按顺序返回第一个聚合后 >= limit 根的 (lower_tf, agg)，都不够返回 None。"""
+    if LOWER_PROBE_WORKERS <= 1 or len(tiers) <= 1:
+        for tf, sec in tiers:
+            agg = _probe_lower_tier(market, symbol, start_ts, end_ts, sec, interval_sec)
+            if agg and len(agg) >= limit:
+                return tf, agg
+        return None
+    futs = [
+        _PROBE_POOL.submit(_probe_lower_tier, market, symbol, start_ts, end_ts, sec, interval_sec)
+        for _, sec in tiers
+    ]
+    try:
+        for (tf, _), fut in zip(tiers, futs):
+            agg = fut.result()
+            if agg and len(agg) >= limit:
+                return tf, agg
+        return None
+    finally:
+        # 已命中时取消尚未开始的探测
+        for fut in futs:
+            fut.cancel()
+
+
+def _edge_gaps(
+    first_ex: int,
+    last_ex: int,
+    need_start_ts: int,
+    need_end_ts: int,
+    interval_sec: int,
+    limit: int,
+) -> tuple:
     """
-    获取K线唯一入口。只存点：优先读库（1m点->5m点），不够则拉网写点，再按周期聚合返回前端K线格式。
+    需求网格 need_start_ts + i*interval_sec（i < limit 且不超过 need_end_ts）相对库内 [first_ex, last_ex]
+    的缺口只会落在两端：直接由端点算出 (gap_before, gap_after) 根数，O(1)，不枚举网格点、不建集合。
     """
-    interval_sec = TIMEFRAME_SECONDS.get(timeframe, 86400)
-    now_sec = int(time.time())
+    if need_end_ts < need_start_ts:
+        return 0, 0
+    n_needed = min(limit, (need_end_ts - need_start_ts) // interval_sec + 1)
+    gap_before = min(n_needed, max(0, -((need_start_ts - first_ex) // interval_sec)))
+    gap_after = n_needed - min(n_needed, max(0, (last_ex - need_start_ts) // interval_sec + 1))
+    return gap_before, gap_after
+
+
+def _need_window(
+    market: str, interval_sec: int, limit: int, before_time: Optional[int], now_sec: int
+) -> tuple:
+    """请求覆盖的时间窗 (need_start_ts, need_end_ts)。"""
     span_sec = int(
         limit
         * interval_sec
         * _range_window_seconds_multiplier(market, interval_sec)
     )
     if before_time is not None:
-        need_end_ts = before_time - interval_sec
-        need_start_ts = before_time - span_sec
-    else:
-        need_end_ts = now_sec
-        need_start_ts = now_sec - span_sec
-
-    if timeframe == '1m':
-        # 1m: 0) 范围命中 1) 条数命中 2) 增量尾巴 3) fallback
-
-        def _slice_1m(pts: List[Dict], lim: int, bt: Optional[int]) -> List[Dict]:
-            pts = sorted(pts, key=lambda x: x['time'])
-            if bt is not None:
-                return [b for b in pts if b['time'] < bt][-lim:]
-            return pts[-lim:] if len(pts) > lim else pts
-
-        # 0) 范围命中检查
-        stored_1m = _get_range(market, symbol, 60)
-        gap_1m = _get_max_gap(market, 60)
-        if stored_1m:
-            sr_min, sr_max = stored_1m
-            if sr_min <= need_start_ts + gap_1m and sr_max >= need_end_ts - gap_1m:
-                from_points = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec=60)
-                if from_points:
-                    # 实时场景：范围命中但数据可能不够新，检查是否需要拉增量尾巴
-                    if _is_realtime_request(before_time, now_sec, interval_sec) and from_points:
-                        max_ts_db = max(b['time'] for b in from_points)
-                        if (now_sec - max_ts_db) > 600:
-                            tail_limit = min((now_sec - max_ts_db) // interval_sec + 20, 2000)
-                            fetched_tail, eff_tf = _fetch_1m_or_fallback_5m(
-                                market, symbol, tail_limit, before_time=now_sec + interval_sec
-                            )
-                            if fetched_tail and eff_tf == "1m":
-                                by_time = {b["time"]: b for b in from_points}
-                                for b in fetched_tail:
-                                    by_time[b["time"]] = b
-                                merged = sorted(by_time.values(), key=lambda x: x["time"])
-                                _write_points_to_db(market, symbol, fetched_tail, interval_sec=60)
-                                logger.info("Kline range hit + tail: %s %s 1m count=%d", market, symbol, len(merged))
-                                return _slice_1m(merged, limit, before_time)
-                    result = _slice_1m(from_points, limit, before_time)
-                    logger.info("Kline range hit 1m: %s %s count=%d", market, symbol, len(result))
-                    return result
-                return []
+        return before_time - span_sec, before_time - interval_sec
+    return now_sec - span_sec, now_sec
 
-        # 1) 条数命中（兼容旧数据无 range 记录）
-        from_points = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec=60)
-        is_realtime = _is_realtime_request(before_time, now_sec, interval_sec)
-        if len(from_points) < limit and is_realtime:
-            max_ts = _read_points_max_time(market, symbol)
-            if max_ts is not None and max_ts < need_end_ts:
-                tail_start = max_ts - (limit * interval_sec)
-                from_points = _read_points_range_from_db(
-                    market, symbol, tail_start, max_ts, interval_sec=60
-                )
-        if len(from_points) >= limit:
-            merged = sorted(from_points, key=lambda x: x['time'])
-            if before_time is not None:
-                result = [b for b in merged if b['time'] < before_time][-limit:]
-            else:
-                result = merged[-limit:] if len(merged) > limit else merged
-            last_bar_fresh = result and (now_sec - result[-1]['time']) <= interval_sec * 2
-            # 非实时或尾部数据已新鲜则直接返回；否则走步骤 2 补尾巴
-            if len(result) >= limit and (not is_realtime or last_bar_fresh):
-                logger.info("Kline from points 1m: %s %s count=%d", market, symbol, len(result))
-                return result
 
-        # 2) 增量尾巴
-        from_db = from_points
-        need_tail = (
-            is_realtime
-            and len(from_db) > 0
-            and (len(from_db) < limit or (now_sec - max(b['time'] for b in from_db)) > 600)
-        )
-        if need_tail:
-            max_ts_db = max(b['time'] for b in from_db)
-            tail_bars = (need_end_ts - max_ts_db) // interval_sec
-            if tail_bars > 0:
-                fetch_limit = min(tail_bars + 20, max(limit * 2, 50000))
-                if fetch_limit > PAGINATE_CHUNK:
-                    fetched_tail, eff_tf = _fetch_1m_paginated(
-                        market, symbol, need_start_ts, need_end_ts, fetch_limit
-                    )
-                else:
-                    fetched_tail, eff_tf = _fetch_1m_or_fallback_5m(
-                        market, symbol, fetch_limit, before_time=need_end_ts + interval_sec
-                    )
-                if fetched_tail:
-                    if eff_tf == "1m":
-                        by_time = {b["time"]: b for b in from_db}
-                        for b in fetched_tail:
-                            if b["time"] not in by_time:
-                                by_time[b["time"]] = b
-                        merged = sorted(by_time.values(), key=lambda x: x["time"])
-                        result = merged[-limit:] if len(merged) > limit else merged
-                        _write_points_to_db(market, symbol, merged, interval_sec=60)
-                        logger.info("Kline points incremental: %s %s fetched=%d total=%d", market, symbol, len(fetched_tail), len(result))
-                        return result
-                    _write_points_to_db(market, symbol, fetched_tail, interval_sec=300)
-                    result = fetched_tail[-limit:] if len(fetched_tail) > limit else fetched_tail
-                    logger.info("Kline 1m fallback 5m: %s %s count=%d", market, symbol, len(result))
-                    return result
-                # 3) 拉网失败但有本地数据 -> fallback
-                if from_db:
-                    logger.warning("Kline 1m tail fetch failed, fallback to local: %s %s count=%d", market, symbol, len(from_db))
-                    return _slice_1m(from_db, limit, before_time)
-    else:
-        # 非 1m：1) 范围命中 2) 同周期条数 3) 低层级换算 4) 拉网 5) fallback
-        def _slice(merged: List[Dict], lim: int, before_ts: Optional[int]) -> List[Dict]:
-            merged = sorted(merged, key=lambda x: x["time"])
-            if before_ts is not None:
-                return [b for b in merged if b["time"] < before_ts][-lim:]
-            return merged[-lim:] if len(merged) > lim else merged
-
-        # 1) 范围命中检查
-        stored = _get_range(market, symbol, interval_sec)
-        gap = _get_max_gap(market, interval_sec)
-        if stored:
-            sr_min, sr_max = stored
-            if sr_min <= need_start_ts + gap and sr_max >= need_end_ts - gap:
-                from_same = _read_points_range_from_db(
-                    market, symbol, need_start_ts, need_end_ts, interval_sec=interval_sec
-                )
-                if from_same:
-                    # 实时场景：范围命中但数据可能过期，补充增量尾巴（1m 有同样逻辑，非 1m 此前缺失）
-                    if _is_realtime_request(before_time, now_sec, interval_sec) and len(from_same) > 0:
-                        max_ts_db = max(b["time"] for b in from_same)
-                        stale_threshold = interval_sec * 2  # 1D=2天、1H=2小时
-                        if (now_sec - max_ts_db) > stale_threshold:
-                            tail_limit = min(
-                                (now_sec - max_ts_db) // interval_sec + 5,
-                                min(limit, PAGINATE_CHUNK),
-                            )
-                            try:
-                                tail_part = DataSourceFactory.get_kline(
-                                    market, symbol, timeframe, max(10, tail_limit), before_time=now_sec + interval_sec
-                                )
-                                if tail_part:
-                                    by_time = {b["time"]: b for b in from_same}
-                                    for b in tail_part:
-                                        by_time[b["time"]] = b
-                                    merged = sorted(by_time.values(), key=lambda x: x["time"])
-                                    _write_points_to_db(market, symbol, tail_part, interval_sec=interval_sec)
-                                    result = _slice(merged, limit, before_time)
-                                    logger.info("Kline range hit + tail: %s %s %s count=%d", market, symbol, timeframe, len(result))
-                                    return result
-                            except Exception as e:
-                                logger.debug("Kline tail fetch failed (using cached): %s %s %s %s", market, symbol, timeframe, e)
-                    result = _slice(from_same, limit, before_time)
-                    logger.info("Kline range hit: %s %s %s count=%d", market, symbol, timeframe, len(result))
-                    return result
-                return []
+def _get_kline_1m(
+    market: str,
+    symbol: str,
+    limit: int = 1000,
+    before_time: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """1m：0) 范围命中 1) 条数命中 2) 增量尾巴 3) fallback 4) 拉网补缺或首次。"""
+    interval_sec = 60
+    now_sec = int(time.time())
+    need_start_ts, need_end_ts = _need_window(market, interval_sec, limit, before_time, now_sec)
 
-        # 2) 同周期条数（兼容旧数据尚无 range 记录的情况）
-        from_same = _read_points_range_from_db(
-            market, symbol, need_start_ts, need_end_ts, interval_sec=interval_sec
-        )
-        if len(from_same) >= limit:
-            # 实时场景：数据可能过期，补充增量尾巴
-            if _is_realtime_request(before_time, now_sec, interval_sec) and len(from_same) > 0:
-                max_ts_db = max(b["time"] for b in from_same)
-                stale_threshold = interval_sec * 2
-                if (now_sec - max_ts_db) > stale_threshold:
-                    try:
-                        tail_limit = min((now_sec - max_ts_db) // interval_sec + 5, min(limit, PAGINATE_CHUNK))
-                        tail_part = DataSourceFactory.get_kline(
-                            market, symbol, timeframe, max(10, tail_limit), before_time=now_sec + interval_sec
+    # 0) 范围命中检查
+    stored_1m = _get_range(market, symbol, 60)
+    gap_1m = _get_max_gap(market, 60)
+    if stored_1m:
+        sr_min, sr_max = stored_1m
+        if sr_min <= need_start_ts + gap_1m and sr_max >= need_end_ts - gap_1m:
+            from_points = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec=60)
+            if from_points:
+                # 实时场景：范围命中但数据可能不够新，检查是否需要拉增量尾巴
+                if _is_realtime_request(before_time, now_sec, interval_sec) and from_points:
+                    max_ts_db = from_points[-1]['time']  # 读库按 time_sec 升序
+                    if (now_sec - max_ts_db) > 600:
+                        tail_limit = min((now_sec - max_ts_db) // interval_sec + 20, 2000)
+                        fetched_tail, eff_tf = _fetch_1m_or_fallback_5m(
+                            market, symbol, tail_limit, before_time=now_sec + interval_sec
                         )
-                        if tail_part:
-                            by_time = {b["time"]: b for b in from_same}
-                            for b in tail_part:
-                                by_time[b["time"]] = b
-                            merged = sorted(by_time.values(), key=lambda x: x["time"])
-                            _write_points_to_db(market, symbol, tail_part, interval_sec=interval_sec)
-                            result = _slice(merged, limit, before_time)
-                            logger.info("Kline same layer + tail: %s %s %s count=%d", market, symbol, timeframe, len(result))
-                            return result
-                    except Exception as e:
-                        logger.debug("Kline tail fetch failed (using cached): %s %s %s %s", market, symbol, timeframe, e)
-            result = _slice(from_same, limit, before_time)
-            logger.info("Kline from same layer: %s %s %s count=%d", market, symbol, timeframe, len(result))
-            return result
+                        if fetched_tail and eff_tf == "1m":
+                            merged = _merge_by_time(from_points, fetched_tail)
+                            _write_points_to_db(market, symbol, fetched_tail, interval_sec=60)
+                            logger.info("Kline range hit + tail: %s %s 1m count=%d", market, symbol, len(merged))
+                            return _slice_tail(merged, limit, before_time)
+                result = _slice_tail(from_points, limit, before_time)
+                logger.info("Kline range hit 1m: %s %s count=%d", market, symbol, len(result))
+                return result
+            return []
 
-        # 3) 低层级换算
-        for lower_tf in LOWER_LEVELS.get(timeframe, []):
-            lower_sec = TIMEFRAME_SECONDS.get(lower_tf, 60)
-            from_lower = _read_points_range_from_db(
-                market, symbol, need_start_ts, need_end_ts, interval_sec=lower_sec
+    # 1) 条数命中（兼容旧数据无 range 记录）
+    is_realtime = _is_realtime_request(before_time, now_sec, interval_sec)
+    if before_time is None:
+        # 最新图表：一次倒序 LIMIT 取库内最新 limit 根，无需再查 max(time_sec)
+        from_points = _read_points_tail(market, symbol, 60, limit)
+    else:
+        from_points = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec=60)
+    if before_time is not None and len(from_points) < limit and is_realtime:
+        max_ts = _read_points_max_time(market, symbol)
+        if max_ts is not None and max_ts < need_end_ts:
+            tail_start = max_ts - (limit * interval_sec)
+            from_points = _read_points_range_from_db(
+                market, symbol, tail_start, max_ts, interval_sec=60
             )
-            if not from_lower:
-                continue
-            agg = _aggregate_bars(from_lower, interval_sec)
-            if len(agg) >= limit:
-                result = _slice(agg, limit, before_time)
-                logger.info("Kline from lower layer: %s %s %s from %s count=%d", market, symbol, timeframe, lower_tf, len(result))
+    if len(from_points) >= limit:
+        result = _slice_tail(from_points, limit, before_time)
+        last_bar_fresh = result and (now_sec - result[-1]['time']) <= interval_sec * 2
+        # 非实时或尾部数据已新鲜则直接返回；否则走步骤 2 补尾巴
+        if len(result) >= limit and (not is_realtime or last_bar_fresh):
+            logger.info("Kline from points 1m: %s %s count=%d", market, symbol, len(result))
+            return result
+
+    # 2) 增量尾巴
+    from_db = from_points
+    # 读库按 time_sec 升序，末条即最大时间，免去对大列表的两次线性扫描
+    max_ts_db = from_db[-1]['time'] if from_db else None
+    db_stale = max_ts_db is not None and (now_sec - max_ts_db) > 600
+    need_tail = is_realtime and max_ts_db is not None and (len(from_db) < limit or db_stale)
+    if need_tail:
+        tail_bars = (need_end_ts - max_ts_db) // interval_sec
+        if tail_bars > 0:
+            fetch_limit = min(tail_bars + 20, max(limit * 2, 50000))
+            if fetch_limit > PAGINATE_CHUNK:
+                fetched_tail, eff_tf = _fetch_1m_paginated(
+                    market, symbol, need_start_ts, need_end_ts, fetch_limit
+                )
+            else:
+                fetched_tail, eff_tf = _fetch_1m_or_fallback_5m(
+                    market, symbol, fetch_limit, before_time=need_end_ts + interval_sec
+                )
+            if fetched_tail:
+                if eff_tf == "1m":
+                    merged = _merge_by_time(from_db, fetched_tail, extra_wins=False)
+                    result = merged[-limit:] if len(merged) > limit else merged
+                    _write_points_to_db(market, symbol, merged, interval_sec=60)
+                    logger.info("Kline points incremental: %s %s fetched=%d total=%d", market, symbol, len(fetched_tail), len(result))
+                    return result
+                _write_points_to_db(market, symbol, fetched_tail, interval_sec=300)
+                result = fetched_tail[-limit:] if len(fetched_tail) > limit else fetched_tail
+                logger.info("Kline 1m fallback 5m: %s %s count=%d", market, symbol, len(result))
                 return result
+            # 3) 拉网失败但有本地数据 -> fallback
+            if from_db:
+                logger.warning("Kline 1m tail fetch failed, fallback to local: %s %s count=%d", market, symbol, len(from_db))
+                return _slice_tail(from_db, limit, before_time)
 
-        # 4) 拉网并缓存当前周期
-        fetched: List[Dict[str, Any]] = []
-        next_bt = need_end_ts + interval_sec
-        request_limit = min(limit, PAGINATE_CHUNK)
-        for _ in range(PAGINATE_MAX_ROUNDS):
-            part = DataSourceFactory.get_kline(
-                market, symbol, timeframe, request_limit, before_time=next_bt
-            )
-            if not part:
-                break
-            fetched.extend(part)
-            min_ts = min(b["time"] for b in part)
-            if min_ts <= need_start_ts:
-                break
-            if min_ts >= next_bt:
-                break
-            next_bt = min_ts
-            time.sleep(PAGINATE_DELAY_SEC)
-        if fetched:
-            _write_points_to_db(market, symbol, fetched, interval_sec=interval_sec)
-            logger.info("Kline fetched and cached: %s %s %s count=%d", market, symbol, timeframe, len(fetched))
-        by_time = {b["time"]: b for b in from_same}
-        for b in (fetched or []):
-            if b["time"] not in by_time:
-                by_time[b["time"]] = b
-        merged = sorted(by_time.values(), key=lambda x: x["time"])
-
-        # 5) fallback: 拉网失败且无合并结果，返回库里已有数据
-        if not merged:
-            fallback = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec)
-            if fallback:
-                logger.warning("Network failed, fallback to local: %s %s %s count=%d", market, symbol, timeframe, len(fallback))
-                return _slice(fallback, limit, before_time)
-        return _slice(merged, limit, before_time)
-
-    # 1m 拉网补缺或首次（仅 1m 会走到这里）
+    # 4) 拉网补缺或首次
     from_db = from_points
-    existing_times = {b['time'] for b in from_db}
-    needed_times = [
-        need_start_ts + i * interval_sec
-        for i in range(limit)
-        if need_start_ts + i * interval_sec <= need_end_ts
-    ][:limit]
-    missing_times = [t for t in needed_times if t not in existing_times]
     fetched: List[Dict[str, Any]] = []
-    missing_sorted = sorted(missing_times)
-    if existing_times:
-        gap_before = [t for t in missing_sorted if t < min(existing_times)]
-        gap_after = [t for t in missing_sorted if t > max(existing_times)]
-    else:
-        gap_before, gap_after = [], []
+    gap_before = gap_after = 0
+    if from_db:
+        first_ex = from_db[0]['time']
+        gap_before, gap_after = _edge_gaps(
+            first_ex, from_db[-1]['time'], need_start_ts, need_end_ts, interval_sec, limit
+        )
 
-    if existing_times and gap_before:
+    if gap_before:
         part = DataSourceFactory.get_kline(
-            market, symbol, timeframe, min(len(gap_before) + 20, limit * 2),
-            before_time=min(existing_times),
+            market, symbol, "1m", min(gap_before + 20, limit * 2),
+            before_time=first_ex,
         )
         if part:
             fetched.extend(part)
-    if existing_times and gap_after:
+    if gap_after:
         part = DataSourceFactory.get_kline(
-            market, symbol, timeframe, min(len(gap_after) + 20, limit * 2),
+            market, symbol, "1m", min(gap_after + 20, limit * 2),
             before_time=need_end_ts + interval_sec,
         )
         if part:
             fetched.extend(part)
-    eff_tf = timeframe
+    eff_tf = "1m"
     if not fetched:
         fetch_before = before_time if before_time is not None else need_end_ts + interval_sec
-        if timeframe == "1m":
-            if limit > PAGINATE_CHUNK:
-                fetched, eff_tf = _fetch_1m_paginated(
-                    market, symbol, need_start_ts, need_end_ts, limit
-                )
-            else:
-                fetched, eff_tf = _fetch_1m_or_fallback_5m(market, symbol, limit, before_time=fetch_before)
+        if limit > PAGINATE_CHUNK:
+            fetched, eff_tf = _fetch_1m_paginated(
+                market, symbol, need_start_ts, need_end_ts, limit
+            )
         else:
-            fetched = DataSourceFactory.get_kline(market, symbol, timeframe, limit, before_time=fetch_before)
+            fetched, eff_tf = _fetch_1m_or_fallback_5m(market, symbol, limit, before_time=fetch_before)
 
-    by_time = {b["time"]: b for b in from_db}
-    for b in fetched:
-        if b["time"] not in by_time:
-            by_time[b["time"]] = b
-    merged = sorted(by_time.values(), key=lambda x: x["time"])
-    if before_time is not None:
-        result = [b for b in merged if b["time"] < before_time][-limit:]
-    else:
-        result = merged[-limit:] if len(merged) > limit else merged
+    merged = _merge_by_time(from_db, fetched, extra_wins=False)
+    result = _slice_tail(merged, limit, before_time)
 
     if fetched:
         if eff_tf == "1m":
@@ -725,5 +1182,168 @@ def get_kline(
     # fallback: 拉网失败但有本地数据
     if not result and from_db:
         logger.warning("Kline 1m gap-fill failed, fallback to local: %s %s count=%d", market, symbol, len(from_db))
-        return _slice_1m(from_db, limit, before_time)
+        return _slice_tail(from_db, limit, before_time)
+    return result
+
+
+def _get_kline_tiered(
+    market: str,
+    symbol: str,
+    limit: int = 1000,
+    before_time: Optional[int] = None,
+    *,
+    timeframe: str,
+    interval_sec: int,
+    lower_tiers: tuple = (),
+) -> List[Dict[str, Any]]:
+    """非 1m：1) 范围命中 2) 同周期条数 3) 低层级换算 4) 拉网 5) fallback。"""
+    now_sec = int(time.time())
+    need_start_ts, need_end_ts = _need_window(market, interval_sec, limit, before_time, now_sec)
+
+    # 1) 范围命中检查
+    stored = _get_range(market, symbol, interval_sec)
+    gap = _get_max_gap(market, interval_sec)
+    if stored:
+        sr_min, sr_max = stored
+        if sr_min <= need_start_ts + gap and sr_max >= need_end_ts - gap:
+            from_same = _read_points_range_from_db(
+                market, symbol, need_start_ts, need_end_ts, interval_sec=interval_sec
+            )
+            if from_same:
+                # 实时场景：范围命中但数据可能过期，补充增量尾巴（1m 有同样逻辑，非 1m 此前缺失）
+                if _is_realtime_request(before_time, now_sec, interval_sec) and len(from_same) > 0:
+                    max_ts_db = from_same[-1]["time"]
+                    stale_threshold = interval_sec * 2  # 1D=2天、1H=2小时
+                    if (now_sec - max_ts_db) > stale_threshold:
+                        tail_limit = min(
+                            (now_sec - max_ts_db) // interval_sec + 5,
+                            min(limit, PAGINATE_CHUNK),
+                        )
+                        try:
+                            tail_part = DataSourceFactory.get_kline(
+                                market, symbol, timeframe, max(10, tail_limit), before_time=now_sec + interval_sec
+                            )
+                            if tail_part:
+                                merged = _merge_by_time(from_same, tail_part)
+                                _write_points_to_db(market, symbol, tail_part, interval_sec=interval_sec)
+                                result = _slice_tail(merged, limit, before_time)
+                                logger.info("Kline range hit + tail: %s %s %s count=%d", market, symbol, timeframe, len(result))
+                                return result
+                        except Exception as e:
+                            logger.debug("Kline tail fetch failed (using cached): %s %s %s %s", market, symbol, timeframe, e)
+                result = _slice_tail(from_same, limit, before_time)
+                logger.info("Kline range hit: %s %s %s count=%d", market, symbol, timeframe, len(result))
+                return result
+            return []
+
+    # 2) 同周期条数（兼容旧数据尚无 range 记录的情况）
+    from_same = _read_points_range_from_db(
+        market, symbol, need_start_ts, need_end_ts, interval_sec=interval_sec
+    )
+    if len(from_same) >= limit:
+        # 实时场景：数据可能过期，补充增量尾巴
+        if _is_realtime_request(before_time, now_sec, interval_sec) and len(from_same) > 0:
+            max_ts_db = from_same[-1]["time"]
+            stale_threshold = interval_sec * 2
+            if (now_sec - max_ts_db) > stale_threshold:
+                try:
+                    tail_limit = min((now_sec - max_ts_db) // interval_sec + 5, min(limit, PAGINATE_CHUNK))
+                    tail_part = DataSourceFactory.get_kline(
+                        market, symbol, timeframe, max(10, tail_limit), before_time=now_sec + interval_sec
+                    )
+                    if tail_part:
+                        merged = _merge_by_time(from_same, tail_part)
+                        _write_points_to_db(market, symbol, tail_part, interval_sec=interval_sec)
+                        result = _slice_tail(merged, limit, before_time)
+                        logger.info("Kline same layer + tail: %s %s %s count=%d", market, symbol, timeframe, len(result))
+                        return result
+                except Exception as e:
+                    logger.debug("Kline tail fetch failed (using cached): %s %s %s %s", market, symbol, timeframe, e)
+        result = _slice_tail(from_same, limit, before_time)
+        logger.info("Kline from same layer: %s %s %s count=%d", market, symbol, timeframe, len(result))
+        return result
+
+    # 3) 低层级换算
+    hit = _probe_lower_tiers(market, symbol, need_start_ts, need_end_ts, interval_sec, lower_tiers, limit)
+    if hit is not None:
+        lower_tf, agg = hit
+        result = _slice_tail(agg, limit, before_time)
+        logger.info("Kline from lower layer: %s %s %s from %s count=%d", market, symbol, timeframe, lower_tf, len(result))
+        return result
+
+    # 4) 拉网并缓存当前周期（页按新→旧到达，各页只留早于已收区间的部分，拼接即升序）
+    pages: List[List[Dict[str, Any]]] = []
+    next_bt = need_end_ts + interval_sec
+    request_limit = min(limit, PAGINATE_CHUNK)
+    for _ in range(PAGINATE_MAX_ROUNDS):
+        part = DataSourceFactory.get_kline(
+            market, symbol, timeframe, request_limit, before_time=next_bt
+        )
+        part = _older_part(part, next_bt) if part else part
+        if not part:
+            break
+        pages.append(part)
+        min_ts = part[0]["time"]
+        if min_ts <= need_start_ts:
+            break
+        next_bt = min_ts
+        time.sleep(PAGINATE_DELAY_SEC)
+    fetched = _stitch_pages(pages)
+    if fetched:
+        _write_points_to_db(market, symbol, fetched, interval_sec=interval_sec)
+        logger.info("Kline fetched and cached: %s %s %s count=%d", market, symbol, timeframe, len(fetched))
+        # 实时请求且拉网结果已够数、库内没有更新的 bar：直接取拉网结果尾部，免去与库内结果合并
+        if before_time is None and len(fetched) >= limit:
+            if not from_same or from_same[-1]["time"] <= fetched[-1]["time"]:
+                return fetched[-limit:]
+    merged = _merge_by_time(from_same, fetched, extra_wins=False)
+
+    # 5) fallback: 拉网失败且无合并结果，返回库里已有数据
+    if not merged:
+        fallback = _read_points_range_from_db(market, symbol, need_start_ts, need_end_ts, interval_sec)
+        if fallback:
+            logger.warning("Network failed, fallback to local: %s %s %s count=%d", market, symbol, timeframe, len(fallback))
+            return _slice_tail(fallback, limit, before_time)
+    return _slice_tail(merged, limit, before_time)
+
+
+# 周期 -> 特化入口：导入时把 interval_sec 与各低层级 (周期, 秒数) 绑定进去，请求路径只剩一次查表
+_SPECIALIZED: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    tf: partial(
+        _get_kline_tiered,
+        timeframe=tf,
+        interval_sec=sec,
+        lower_tiers=tuple((lower_tf, TIMEFRAME_SECONDS.get(lower_tf, 60)) for lower_tf in LOWER_LEVELS.get(tf, ())),
+    )
+    for tf, sec in TIMEFRAME_SECONDS.items()
+    if tf != "1m"
+}
+_SPECIALIZED["1m"] = _get_kline_1m
+
+
+def get_kline(
+    market: str,
+    symbol: str,
+    timeframe: str,
+    limit: int = 1000,
+    before_time: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    获取K线唯一入口。只存点：优先读库（1m点->5m点），不够则拉网写点，再按周期聚合返回前端K线格式。
+    """
+    fn = _SPECIALIZED.get(timeframe)
+    if fn is None:
+        # 未登记周期：按日线间隔走通用分层逻辑（无低层级）
+        return _get_kline_tiered(market, symbol, limit, before_time, timeframe=timeframe, interval_sec=86400)
+    if before_time is not None:
+        return fn(market, symbol, limit, before_time)
+    key = (market, symbol, timeframe, limit, _points_generation(market, symbol))
+    ttl = min(TIMEFRAME_SECONDS[timeframe], RESPONSE_CACHE_TTL_CAP)
+    cached = _RESPONSE_CACHE.get(key, ttl)
+    if cached is not _MISS:
+        return list(cached)
+    result = fn(market, symbol, limit, None)
+    # 空结果多为拉网失败，不缓存，下次直接重试
+    if result:
+        _RESPONSE_CACHE.put(key, list(result))
     return result
@@ -0,0 +1,114 @@
+"""
+K 线点位写入缓冲。
+
+定时同步的各 worker 把待写 K 线提交到缓冲区，由后台线程按行数 / 时间阈值合并成一次事务写入
+qd_kline_points，抓取线程不再逐标的等待数据库往返；同步结束时调用 flush() 保证落库。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (market, symbol, interval_sec) -> 待写 K 线
+_BufferKey = Tuple[str, str, int]
+
+
+class KlineWriteBuffer:
+    """
+    线程安全的 K 线写入缓冲：
+    - 累计行数达到 batch_size，或最早一笔已等待 max_age_s 秒，由后台线程刷写；
+    - 待写行数超过 max_pending 时 submit 在调用线程内同步刷写（背压，内存有上限）；
+    - flush() 立即同步刷写全部待写数据。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 2000,
+        max_age_s: float = 5.0,
+        max_pending: Optional[int] = None,
+        writer: Optional[Callable[[List[tuple]], None]] = None,
+    ):
+        self.batch_size = int(batch_size)
+        self.max_age_s = float(max_age_s)
+        self.max_pending = int(max_pending or self.batch_size * 4)
+        self._writer = writer
+        self._pending: Dict[_BufferKey, List[Dict[str, Any]]] = {}
+        self._rows = 0
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, market: str, symbol: str, klines: List[Dict[str, Any]], interval_sec: int = 60) -> None:
+        if not klines:
+            return
+        with self._cond:
+            self._pending.setdefault((market, symbol, int(interval_sec)), []).extend(klines)
+            self._rows += len(klines)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            overflow = self._rows >= self.max_pending
+            self._ensure_thread()
+            self._cond.notify()
+        if overflow:
+            self.flush()
+
+    def flush(self) -> int:
+        """同步写入当前全部待写数据，返回写入的行数；写入失败时这批数据丢弃并返回 0。"""
+        with self._write_lock:
+            with self._cond:
+                pending, rows = self._pending, self._rows
+                self._pending, self._rows, self._oldest = {}, 0, None
+            if not pending:
+                return 0
+            batches = [(m, s, klines, iv) for (m, s, iv), klines in pending.items()]
+            try:
+                self._write(batches)
+            except Exception as e:
+                logger.warning("Kline write buffer flush failed, dropped %d rows: %s", rows, e)
+                return 0
+            return rows
+
+    def pending_rows(self) -> int:
+        with self._cond:
+            return self._rows
+
+    def _write(self, batches: List[tuple]) -> None:
+        if self._writer is not None:
+            self._writer(batches)
+            return
+        from app.services.kline_fetcher import _write_points_many
+        _write_points_many(batches)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="kline-write-buffer", daemon=True)
+            self._thread.start()
+
+    def _due(self) -> bool:
+        if not self._rows:
+            return False
+        return self._rows >= self.batch_size or time.monotonic() - self._oldest >= self.max_age_s
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due():
+                    timeout = None if self._oldest is None else max(
+                        0.0, self.max_age_s - (time.monotonic() - self._oldest))
+                    self._cond.wait(timeout=timeout)
+            self.flush()
+
+
+_buffer = KlineWriteBuffer()
+
+
+def get_kline_write_buffer() -> KlineWriteBuffer:
+    """获取进程级 K 线写入缓冲"""
+    return _buffer
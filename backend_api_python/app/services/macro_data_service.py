@@ -14,11 +14,14 @@
     df["fear_greed"]  - Fear & Greed 指数 (0-100)
 """
 
+import json
 import os
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, date
-from typing import Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
 
 import numpy as np
 import pandas as pd
@@ -40,6 +43,12 @@ try:
 except ImportError:
     HAS_REQUESTS = False
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 
 def _get_db():
     """延迟导入避免循环依赖"""
@@ -47,21 +56,67 @@ def _get_db():
     return get_db_connection()
 
 
+@contextmanager
+def _db_scope(db=None):
+    """传入 db 时复用调用方连接（出错先回滚再抛出，不归还连接）；否则从连接池借一个"""
+    if db is None:
+        with _get_db() as conn:
+            yield conn
+        return
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+
+
+_UPSERT_MACRO_SQL = (
+    "INSERT INTO qd_macro_data (indicator, date_val, value) "
+    "VALUES (?, ?, ?) "
+    "ON CONFLICT(indicator, date_val) DO UPDATE SET value=EXCLUDED.value"
+)
+# 每个物理连接只 PREPARE 一次，之后批量 EXECUTE 复用服务端解析/计划
+_UPSERT_MACRO_STMT = "qd_macro_upsert"
+_EXECUTE_MACRO_UPSERT_SQL = f"EXECUTE {_UPSERT_MACRO_STMT}(?, ?, ?)"
+
+
 class MacroDataService:
     """获取并缓存 VIX / DXY / Fear&Greed 历史数据，合并到 K线 DataFrame"""
 
+    # 读多写少：命中路径无锁（dict.get 在 GIL 下原子，值为不可变 (时间, 数据) 元组），只在写入/清空时加锁
     _mem_cache: dict = {}
     _mem_lock = threading.Lock()
+    # 单指标热缓存 indicator -> (写入时间, 起始日, 结束日, 序列)：起止日期平移的滚动请求直接切片，不再整段重读库
+    _indicator_cache: Dict[str, Tuple[float, date, date, pd.DataFrame]] = {}
     _db_ready = False
+    _db_ready_lock = threading.Lock()
     MEM_TTL = int(os.getenv("MACRO_CACHE_TTL", 3600))
 
     MACRO_COLUMNS = ["vix", "vhsi", "civix", "dxy", "fear_greed"]
 
+    @classmethod
+    def _net_fetchers(cls) -> List[Tuple[str, Callable]]:
+        """(指标, 网络拉取函数)，顺序即合并后的列顺序"""
+        return [
+            ("vix", cls._fetch_vix_net),
+            ("vhsi", cls._fetch_vhsi_net),
+            ("civix", cls._fetch_civix_net),
+            ("dxy", cls._fetch_dxy_net),
+            ("fear_greed", cls._fetch_fg_net),
+        ]
+
     @classmethod
     def _ensure_table(cls):
-        """首次使用时自动建表（和 kline_fetcher 同模式）"""
+        """首次使用时自动建表（和 kline_fetcher 同模式）；建好后只剩一次属性判断，并发首调只建一次"""
         if cls._db_ready:
             return
+        with cls._db_ready_lock:
+            if cls._db_ready:
+                return
+            cls._create_table()
+
+    @classmethod
+    def _create_table(cls):
         try:
             with _get_db() as db:
                 cur = db.cursor()
@@ -99,12 +154,15 @@ class MacroDataService:
             elif hasattr(macro_idx, 'tz') and macro_idx.tz is not None and (not hasattr(df_idx, 'tz') or df_idx.tz is None):
                 macro_df.index = macro_df.index.tz_localize(None)
 
-            for col in cls.MACRO_COLUMNS:
-                if col in macro_df.columns:
-                    aligned = macro_df[col].reindex(df.index, method='ffill')
-                    df[col] = aligned.values
-                else:
-                    df[col] = np.nan
+            # 前向填充对齐：宏观日序列已排序，每根 K 线取 <= 其时间的最后一条（searchsorted + 一次 gather），
+            # 早于首条宏观数据的 K 线为 NaN；全部宏观列整块写回
+            if not macro_df.index.is_monotonic_increasing:
+                macro_df = macro_df.sort_index()
+            pos = macro_df.index.searchsorted(df.index, side='right') - 1
+            values = macro_df.reindex(columns=cls.MACRO_COLUMNS).to_numpy(dtype=np.float64)
+            aligned = values.take(np.maximum(pos, 0), axis=0)
+            aligned[pos < 0] = np.nan
+            df[cls.MACRO_COLUMNS] = aligned
         else:
             for col in cls.MACRO_COLUMNS:
                 df[col] = np.nan
@@ -129,9 +187,11 @@ class MacroDataService:
 
         realtime = cls._get_realtime_snapshot()
         if realtime:
+            # 按列位置标量写入最后一行：不经 .loc 标签查找（重复时间戳时也只写最后一行）
+            last = len(df) - 1
             for col in cls.MACRO_COLUMNS:
                 if col in realtime and col in df.columns:
-                    df.loc[df.index[-1], col] = realtime[col]
+                    df.iat[last, df.columns.get_loc(col)] = realtime[col]
 
         return df
 
@@ -142,34 +202,62 @@ class MacroDataService:
         """获取合并后的宏观 DataFrame（内存热缓存 → DB → 网络）"""
         cache_key = f"macro_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
 
-        with cls._mem_lock:
-            if cache_key in cls._mem_cache:
-                cached_time, cached_df = cls._mem_cache[cache_key]
-                if time.time() - cached_time < cls.MEM_TTL:
-                    return cached_df
+        cached = cls._mem_cache.get(cache_key)
+        if cached is not None and time.time() - cached[0] < cls.MEM_TTL:
+            return cached[1]
 
         sd = start_date - timedelta(days=10)
         ed = end_date + timedelta(days=1)
 
+        # 先库后网：各指标读库共用一个连接；覆盖不足的指标并发拉网（延迟取最慢的一个而非逐个相加），
+        # 拉到的数据再共用一个连接回写
+        fetchers = cls._net_fetchers()
+        hits = {indicator: cls._cached_indicator(indicator, sd.date(), ed.date()) for indicator, _ in fetchers}
+        to_load = [(indicator, fetcher) for indicator, fetcher in fetchers if hits[indicator] is None]
+        db_frames = cls._read_db_many([indicator for indicator, _ in to_load], sd.date(), ed.date()) if to_load else {}
+        missing = [(indicator, fetcher) for indicator, fetcher in to_load
+                   if not cls._db_covers(db_frames.get(indicator), sd, ed)]
+        net_frames: Dict[str, pd.DataFrame] = {}
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix="macro-load") as pool:
+                fetched = pool.map(lambda item: item[1](sd, ed), missing)
+                for (indicator, _), net_data in zip(missing, fetched):
+                    if net_data is not None and not net_data.empty:
+                        net_frames[indicator] = net_data
+            cls._write_db_many(net_frames)
+
         dfs = []
-        for indicator, fetcher in [
-            ("vix", cls._fetch_vix_net),
-            ("vhsi", cls._fetch_vhsi_net),
-            ("civix", cls._fetch_civix_net),
-            ("dxy", cls._fetch_dxy_net),
-            ("fear_greed", cls._fetch_fg_net),
-        ]:
-            series = cls._load_indicator(indicator, sd, ed, fetcher)
-            if series is not None:
-                dfs.append(series)
+        for indicator, _ in fetchers:
+            series = hits[indicator]
+            if series is None:
+                series = net_frames.get(indicator)
+                if series is None:
+                    series = db_frames.get(indicator)
+                if series is None or series.empty:
+                    continue
+                if not series.index.is_unique:
+                    series = series[~series.index.duplicated(keep='last')]
+                # 统一 float64（fear_greed 为 int），ffill 走数值快路径
+                series = series.astype(np.float64)
+                # 拉网成功或库内已覆盖才记入单指标缓存；部分覆盖的库数据留待下次重试拉网。
+                # 拉网结果常超出请求区间（如 CIVIX 全量 CSV），缓存区间按实际数据边界放宽
+                if indicator in net_frames:
+                    cls._remember_indicator(
+                        indicator,
+                        min(sd.date(), series.index.min().date()),
+                        max(ed.date(), series.index.max().date()),
+                        series,
+                    )
+                elif cls._db_covers(series, sd, ed):
+                    cls._remember_indicator(indicator, sd.date(), ed.date(), series)
+            dfs.append(series)
 
         if not dfs:
             return None
 
-        result = dfs[0]
-        for d in dfs[1:]:
-            result = result.join(d, how='outer')
-        result = result.sort_index().ffill()
+        # 一次性按日期外连接对齐全部指标，代替逐个 join 反复重建索引
+        result = pd.concat(dfs, axis=1, join='outer', sort=True)
+        result.ffill(inplace=True)
 
         with cls._mem_lock:
             cls._mem_cache[cache_key] = (time.time(), result)
@@ -177,74 +265,112 @@ class MacroDataService:
         return result
 
     @classmethod
-    def _load_indicator(cls, indicator: str, start: datetime, end: datetime, net_fetcher) -> Optional[pd.DataFrame]:
-        """单指标: DB查 → 缺失则网络拉 → 回写DB"""
-        db_data = cls._read_db(indicator, start.date(), end.date())
-
-        if db_data is not None and len(db_data) > 0:
-            expected_days = (end.date() - start.date()).days
-            coverage = len(db_data) / max(expected_days * 0.7, 1)
-            if coverage > 0.8:
-                return db_data
-
-        net_data = net_fetcher(start, end)
-        if net_data is not None and not net_data.empty:
-            cls._write_db(indicator, net_data)
-            return net_data
+    def _cached_indicator(cls, indicator: str, start: date, end: date) -> Optional[pd.DataFrame]:
+        """单指标缓存覆盖 [start, end] 且未过期时返回该区间切片，否则 None"""
+        entry = cls._indicator_cache.get(indicator)
+        if entry is None:
+            return None
+        cached_time, lo, hi, series = entry
+        if time.time() - cached_time >= cls.MEM_TTL or start < lo or end > hi:
+            return None
+        idx = series.index
+        mask = (idx >= pd.Timestamp(start)) & (idx < pd.Timestamp(end) + pd.Timedelta(days=1))
+        return series[mask]
 
-        return db_data if (db_data is not None and not db_data.empty) else None
+    @classmethod
+    def _remember_indicator(cls, indicator: str, start: date, end: date, series: pd.DataFrame):
+        """写入单指标缓存；与未过期的旧区间重叠/相接时合并为并集"""
+        now = time.time()
+        with cls._mem_lock:
+            entry = cls._indicator_cache.get(indicator)
+            if entry is not None:
+                cached_time, lo, hi, old = entry
+                joinable = start <= hi + timedelta(days=1) and lo <= end + timedelta(days=1)
+                if now - cached_time < cls.MEM_TTL and joinable:
+                    merged = pd.concat([old, series])
+                    series = merged[~merged.index.duplicated(keep='last')].sort_index()
+                    start, end = min(start, lo), max(end, hi)
+            cls._indicator_cache[indicator] = (now, start, end, series)
+
+    @staticmethod
+    def _db_covers(db_data: Optional[pd.DataFrame], start: datetime, end: datetime) -> bool:
+        """库内数据是否足够覆盖 [start, end]（交易日约占自然日 70%，覆盖率 > 0.8 视为够用）"""
+        if db_data is None or len(db_data) == 0:
+            return False
+        expected_days = (end.date() - start.date()).days
+        coverage = len(db_data) / max(expected_days * 0.7, 1)
+        return coverage > 0.8
 
     # ── DB 读写 ──────────────────────────────────────────────────────
 
     @classmethod
-    def _read_db(cls, indicator: str, start_date: date, end_date: date) -> Optional[pd.DataFrame]:
+    def _read_db_many(cls, indicators: List[str], start_date: date, end_date: date) -> Dict[str, pd.DataFrame]:
+        """多个指标一条 IN 查询读库（一次往返），按指标拆分；失败时返回空 dict，由调用方走网络"""
+        if not indicators:
+            return {}
         cls._ensure_table()
+        placeholders = ", ".join("?" * len(indicators))
         try:
             with _get_db() as db:
                 cur = db.cursor()
                 cur.execute(
-                    "SELECT date_val, value FROM qd_macro_data "
-                    "WHERE indicator = ? AND date_val >= ? AND date_val <= ? "
-                    "ORDER BY date_val",
-                    (indicator, start_date.isoformat(), end_date.isoformat())
+                    "SELECT indicator, date_val, value::float8 AS value FROM qd_macro_data "
+                    f"WHERE indicator IN ({placeholders}) AND date_val >= ? AND date_val <= ? "
+                    "ORDER BY indicator, date_val",
+                    (*indicators, start_date.isoformat(), end_date.isoformat())
                 )
                 rows = cur.fetchall()
                 cur.close()
-            if not rows:
-                return None
-            records = [(pd.Timestamp(r['date_val']), float(r['value'])) for r in rows]
-            df = pd.DataFrame(records, columns=['time', indicator]).set_index('time')
-            return df
         except Exception as e:
-            logger.debug(f"DB read for {indicator} failed (table may not exist yet): {e}")
-            return None
+            logger.debug(f"DB read for macro indicators failed: {e}")
+            return {}
+        if not rows:
+            return {}
+        raw = pd.DataFrame.from_records(rows, columns=['indicator', 'date_val', 'value'])
+        raw['date_val'] = pd.to_datetime(raw['date_val'])
+        return {
+            indicator: pd.DataFrame(
+                {indicator: group['value'].to_numpy(dtype=float)},
+                index=pd.DatetimeIndex(group['date_val'], name='time'),
+            )
+            for indicator, group in raw.groupby('indicator', sort=False)
+        }
 
     @classmethod
-    def _write_db(cls, indicator: str, data: pd.DataFrame):
-        """将网络拉取的数据回写 DB（UPSERT）"""
-        if data.empty:
+    def _write_db_many(cls, frames: Dict[str, pd.DataFrame]):
+        """多个指标共用一个连接回写（各指标单独提交，互不影响）"""
+        if not frames:
             return
         cls._ensure_table()
-        col = data.columns[0] if len(data.columns) == 1 else indicator
         try:
             with _get_db() as db:
+                for indicator, data in frames.items():
+                    cls._write_db(indicator, data, db=db)
+        except Exception as e:
+            logger.warning(f"DB write for macro indicators failed: {e}")
+
+    @classmethod
+    def _write_db(cls, indicator: str, data: pd.DataFrame, db=None):
+        """将网络拉取的数据回写 DB（UPSERT）；传入 db 时复用该连接"""
+        if data.empty:
+            return
+        if db is None:
+            cls._ensure_table()
+        col = data.columns[0] if len(data.columns) == 1 else indicator
+        try:
+            # 整列取值、去 NaN 后一次 executemany 分批发送，单事务提交（不再逐行 execute）
+            values = (data[col] if col in data.columns else data.iloc[:, 0]).astype(float).dropna()
+            if values.empty:
+                return
+            dates = [d.isoformat() for d in pd.DatetimeIndex(values.index).date]
+            params = list(zip([indicator] * len(values), dates, values.tolist()))
+            with _db_scope(db) as db:
+                db.prepare(_UPSERT_MACRO_STMT, _UPSERT_MACRO_SQL)
                 cur = db.cursor()
-                count = 0
-                for ts, row in data.iterrows():
-                    dt = ts.date() if hasattr(ts, 'date') else ts
-                    val = float(row[col]) if col in row.index else float(row.iloc[0])
-                    if pd.notna(val):
-                        cur.execute(
-                            "INSERT INTO qd_macro_data (indicator, date_val, value) "
-                            "VALUES (?, ?, ?) "
-                            "ON CONFLICT(indicator, date_val) DO UPDATE SET value=EXCLUDED.value "
-                            "RETURNING date_val",
-                            (indicator, dt.isoformat(), val)
-                        )
-                        count += 1
+                cur.executemany(_EXECUTE_MACRO_UPSERT_SQL, params)
                 db.commit()
                 cur.close()
-                logger.info(f"Wrote {count} rows for {indicator} to DB")
+                logger.info(f"Wrote {len(params)} rows for {indicator} to DB")
         except Exception as e:
             logger.warning(f"DB write for {indicator} failed: {e}")
 
@@ -353,17 +479,15 @@ class MacroDataService:
             days = (end - start).days + 30
             url = f"https://api.alternative.me/fng/?limit={days}&format=json"
             resp = _requests.get(url, timeout=15)
-            items = resp.json().get("data", [])
+            items = _json_loads(resp.content).get("data", [])
             if not items:
                 return None
-            records = []
-            for item in items:
-                ts = int(item["timestamp"])
-                val = int(item["value"])
-                dt = datetime.utcfromtimestamp(ts)
-                records.append({"time": dt, "fear_greed": val})
-            result = pd.DataFrame(records).set_index("time").sort_index()
-            return result
+            # 直接填充时间戳/数值两列数组，免逐条 dict 与 utcfromtimestamp
+            n = len(items)
+            ts = np.fromiter((int(item["timestamp"]) for item in items), dtype=np.int64, count=n)
+            vals = np.fromiter((int(item["value"]) for item in items), dtype=np.int64, count=n)
+            index = pd.DatetimeIndex(pd.to_datetime(ts, unit="s"), name="time")
+            return pd.DataFrame({"fear_greed": vals}, index=index).sort_index()
         except Exception as e:
             logger.warning(f"Fear & Greed network fetch failed: {e}")
             return None
@@ -373,63 +497,66 @@ class MacroDataService:
     @classmethod
     def _get_realtime_snapshot(cls) -> Optional[dict]:
         cache_key = "_realtime"
-        with cls._mem_lock:
-            if cache_key in cls._mem_cache:
-                cached_time, cached_data = cls._mem_cache[cache_key]
-                if time.time() - cached_time < 300:
-                    return cached_data
+        cached = cls._mem_cache.get(cache_key)
+        if cached is not None and time.time() - cached[0] < 300:
+            return cached[1]
 
-        snapshot = {}
+        tasks = {}
         if HAS_YFINANCE:
-            try:
-                vix_t = yf.Ticker("^VIX")
-                info = vix_t.fast_info
-                snapshot["vix"] = float(getattr(info, 'last_price', 0) or 0)
-            except Exception:
-                pass
-            for vhsi_ticker in ("^VHSI",):
-                try:
-                    vhsi_t = yf.Ticker(vhsi_ticker)
-                    info = vhsi_t.fast_info
-                    val = float(getattr(info, 'last_price', 0) or 0)
-                    if val > 0:
-                        snapshot["vhsi"] = val
-                        break
-                except Exception:
-                    continue
+            tasks["vix"] = lambda: cls._yf_last_price("^VIX")
+            tasks["vhsi"] = lambda: cls._yf_last_price("^VHSI") or None
+            tasks["dxy"] = lambda: cls._yf_last_price("DX-Y.NYB")
         if HAS_REQUESTS:
-            try:
-                resp = _requests.get("http://1.optbbs.com/d/csv/d/k.csv", timeout=10)
-                resp.encoding = "gbk"
-                raw = pd.read_csv(pd.io.common.BytesIO(resp.content), encoding="gbk")
-                if not raw.empty and raw.shape[1] >= 5:
-                    close_val = pd.to_numeric(raw.iloc[-1, 4], errors="coerce")
-                    if pd.notna(close_val) and close_val > 0:
-                        snapshot["civix"] = float(close_val)
-            except Exception:
-                pass
-        if HAS_YFINANCE:
-            try:
-                dxy_t = yf.Ticker("DX-Y.NYB")
-                info = dxy_t.fast_info
-                snapshot["dxy"] = float(getattr(info, 'last_price', 0) or 0)
-            except Exception:
-                pass
+            tasks["civix"] = cls._civix_last
+            tasks["fear_greed"] = cls._fg_last
 
-        if HAS_REQUESTS:
-            try:
-                resp = _requests.get("https://api.alternative.me/fng/?limit=1", timeout=10)
-                data = resp.json().get("data", [])
-                if data:
-                    snapshot["fear_greed"] = int(data[0]["value"])
-            except Exception:
-                pass
+        # 各源独立的网络请求并发发出，快照耗时取最慢的一个
+        snapshot = {}
+        if tasks:
+            with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="macro-snap") as pool:
+                futures = {col: pool.submit(tasks[col]) for col in cls.MACRO_COLUMNS if col in tasks}
+                for col, fut in futures.items():
+                    val = fut.result()
+                    if val is not None:
+                        snapshot[col] = val
 
         with cls._mem_lock:
             cls._mem_cache[cache_key] = (time.time(), snapshot)
 
         return snapshot if snapshot else None
 
+    @staticmethod
+    def _yf_last_price(ticker: str) -> Optional[float]:
+        try:
+            return float(getattr(yf.Ticker(ticker).fast_info, 'last_price', 0) or 0)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _civix_last() -> Optional[float]:
+        try:
+            resp = _requests.get("http://1.optbbs.com/d/csv/d/k.csv", timeout=10)
+            resp.encoding = "gbk"
+            raw = pd.read_csv(pd.io.common.BytesIO(resp.content), encoding="gbk")
+            if not raw.empty and raw.shape[1] >= 5:
+                close_val = pd.to_numeric(raw.iloc[-1, 4], errors="coerce")
+                if pd.notna(close_val) and close_val > 0:
+                    return float(close_val)
+        except Exception:
+            pass
+        return None
+
+    @staticmethod
+    def _fg_last() -> Optional[int]:
+        try:
+            resp = _requests.get("https://api.alternative.me/fng/?limit=1", timeout=10)
+            data = _json_loads(resp.content).get("data", [])
+            if data:
+                return int(data[0]["value"])
+        except Exception:
+            pass
+        return None
+
     @classmethod
     def get_realtime_snapshot(cls) -> Optional[dict]:
         """获取实时宏观数据快照（带 5 分钟缓存）。"""
@@ -439,6 +566,7 @@ class MacroDataService:
     def clear_cache(cls):
         with cls._mem_lock:
             cls._mem_cache.clear()
+            cls._indicator_cache.clear()
 
     @classmethod
     def sync_recent_to_db(cls, days: int = 30) -> dict:
@@ -452,14 +580,7 @@ class MacroDataService:
         end = now + timedelta(days=1)
         result: dict = {}
 
-        fetchers = [
-            ("vix", cls._fetch_vix_net),
-            ("vhsi", cls._fetch_vhsi_net),
-            ("civix", cls._fetch_civix_net),
-            ("dxy", cls._fetch_dxy_net),
-            ("fear_greed", cls._fetch_fg_net),
-        ]
-        for indicator, fetcher in fetchers:
+        for indicator, fetcher in cls._net_fetchers():
             try:
                 net_data = fetcher(start, end)
                 if net_data is not None and not net_data.empty:
@@ -1,15 +1,22 @@
 """
-定时任务服务：仅有一个定时任务，可注册多个品类；触发时按品类顺序拉取，品类间延时防限流；
+定时任务服务：仅有一个定时任务，可注册多个品类；触发时各市场并行拉取，市场内标的按并发度与节奏错开；
 拉取所有周期 (1m/5m/15m/30m/1H/4H/1D/1W) 的 K 线数据并缓存到数据库。
 支持：每市场独立延时 / 周期优先级 / RateLimitError 熔断 / 自适应退避。
 """
+import socket
 import time
 import os
+import zlib
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Any, Optional
-from threading import Lock
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+from threading import Condition, Event, Lock
 
-from app.data_sources.base import RateLimitError
+from app.data_sources.base import TIMEFRAME_SECONDS, RateLimitError
+from app.utils.cache import CacheManager
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -17,8 +24,6 @@ logger = get_logger(__name__)
 # ---------------------------------------------------------------------------
 # 延时与限流参数
 # ---------------------------------------------------------------------------
-DELAY_BETWEEN_CATEGORIES_SECONDS = 10
-
 # 每市场独立延时（秒）——Tiingo(Forex) 限流最严格，给予最大间隔
 MARKET_DELAYS: Dict[str, Dict[str, float]] = {
     "Crypto":  {"between_symbols": 0.5, "between_timeframes": 0.3},
@@ -31,6 +36,64 @@ MARKET_DELAYS: Dict[str, Dict[str, float]] = {
 _DEFAULT_SYMBOL_DELAY = 1.5
 _DEFAULT_TF_DELAY = 0.8
 
+# 每市场并发同步的标的数（HTTP 往返为主，线程等待 I/O 时释放 GIL）；
+# between_symbols 变为各 worker 共享的「相邻两个标的开始拉取」的最小间隔
+MARKET_CONCURRENCY: Dict[str, int] = {
+    "Crypto":  6,
+    "USStock": 4,
+    "AShare":  3,
+    "HShare":  3,
+    "Futures": 3,
+    "Forex":   2,
+}
+_DEFAULT_CONCURRENCY = 2
+
+# 标的起拉抖动：在各自 sym_delay 时间片内再偏移 [0, 比例×sym_delay)；偏移由 crc32(实例, 市场, 标的) 决定，
+# 同一实例每轮稳定、不同实例彼此错开（不用内置 hash()：其字符串哈希每个进程随机化）
+SYMBOL_JITTER_RATIO = 0.5
+_INSTANCE_ID = os.getenv("SCHEDULER_INSTANCE_ID") or socket.gethostname()
+
+
+def _symbol_jitter(market: str, symbol: str) -> float:
+    """返回 [0, 1) 的确定性抖动系数"""
+    return (zlib.crc32(f"{_INSTANCE_ID}:{market}:{symbol}".encode()) & 0xFFFF) / 0x10000
+
+
+# 数据源支持多周期并发时，单个标的同时在途的周期请求数上限
+MULTI_TF_WORKERS = 4
+
+# 每市场每分钟请求预算（数据源不回传限流头，按滑动窗口自行计数）；
+# 剩余额度低于 10%（至少 2 次）时主动暂停到窗口内最早一次请求过期
+MARKET_RPM_BUDGET: Dict[str, int] = {
+    "Crypto":  600,
+    "USStock": 120,
+    "AShare":  90,
+    "HShare":  90,
+    "Futures": 300,
+    "Forex":   30,
+}
+_DEFAULT_RPM_BUDGET = 60
+_RPM_WINDOW_SECONDS = 60.0
+_RPM_RESERVE_RATIO = 0.1
+
+# 各市场主数据源所在的提供方（同一提供方的账户/IP 额度被多个市场共享，令牌桶按提供方而非市场计）
+MARKET_PROVIDER_HOSTS: Dict[str, str] = {
+    "Crypto":  "api.binance.com",
+    "USStock": "query1.finance.yahoo.com",
+    "Futures": "query1.finance.yahoo.com",
+    "AShare":  "push2his.eastmoney.com",
+    "HShare":  "push2his.eastmoney.com",
+    "Forex":   "api.tiingo.com",
+}
+# 提供方令牌桶：(每秒补充令牌数, 桶容量)
+PROVIDER_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "api.binance.com":          (10.0, 20.0),
+    "query1.finance.yahoo.com": (2.0, 5.0),
+    "push2his.eastmoney.com":   (2.0, 4.0),
+    "api.tiingo.com":           (0.5, 2.0),
+}
+_DEFAULT_PROVIDER_RATE = (1.0, 2.0)
+
 # 熔断：连续失败 N 次后，对该市场的后续标的执行长冷却
 CIRCUIT_BREAK_THRESHOLD = 3          # 连续失败次数触发冷却
 CIRCUIT_COOLDOWN_SECONDS = 60        # 冷却等待（秒）
@@ -58,15 +121,384 @@ MARKET_TIMEFRAMES = {
     "Futures": ["1D", "1H", "4H", "1W", "30m", "15m", "5m", "1m"],
 }
 
+# AIMD 并发控制参数：成功时并发 +α，限流时并发 ×β，下限 C_min，上限为 MARKET_CONCURRENCY
+AIMD_ALPHA = 0.5
+AIMD_BETA = 0.5
+AIMD_MIN_CONCURRENCY = 1
+_LATENCY_EWMA_WEIGHT = 0.2
+
+
+class MarketAIMD:
+    """
+    每市场 AIMD（加性增、乘性减）并发控制器。
+    状态 market -> [并发度, 最近一次耗时, 耗时 EWMA]，跨同步轮次保留；
+    MARKET_DELAYS 的固定间隔仍作为节奏下限，控制器只决定同时在途的标的数。
+    """
+
+    def __init__(self):
+        self._state: Dict[str, List[float]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _max(market: str) -> float:
+        return float(MARKET_CONCURRENCY.get(market, _DEFAULT_CONCURRENCY))
+
+    def _entry(self, market: str) -> List[float]:
+        entry = self._state.get(market)
+        if entry is None:
+            entry = self._state[market] = [self._max(market), 0.0, 0.0]
+        return entry
+
+    def concurrency(self, market: str) -> float:
+        with self._lock:
+            return self._entry(market)[0]
+
+    def latency(self, market: str) -> float:
+        with self._lock:
+            return self._entry(market)[2]
+
+    def on_success(self, market: str, latency: float) -> None:
+        with self._lock:
+            entry = self._entry(market)
+            entry[0] = min(self._max(market), entry[0] + AIMD_ALPHA)
+            entry[1] = latency
+            entry[2] = latency if entry[2] <= 0 else (
+                _LATENCY_EWMA_WEIGHT * latency + (1 - _LATENCY_EWMA_WEIGHT) * entry[2])
+
+    def on_error(self, market: str, retry_after: float = 0) -> None:
+        """限流：并发乘性减；数据源给出 retry_after 时直接降到下限。"""
+        with self._lock:
+            entry = self._entry(market)
+            if retry_after:
+                entry[0] = float(AIMD_MIN_CONCURRENCY)
+            else:
+                entry[0] = max(float(AIMD_MIN_CONCURRENCY), entry[0] * AIMD_BETA)
+
+    def seed(self, market: str, concurrency: Optional[float]) -> None:
+        """进程内尚无该市场状态时，用持久化的并发度初始化（进程重启后延续上次的收敛结果）。"""
+        if not concurrency:
+            return
+        with self._lock:
+            if market not in self._state:
+                value = min(self._max(market), max(float(AIMD_MIN_CONCURRENCY), float(concurrency)))
+                self._state[market] = [value, 0.0, 0.0]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state.clear()
+
+
+_aimd = MarketAIMD()
+
+
+class _RequestWindow:
+    """单个市场的滑动窗口请求计数；收到 retry_after 时整个市场暂停到期后再放行。"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._stamps: deque = deque()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def _reserve(self) -> int:
+        return max(2, int(self.limit * _RPM_RESERVE_RATIO))
+
+    def acquire(self) -> float:
+        """阻塞到窗口内仍有可用额度，记录本次请求；返回等待的秒数。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._stamps and now - self._stamps[0] >= _RPM_WINDOW_SECONDS:
+                    self._stamps.popleft()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.limit - len(self._stamps) <= self._reserve():
+                    wait = self._stamps[0] + _RPM_WINDOW_SECONDS - now
+                else:
+                    self._stamps.append(now)
+                    return waited
+            time.sleep(max(wait, 0.01))
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+
+class TokenBucket:
+    """令牌桶：按 monotonic 时间惰性补充，有令牌时不等待；多线程共享。"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self._stamp:
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+
+    def acquire(self) -> float:
+        """取一个令牌，必要时等待补充；返回等待的秒数。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1 and now >= self._stamp:
+                    self._tokens -= 1
+                    return waited
+                wait = max(self._stamp - now, 0.0) + max(0.0, 1 - self._tokens) / self.rate
+            time.sleep(max(wait, 0.01))
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """提供方要求退避：清空令牌并把补充起点推后 seconds 秒，共享该提供方的市场一起等待。"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._stamp = max(self._stamp, now + seconds)
+
+
+_host_buckets: Dict[str, TokenBucket] = {}
+_host_buckets_lock = Lock()
+
+
+def _host_bucket(market: str) -> TokenBucket:
+    host = MARKET_PROVIDER_HOSTS.get(market, market)
+    bucket = _host_buckets.get(host)
+    if bucket is None:
+        with _host_buckets_lock:
+            bucket = _host_buckets.get(host)
+            if bucket is None:
+                rate, burst = PROVIDER_RATE_LIMITS.get(host, _DEFAULT_PROVIDER_RATE)
+                bucket = _host_buckets[host] = TokenBucket(rate, burst)
+    return bucket
+
+
+# 各提供方最近一次发出请求的 monotonic_ns；周期间隔按"距上次请求已过多久"补足，而非固定 sleep
+_last_host_call_ns: Dict[str, int] = {}
+
+
+def _pace_host(market: str, min_interval: float) -> float:
+    """确保距该市场提供方上次请求至少 min_interval 秒，只睡剩余部分；返回实际等待秒数。"""
+    last = _last_host_call_ns.get(MARKET_PROVIDER_HOSTS.get(market, market))
+    if last is None or min_interval <= 0:
+        return 0.0
+    remaining = min_interval - (time.monotonic_ns() - last) / 1e9
+    if remaining > 0:
+        time.sleep(remaining)
+        return remaining
+    return 0.0
+
+
+_request_windows: Dict[str, _RequestWindow] = {}
+_request_windows_lock = Lock()
+
+
+def _request_window(market: str) -> _RequestWindow:
+    window = _request_windows.get(market)
+    if window is None:
+        with _request_windows_lock:
+            window = _request_windows.get(market)
+            if window is None:
+                window = _request_windows[market] = _RequestWindow(
+                    MARKET_RPM_BUDGET.get(market, _DEFAULT_RPM_BUDGET))
+    return window
+
+
+def _measure_latency(market: str, fetch, *args, **kwargs):
+    """按市场请求预算与提供方令牌桶放行一次数据拉取，并把耗时/限流结果反馈给 AIMD 控制器。"""
+    window = _request_window(market)
+    bucket = _host_bucket(market)
+    waited = window.acquire() + bucket.acquire()
+    if waited >= 1:
+        logger.info("Scheduler: %s request budget near limit → paused %.1fs", market, waited)
+    _last_host_call_ns[MARKET_PROVIDER_HOSTS.get(market, market)] = time.monotonic_ns()
+    started = time.monotonic()
+    try:
+        result = fetch(*args, **kwargs)
+    except RateLimitError as rle:
+        _aimd.on_error(market, rle.retry_after)
+        if rle.retry_after:
+            window.pause(rle.retry_after)
+            bucket.pause(rle.retry_after)
+        raise
+    _aimd.on_success(market, time.monotonic() - started)
+    return result
+
+
+class _InFlightCache:
+    """
+    一次同步轮次内的拉取合并：相同 key 的并发请求共享同一个 Future，已成功的结果本轮内复用；
+    失败（含限流）只交给当时在等的调用方，随即移除，之后的重试会重新拉取。未 open 时直接调用。
+    open/close 按深度计数：手动触发与定时任务重叠时，共用同一轮缓存，最后一个 close 才清空。
+    """
+
+    def __init__(self):
+        self._futures: Dict[tuple, Future] = {}
+        self._lock = Lock()
+        self._depth = 0
+
+    def open(self) -> None:
+        with self._lock:
+            self._depth += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._depth = max(0, self._depth - 1)
+            if not self._depth:
+                self._futures.clear()
+
+    def call(self, key: tuple, fn, *args, **kwargs):
+        with self._lock:
+            if not self._depth:
+                fut = None
+                owner = False
+            else:
+                fut = self._futures.get(key)
+                owner = fut is None
+                if owner:
+                    fut = self._futures[key] = Future()
+        if fut is None:
+            return fn(*args, **kwargs)
+        if not owner:
+            return fut.result()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            with self._lock:
+                if self._futures.get(key) is fut:
+                    del self._futures[key]
+            fut.set_exception(e)
+        return fut.result()
+
+
+_inflight = _InFlightCache()
+
+
+def _fetch_summary(market: str, fetch, symbol: str, tf: str, limit: int, sink=None) -> Tuple[int, Optional[int]]:
+    """拉取一次并只返回 (根数, 最后一根时间)；需要完整 K 线的处理（如提交写入缓冲）经 sink 在拉取方线程内完成。"""
+    klines = _measure_latency(market, fetch, market, symbol, tf, limit=limit)
+    if not klines:
+        return 0, None
+    if sink is not None:
+        sink(klines)
+    try:
+        last = int(klines[-1]["time"])
+    except (KeyError, TypeError, ValueError):
+        last = None
+    return len(klines), last
+
+
+def _coalesced_fetch(market: str, fetch, symbol: str, tf: str, limit: int, sink=None) -> Tuple[int, Optional[int]]:
+    """经本轮合并缓存拉取 (market, symbol, tf, limit)，同一拉取函数的重复请求只打一次数据源；缓存中只留摘要。"""
+    key = (getattr(fetch, "__qualname__", repr(fetch)), market, symbol, tf, limit)
+    return _inflight.call(key, _fetch_summary, market, fetch, symbol, tf, limit, sink)
+
+
+# 各 (market, symbol, tf) 已同步的最新 K 线开盘时间：下一根尚未开盘时库里已是最新，本轮跳过拉取
+_last_bar_ts: Dict[Tuple[str, str, str], int] = {}
+_last_bar_lock = Lock()
+
+
+def _bar_is_fresh(market: str, symbol: str, tf: str) -> bool:
+    last = _last_bar_ts.get((market, symbol, tf))
+    return last is not None and time.time() < last + TIMEFRAME_SECONDS.get(tf, 86400)
+
+
+def _remember_last_bar(market: str, symbol: str, tf: str, ts: Optional[int]) -> None:
+    if ts is None:
+        return
+    with _last_bar_lock:
+        key = (market, symbol, tf)
+        if ts > _last_bar_ts.get(key, 0):
+            _last_bar_ts[key] = ts
+
+
+# 每市场同步状态（并发度 / 熔断计数 / 冷却截止 / 已处理到的标的下标）经 CacheManager 持久化，
+# 启用 Redis 时可跨进程重启保留；中断的同步从上次处理到的标的之后续跑
+_MARKET_STATE_KEY = "scheduler:kline_sync:{market}"
+_MARKET_STATE_TTL = 24 * 3600
+
+
+def _load_market_state(market: str) -> Dict[str, Any]:
+    data = CacheManager().get(_MARKET_STATE_KEY.format(market=market))
+    return data if isinstance(data, dict) else {}
+
+
+def _save_market_state(market: str, state: Dict[str, Any]) -> None:
+    CacheManager().set(_MARKET_STATE_KEY.format(market=market), state, ttl=_MARKET_STATE_TTL)
+
+
+@dataclass(frozen=True, slots=True)
+class PlanStep:
+    """同步计划中的一个周期：拉取条数与本周期之后的间隔（最后一个周期为 0）。"""
+    tf: str
+    limit: int
+    delay_after: float
+
+
+@dataclass(frozen=True, slots=True)
+class FetchPlan:
+    """一个市场的同步计划：注册品类时按当时的周期/条数/延时参数生成，每次同步直接复用。"""
+    market: str
+    steps: Tuple[PlanStep, ...]
+    sym_delay: float
+    tf_delay: float
+
+    @property
+    def timeframes(self) -> List[str]:
+        return [step.tf for step in self.steps]
+
+
+def _build_fetch_plan(market: str) -> FetchPlan:
+    timeframes = MARKET_TIMEFRAMES.get(market, ["1D"])
+    delays = MARKET_DELAYS.get(market, {})
+    tf_delay = delays.get("between_timeframes", _DEFAULT_TF_DELAY)
+    last = len(timeframes) - 1
+    return FetchPlan(
+        market=market,
+        steps=tuple(
+            PlanStep(tf, SYNC_LIMITS.get(tf, 500), 0.0 if i == last else tf_delay)
+            for i, tf in enumerate(timeframes)
+        ),
+        sym_delay=delays.get("between_symbols", _DEFAULT_SYMBOL_DELAY),
+        tf_delay=tf_delay,
+    )
+
+
 # 单一定时任务 job id
 SCHEDULER_JOB_ID = "scheduler_kline_sync"
 
 _scheduler = None
 _lock = Lock()
+# 唯一定时任务是否已添加：start_task/stop_task 维护，状态查询无需访问 APScheduler 的 jobstore
+_scheduler_running = Event()
 
 # 任务品类配置：task_type -> { market, symbols, interval_minutes }（无 job_id，全局共用一个 job）
-_task_types: Dict[str, Dict[str, Any]] = {}
+# 写时复制：_task_snapshot 及其中每个品类配置均只读；写入方持 _task_lock 复制出新映射后整体替换引用，
+# 读取方直接读当前引用，不加锁，拿到的总是完整的一版
 _task_lock = Lock()
+_task_snapshot: Mapping[str, Mapping[str, Any]] = MappingProxyType({})
+
+
+def _publish_task_types(updates: Dict[str, Dict[str, Any]]) -> None:
+    """在 _task_lock 内调用：在当前快照副本上合并 updates 并发布为新快照（symbols 存为不可变 tuple，读取方无需拷贝）。"""
+    global _task_snapshot
+    merged = dict(_task_snapshot)
+    for task_type, cfg in updates.items():
+        merged[task_type] = MappingProxyType(dict(
+            cfg, symbols=tuple(cfg["symbols"]), plan=_build_fetch_plan(cfg["market"])))
+    _task_snapshot = MappingProxyType(merged)
 
 
 def get_scheduler():
@@ -81,12 +513,13 @@ def get_scheduler():
 
 
 def _is_scheduler_running() -> bool:
-    sched = get_scheduler()
-    return bool(sched.get_job(SCHEDULER_JOB_ID))
+    return _scheduler_running.is_set()
 
 
 def get_job_status() -> Dict[str, Any]:
-    """返回定时任务是否存在及下次运行时间，不依赖日志。"""
+    """返回定时任务是否存在及下次运行时间，不依赖日志。未启动时直接返回，不访问 jobstore。"""
+    if not _scheduler_running.is_set():
+        return {"job_id": SCHEDULER_JOB_ID, "exists": False, "next_run_time": None}
     try:
         sched = get_scheduler()
         job = sched.get_job(SCHEDULER_JOB_ID)
@@ -144,28 +577,35 @@ _DEFAULT_MARKETS = [
 
 def ensure_default_task_types() -> None:
     """若尚未注册任何品类，则从 qd_market_symbols 读取 init 种子标的并注册（含 Crypto/Forex/US/AShare/HShare/Futures）。"""
+    if _task_snapshot:
+        return
     with _task_lock:
-        if _task_types:
+        if _task_snapshot:
             return
+        defaults: Dict[str, Dict[str, Any]] = {}
         try:
             from app.data.market_symbols_seed import get_all_symbols
+            # 一次查询取回全部市场（按 market, sort_order DESC 排序），再按市场分组，替代逐市场查询
+            by_market: Dict[str, List[str]] = {}
+            for r in get_all_symbols():
+                by_market.setdefault(r["market"], []).append(r["symbol"])
             for market, task_type, fallback_symbols in _DEFAULT_MARKETS:
-                rows = get_all_symbols(market)
-                symbols = [r["symbol"] for r in rows] if rows else fallback_symbols
-                _task_types[task_type] = {
+                symbols = by_market.get(market) or fallback_symbols
+                defaults[task_type] = {
                     "market": market,
-                    "symbols": list(symbols),
+                    "symbols": tuple(symbols),
                     "interval_minutes": 400,
                 }
         except Exception as e:
             logger.warning("Scheduler load symbols from qd_market_symbols failed: %s, use fallback", e)
             for market, task_type, fallback_symbols in _DEFAULT_MARKETS:
-                _task_types[task_type] = {
+                defaults[task_type] = {
                     "market": market,
-                    "symbols": list(fallback_symbols),
+                    "symbols": tuple(fallback_symbols),
                     "interval_minutes": 400,
                 }
-        logger.info("Scheduler default task-types registered: %d categories", len(_task_types))
+        _publish_task_types(defaults)
+        logger.info("Scheduler default task-types registered: %d categories", len(defaults))
 
 
 def add_task_type(
@@ -178,137 +618,313 @@ def add_task_type(
     if not task_type or not task_type.strip().startswith("kline_1m_sync"):
         raise ValueError("task_type must start with kline_1m_sync")
     task_type = task_type.strip()
-    sym_list = list(symbols)
+    sym_tuple = tuple(symbols)
     with _task_lock:
-        _task_types[task_type] = {
+        _publish_task_types({task_type: {
             "market": market,
-            "symbols": sym_list,
+            "symbols": sym_tuple,
             "interval_minutes": interval_minutes,
-        }
+        }})
     logger.info(
         "Scheduler task-type added: task_type=%s market=%s symbols_count=%d interval_min=%d",
-        task_type, market, len(sym_list), interval_minutes,
+        task_type, market, len(sym_tuple), interval_minutes,
     )
-    return {"task_type": task_type, "market": market, "symbols": sym_list, "interval_minutes": interval_minutes}
+    return {"task_type": task_type, "market": market, "symbols": list(sym_tuple), "interval_minutes": interval_minutes}
 
 
 def list_task_types() -> List[Dict[str, Any]]:
     """列出所有任务品类；running 表示唯一的定时任务是否在运行。"""
     ensure_default_task_types()
     running = _is_scheduler_running()
-    with _task_lock:
-        out = []
-        for tt, cfg in _task_types.items():
-            out.append({
-                "task_type": tt,
-                "market": cfg["market"],
-                "symbols": cfg["symbols"],
-                "interval_minutes": cfg["interval_minutes"],
-                "running": running,
-            })
-        return out
+    return [
+        {
+            "task_type": tt,
+            "market": cfg["market"],
+            "symbols": list(cfg["symbols"]),
+            "interval_minutes": cfg["interval_minutes"],
+            "running": running,
+        }
+        for tt, cfg in _task_snapshot.items()
+    ]
 
 
 def _run_kline_sync(task_type: str) -> None:
     """执行一个品类的全周期 K 线同步，内含限流防护与熔断。"""
-    with _task_lock:
-        cfg = _task_types.get(task_type)
-        if not cfg:
-            logger.warning("Scheduler job %s: no config, skip", task_type)
-            return
-        market = cfg["market"]
-        symbols = cfg["symbols"]
+    cfg = _task_snapshot.get(task_type)
+    if not cfg:
+        logger.warning("Scheduler job %s: no config, skip", task_type)
+        return
+    market = cfg["market"]
+    symbols = cfg["symbols"]
     if not symbols:
         logger.info("Scheduler %s: no symbols, skip", task_type)
         return
 
-    timeframes = MARKET_TIMEFRAMES.get(market, ["1D"])
-    delays = MARKET_DELAYS.get(market, {})
-    sym_delay = delays.get("between_symbols", _DEFAULT_SYMBOL_DELAY)
-    tf_delay = delays.get("between_timeframes", _DEFAULT_TF_DELAY)
+    plan: FetchPlan = cfg.get("plan") or _build_fetch_plan(market)
 
     logger.info(
-        "Scheduler %s: started market=%s symbols=%d timeframes=%s sym_delay=%.1fs tf_delay=%.1fs",
-        task_type, market, len(symbols), timeframes, sym_delay, tf_delay,
+        "Scheduler %s: started market=%s symbols=%d timeframes=%s sym_delay=%.1fs tf_delay=%.1fs workers=%d",
+        task_type, market, len(symbols), plan.timeframes, plan.sym_delay, plan.tf_delay,
+        MARKET_CONCURRENCY.get(market, _DEFAULT_CONCURRENCY),
     )
 
-    from app.services.kline_fetcher import get_kline as fetch_kline, _write_points_to_db
-    from app.data_sources import DataSourceFactory
-
-    consecutive_failures = 0
-    market_skipped = False
-
-    for i, symbol in enumerate(symbols):
-        # --- 熔断检查 ---
-        if market_skipped:
-            break
-        if consecutive_failures >= CIRCUIT_SKIP_THRESHOLD:
-            logger.warning(
-                "Scheduler %s: %d consecutive failures → skip remaining %d symbols for %s",
-                task_type, consecutive_failures, len(symbols) - i, market,
-            )
-            market_skipped = True
-            break
-        if consecutive_failures >= CIRCUIT_BREAK_THRESHOLD:
+    saved = _load_market_state(market)
+    _aimd.seed(market, saved.get("concurrency"))
+    cooldown_left = float(saved.get("cooldown_until") or 0) - time.time()
+    if cooldown_left > 0:
+        _request_window(market).pause(cooldown_left)
+    start = 0
+    last_done = saved.get("last_done_idx", -1)
+    if saved.get("total") == len(symbols) and isinstance(last_done, int) and 0 <= last_done < len(symbols) - 1:
+        start = last_done + 1
+        logger.info("Scheduler %s: resuming %s from symbol #%d/%d", task_type, market, start + 1, len(symbols))
+
+    # 熔断计数只延续到「半开」：再失败一次才冷却，避免上次的跳过状态让本轮一开始就整体跳过
+    failures = min(int(saved.get("consecutive_failures") or 0), CIRCUIT_BREAK_THRESHOLD - 1)
+    state = _MarketSyncState(task_type, market, len(symbols), plan.sym_delay, start=start, failures=failures)
+    workers = min(MARKET_CONCURRENCY.get(market, _DEFAULT_CONCURRENCY), len(symbols) - start)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"kline-sync-{market}") as pool:
+        state.track([
+            pool.submit(_sync_symbol_guarded, state, task_type, market, idx, symbols[idx], plan)
+            for idx in range(start, len(symbols))
+        ])
+
+    if state.skipped:
+        logger.warning("Scheduler %s: market %s sync aborted (rate limited)", task_type, market)
+    else:
+        state.last_done_idx = -1
+    state.save()
+
+
+class _MarketSyncState:
+    """一个品类一次同步内各 worker 共享的熔断计数、标的起拉节奏与 AIMD 并发闸门。"""
+
+    def __init__(self, task_type: str, market: str, total: int, sym_delay: float,
+                 start: int = 0, failures: int = 0):
+        self.task_type = task_type
+        self.market = market
+        self.total = total
+        self.sym_delay = sym_delay
+        self.consecutive_failures = failures
+        self.skipped = False
+        self.started = start
+        self.last_done_idx = start - 1
+        self.multi_tf = _supports_multi_tf(market)
+        self._done: set = set()
+        self._next_start = 0.0
+        self._lock = Lock()
+        self._active = 0
+        self._slots = Condition(Lock())
+        self._futures: List[Future] = []
+
+    def acquire_slot(self) -> None:
+        """等待在途标的数低于 AIMD 当前并发度（并发度随限流/成功动态伸缩）。"""
+        with self._slots:
+            while self._active >= max(AIMD_MIN_CONCURRENCY, int(_aimd.concurrency(self.market))):
+                self._slots.wait(timeout=1.0)
+            self._active += 1
+
+    def release_slot(self) -> None:
+        with self._slots:
+            self._active -= 1
+            self._slots.notify_all()
+
+    def track(self, futures: List[Future]) -> None:
+        """登记本轮已提交的标的任务；熔断跳过时撤销其中尚未开始的，不再逐个排队等槽位后退出。"""
+        with self._lock:
+            self._futures = futures
+            skipped = self.skipped
+        if skipped:
+            self._cancel_pending()
+
+    def _cancel_pending(self) -> None:
+        for fut in self._futures:
+            fut.cancel()
+
+    def admit(self, symbol: str = "") -> bool:
+        """标的开始前：熔断跳过返回 False；达到冷却阈值先冷却；再按 sym_delay 时间片 + 确定性抖动错开起拉时间。"""
+        with self._lock:
+            if self.skipped:
+                return False
+            tripped = self.consecutive_failures >= CIRCUIT_SKIP_THRESHOLD
+            if tripped:
+                logger.warning(
+                    "Scheduler %s: %d consecutive failures → skip remaining %d symbols for %s",
+                    self.task_type, self.consecutive_failures, self.total - self.started, self.market,
+                )
+                self.skipped = True
+            cooldown = self.consecutive_failures >= CIRCUIT_BREAK_THRESHOLD
+            failures = self.consecutive_failures
+        if tripped:
+            self._cancel_pending()
+            return False
+        if cooldown:
             logger.warning(
                 "Scheduler %s: %d consecutive failures → cooldown %ds before next symbol",
-                task_type, consecutive_failures, CIRCUIT_COOLDOWN_SECONDS,
+                self.task_type, failures, CIRCUIT_COOLDOWN_SECONDS,
             )
             time.sleep(CIRCUIT_COOLDOWN_SECONDS)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_start)
+            self._next_start = slot + self.sym_delay
+            self.started += 1
+        start_at = slot + _symbol_jitter(self.market, symbol) * self.sym_delay * SYMBOL_JITTER_RATIO
+        if start_at > now:
+            time.sleep(start_at - now)
+        return True
 
-        synced_tfs = []
-        symbol_had_rate_limit = False
-
-        for tf in timeframes:
-            if symbol_had_rate_limit:
-                break
-
-            limit = SYNC_LIMITS.get(tf, 500)
-            try:
-                if tf == "1m":
-                    klines = fetch_kline(market, symbol, "1m", limit=limit)
-                    if klines and len(klines) >= 10:
-                        synced_tfs.append(f"1m:{len(klines)}")
-                    else:
-                        klines_5m = DataSourceFactory.get_kline(
-                            market, symbol, "5m", limit=min(200, limit // 5))
-                        if klines_5m:
-                            _write_points_to_db(market, symbol, klines_5m, interval_sec=300)
-                            synced_tfs.append(f"5m(fb):{len(klines_5m)}")
-                else:
-                    klines = fetch_kline(market, symbol, tf, limit=limit)
-                    if klines:
-                        synced_tfs.append(f"{tf}:{len(klines)}")
+    def record(self, idx: int, synced: bool) -> None:
+        """记录一个标的处理结果；last_done_idx 只推进到连续成功的前缀，失败的标的在续跑时重试。"""
+        with self._lock:
+            self.consecutive_failures = 0 if synced else self.consecutive_failures + 1
+            if synced:
+                self._done.add(idx)
+            while self.last_done_idx + 1 in self._done:
+                self.last_done_idx += 1
+                self._done.discard(self.last_done_idx)
+        self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            snapshot = {
+                "concurrency": _aimd.concurrency(self.market),
+                "consecutive_failures": self.consecutive_failures,
+                "cooldown_until": time.time() + _request_window(self.market).paused_for(),
+                "last_done_idx": self.last_done_idx,
+                "total": self.total,
+            }
+        _save_market_state(self.market, snapshot)
 
-            except RateLimitError as rle:
-                wait = max(rle.retry_after, tf_delay * 5)
-                logger.warning(
-                    "Scheduler %s: RateLimit on %s %s %s → wait %.0fs, skip remaining TFs for this symbol",
-                    task_type, market, symbol, tf, wait,
-                )
-                time.sleep(wait)
-                symbol_had_rate_limit = True
-                consecutive_failures += 1
-                continue
 
-            except Exception as e:
-                logger.warning("Scheduler %s: %s %s %s failed: %s", task_type, market, symbol, tf, e)
+def _sync_symbol_guarded(
+    state: _MarketSyncState,
+    task_type: str,
+    market: str,
+    idx: int,
+    symbol: str,
+    plan: FetchPlan,
+) -> None:
+    """线程池 worker：熔断/节奏检查后同步一个标的，并把结果计入共享熔断计数。"""
+    state.acquire_slot()
+    try:
+        if not state.admit(symbol):
+            return
+        synced_tfs, had_rate_limit = _sync_one_symbol(task_type, market, symbol, plan, multi_tf=state.multi_tf)
+    except Exception as e:
+        logger.warning("Scheduler %s: %s %s worker failed: %s", task_type, market, symbol, e)
+        state.record(idx, False)
+        return
+    finally:
+        state.release_slot()
+    if synced_tfs:
+        logger.info("Scheduler %s: %s %s synced [%s]", task_type, market, symbol, ", ".join(synced_tfs))
+    elif not had_rate_limit:
+        logger.warning("Scheduler %s: %s %s no data for any timeframe", task_type, market, symbol)
+    state.record(idx, bool(synced_tfs))
+
+
+def _sync_one_tf(market: str, symbol: str, step: PlanStep) -> Optional[str]:
+    """同步单个周期，返回摘要（如 "1H:500"；库中最新 K 线仍未收盘时为 "1D:fresh"），无数据返回 None；限流异常原样抛出。"""
+    from app.services.kline_fetcher import get_kline as fetch_kline
+    from app.services.kline_write_buffer import get_kline_write_buffer
+    from app.data_sources import DataSourceFactory
+
+    tf, limit = step.tf, step.limit
+    if _bar_is_fresh(market, symbol, tf):
+        return f"{tf}:fresh"
+    if tf == "1m":
+        count, last = _coalesced_fetch(market, fetch_kline, symbol, "1m", limit)
+        if count >= 10:
+            _remember_last_bar(market, symbol, tf, last)
+            return f"1m:{count}"
+        count_5m, _ = _coalesced_fetch(
+            market, DataSourceFactory.get_kline, symbol, "5m", min(200, limit // 5),
+            sink=lambda klines: get_kline_write_buffer().submit(market, symbol, klines, interval_sec=300))
+        return f"5m(fb):{count_5m}" if count_5m else None
+    count, last = _coalesced_fetch(market, fetch_kline, symbol, tf, limit)
+    if not count:
+        return None
+    _remember_last_bar(market, symbol, tf, last)
+    return f"{tf}:{count}"
+
+
+def _supports_multi_tf(market: str) -> bool:
+    """数据源声明 supports_multi_tf 时，单个标的的各周期可并发拉取。"""
+    from app.data_sources import DataSourceFactory
+    try:
+        return bool(getattr(DataSourceFactory.get_source(market), "supports_multi_tf", False))
+    except Exception:
+        return False
 
-            if tf != timeframes[-1]:
-                time.sleep(tf_delay)
 
-        if synced_tfs:
-            logger.info("Scheduler %s: %s %s synced [%s]", task_type, market, symbol, ", ".join(synced_tfs))
-            consecutive_failures = 0
-        elif not symbol_had_rate_limit:
-            logger.warning("Scheduler %s: %s %s no data for any timeframe", task_type, market, symbol)
-            consecutive_failures += 1
+def _rate_limit_wait(task_type: str, market: str, symbol: str, tf: str, rle: RateLimitError, tf_delay: float) -> None:
+    wait = max(rle.retry_after, tf_delay * 5)
+    logger.warning(
+        "Scheduler %s: RateLimit on %s %s %s → wait %.0fs, skip remaining TFs for this symbol",
+        task_type, market, symbol, tf, wait,
+    )
+    time.sleep(wait)
 
-        if i < len(symbols) - 1:
-            time.sleep(sym_delay)
 
-    if market_skipped:
-        logger.warning("Scheduler %s: market %s sync aborted (rate limited)", task_type, market)
+def _sync_one_symbol(
+    task_type: str,
+    market: str,
+    symbol: str,
+    plan: FetchPlan,
+    multi_tf: bool = False,
+) -> Tuple[List[str], bool]:
+    """按计划的周期优先级同步单个标的，返回 (已同步周期摘要, 是否遇到限流)；遇限流等待后放弃该标的剩余周期。"""
+    if multi_tf and len(plan.steps) > 1:
+        return _sync_one_symbol_multi_tf(task_type, market, symbol, plan)
+
+    synced_tfs: List[str] = []
+    for step in plan.steps:
+        try:
+            summary = _sync_one_tf(market, symbol, step)
+            if summary:
+                synced_tfs.append(summary)
+
+        except RateLimitError as rle:
+            _rate_limit_wait(task_type, market, symbol, step.tf, rle, plan.tf_delay)
+            return synced_tfs, True
+
+        except Exception as e:
+            logger.warning("Scheduler %s: %s %s %s failed: %s", task_type, market, symbol, step.tf, e)
+
+        if step.delay_after:
+            _pace_host(market, step.delay_after)
+    return synced_tfs, False
+
+
+def _sync_one_symbol_multi_tf(
+    task_type: str,
+    market: str,
+    symbol: str,
+    plan: FetchPlan,
+) -> Tuple[List[str], bool]:
+    """各周期并发拉取（不再逐周期 sleep，节奏由请求预算窗口与 AIMD 控制）；摘要仍按周期优先级排列。"""
+    with ThreadPoolExecutor(
+        max_workers=min(MULTI_TF_WORKERS, len(plan.steps)), thread_name_prefix=f"kline-tf-{market}",
+    ) as pool:
+        futures = [(step.tf, pool.submit(_sync_one_tf, market, symbol, step)) for step in plan.steps]
+
+    synced_tfs: List[str] = []
+    limited: Optional[Tuple[str, RateLimitError]] = None
+    for tf, fut in futures:
+        try:
+            summary = fut.result()
+            if summary:
+                synced_tfs.append(summary)
+        except RateLimitError as rle:
+            if limited is None or rle.retry_after > limited[1].retry_after:
+                limited = (tf, rle)
+        except Exception as e:
+            logger.warning("Scheduler %s: %s %s %s failed: %s", task_type, market, symbol, tf, e)
+    if limited is not None:
+        _rate_limit_wait(task_type, market, symbol, limited[0], limited[1], plan.tf_delay)
+        return synced_tfs, True
+    return synced_tfs, False
 
 
 def _run_macro_sync(days: int = 30) -> None:
@@ -415,17 +1031,23 @@ def _run_news_sync() -> None:
         logger.debug("News sync skipped (search may be unconfigured): %s", e)
 
 
+def _run_market_queue(market: str, task_types: List[str]) -> None:
+    """一个市场的任务队列：同市场品类共用数据源与限流状态，按注册顺序串行执行。"""
+    for task_type in task_types:
+        try:
+            _run_kline_sync(task_type)
+        except Exception as e:
+            logger.error("Scheduler %s: market %s sync crashed: %s", task_type, market, e, exc_info=True)
+
+
 def _run_all_kline_sync(macro_days: int = 30) -> None:
-    """单一定时任务入口：按品类顺序执行 K 线 + 宏观 + 新闻同步。"""
+    """单一定时任务入口：各市场并行执行 K 线同步（市场间互不阻塞），完成后执行宏观 + 新闻同步。"""
     ensure_default_task_types()
-    with _task_lock:
-        types_order = list(_task_types.keys())
-    if types_order:
-        logger.info("Scheduler run: %d categories, all timeframes", len(types_order))
-        for i, task_type in enumerate(types_order):
-            _run_kline_sync(task_type)
-            if i < len(types_order) - 1:
-                time.sleep(DELAY_BETWEEN_CATEGORIES_SECONDS)
+    _inflight.open()
+    try:
+        _run_all_markets()
+    finally:
+        _inflight.close()
 
     time.sleep(2)
     _run_macro_sync(days=macro_days)
@@ -435,15 +1057,36 @@ def _run_all_kline_sync(macro_days: int = 30) -> None:
     _run_news_sync()
 
 
+def _run_all_markets() -> None:
+    """按市场分组并行执行全部品类的 K 线同步，结束后刷写 K 线写入缓冲。"""
+    queues: Dict[str, List[str]] = {}
+    for task_type, cfg in _task_snapshot.items():
+        queues.setdefault(cfg["market"], []).append(task_type)
+    if queues:
+        logger.info(
+            "Scheduler run: %d categories across %d markets, all timeframes",
+            sum(len(v) for v in queues.values()), len(queues),
+        )
+        with ThreadPoolExecutor(max_workers=len(queues), thread_name_prefix="kline-market") as pool:
+            futures = [pool.submit(_run_market_queue, market, tts) for market, tts in queues.items()]
+            wait(futures, return_when=ALL_COMPLETED)
+
+        from app.services.kline_write_buffer import get_kline_write_buffer
+        flushed = get_kline_write_buffer().flush()
+        if flushed:
+            logger.info("Scheduler run: flushed %d buffered kline rows", flushed)
+
+
 def start_task(task_type: Optional[str] = None) -> bool:
     """启动唯一的定时任务（会按间隔执行所有已注册品类）。task_type 可省略或传任意已注册品类。"""
     ensure_default_task_types()
-    with _task_lock:
-        if not _task_types:
-            return False
-        interval_minutes = next((c["interval_minutes"] for c in _task_types.values()), 400)
+    types_snapshot = _task_snapshot
+    if not types_snapshot:
+        return False
+    interval_minutes = next((c["interval_minutes"] for c in types_snapshot.values()), 400)
     sched = get_scheduler()
     if sched.get_job(SCHEDULER_JOB_ID):
+        _scheduler_running.set()
         logger.info("Scheduler already running")
         return True
     sched.add_job(
@@ -453,7 +1096,8 @@ def start_task(task_type: Optional[str] = None) -> bool:
         id=SCHEDULER_JOB_ID,
         replace_existing=True,
     )
-    logger.info("Scheduler started, interval=%d min, categories=%d", interval_minutes, len(_task_types))
+    _scheduler_running.set()
+    logger.info("Scheduler started, interval=%d min, categories=%d", interval_minutes, len(types_snapshot))
     return True
 
 
@@ -461,12 +1105,14 @@ def stop_task(task_type: Optional[str] = None) -> bool:
     """停止唯一的定时任务。"""
     sched = get_scheduler()
     if not sched.get_job(SCHEDULER_JOB_ID):
+        _scheduler_running.clear()
         logger.info("Scheduler stop: was not running")
         return True
     try:
         sched.remove_job(SCHEDULER_JOB_ID)
     except Exception:
         pass
+    _scheduler_running.clear()
     logger.info("Scheduler stopped")
     return True
 
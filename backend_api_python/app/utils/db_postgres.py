@@ -3,10 +3,14 @@ PostgreSQL Database Connection Utility
 
 Supports multi-user mode with connection pooling and SQLite compatibility layer.
 """
+import itertools
 import os
+import re
 import threading
+import weakref
 from typing import Optional, Any, List, Dict
 from contextlib import contextmanager
+from functools import lru_cache
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -15,7 +19,7 @@ logger = get_logger(__name__)
 try:
     import psycopg2
     from psycopg2 import pool
-    from psycopg2.extras import RealDictCursor
+    from psycopg2.extras import RealDictCursor, execute_batch
     HAS_PSYCOPG2 = True
 except ImportError:
     HAS_PSYCOPG2 = False
@@ -25,6 +29,10 @@ except ImportError:
 _connection_pool: Optional[Any] = None
 _pool_lock = threading.Lock()
 
+# Statement names already PREPAREd on each physical connection (entries vanish with the connection)
+_prepared_names: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
 
 def _get_database_url() -> str:
     """Get database connection URL from environment"""
@@ -121,6 +129,38 @@ def _get_connection_pool():
         return _connection_pool
 
 
+@lru_cache(maxsize=1024)
+def _convert_query(query: str) -> str:
+    """
+    Convert SQLite-style ? placeholders to PostgreSQL %s.
+    Memoized: module-level SQL constants are rewritten once per process, not on every execute.
+    """
+    # Replace ? -> %s
+    query = query.replace('?', '%s')
+    
+    # SQLite: INSERT OR IGNORE -> PostgreSQL: INSERT ... ON CONFLICT DO NOTHING
+    query = query.replace('INSERT OR IGNORE', 'INSERT')
+    
+    return query
+
+
+@lru_cache(maxsize=1024)
+def _rewrite_for_execute(query: str) -> tuple:
+    """Placeholder conversion plus RETURNING id for INSERTs without RETURNING; returns (query, is_insert)"""
+    query = _convert_query(query)
+    is_insert = query.strip().upper().startswith('INSERT')
+    if is_insert and 'RETURNING' not in query.upper():
+        query = query.rstrip(';').rstrip() + ' RETURNING id'
+    return query, is_insert
+
+
+@lru_cache(maxsize=256)
+def _to_numbered_params(query: str) -> str:
+    """Rewrite ? placeholders to $1, $2, ... as required by PREPARE"""
+    counter = itertools.count(1)
+    return re.sub(r'\?', lambda _m: f'${next(counter)}', query)
+
+
 class PostgresCursor:
     """PostgreSQL cursor wrapper with SQLite placeholder compatibility"""
     
@@ -133,22 +173,11 @@ class PostgresCursor:
         Convert SQLite-style ? placeholders to PostgreSQL %s
         Also handle some SQL syntax differences
         """
-        # Replace ? -> %s
-        query = query.replace('?', '%s')
-        
-        # SQLite: INSERT OR IGNORE -> PostgreSQL: INSERT ... ON CONFLICT DO NOTHING
-        query = query.replace('INSERT OR IGNORE', 'INSERT')
-        
-        return query
+        return _convert_query(query)
     
     def execute(self, query: str, args: Any = None):
         """Execute SQL statement"""
-        query = self._convert_placeholders(query)
-        
-        # Check if this is an INSERT and add RETURNING id if not present
-        is_insert = query.strip().upper().startswith('INSERT')
-        if is_insert and 'RETURNING' not in query.upper():
-            query = query.rstrip(';').rstrip() + ' RETURNING id'
+        query, is_insert = _rewrite_for_execute(query)
         
         if args:
             if not isinstance(args, (tuple, list)):
@@ -168,6 +197,15 @@ class PostgresCursor:
         
         return result
     
+    def executemany(self, query: str, args_list: List[Any], page_size: int = 100):
+        """
+        Execute statement once per parameter set.
+        Statements are sent in pages of ``page_size`` per round-trip (psycopg2 execute_batch);
+        no RETURNING clause is appended and lastrowid is not tracked.
+        """
+        query = self._convert_placeholders(query)
+        execute_batch(self._cursor, query, args_list, page_size=page_size)
+    
     def fetchone(self) -> Optional[Dict[str, Any]]:
         """Fetch single row"""
         row = self._cursor.fetchone()
@@ -180,6 +218,20 @@ class PostgresCursor:
         rows = self._cursor.fetchall()
         return [dict(row) for row in rows] if rows else []
     
+    def __iter__(self):
+        """Iterate rows; on a named (server-side) cursor rows arrive in batches of ``itersize``"""
+        for row in self._cursor:
+            yield dict(row)
+    
+    @property
+    def itersize(self) -> int:
+        """Rows fetched per network round-trip when iterating a named cursor"""
+        return self._cursor.itersize
+    
+    @itersize.setter
+    def itersize(self, value: int):
+        self._cursor.itersize = value
+    
     def close(self):
         """Close cursor"""
         self._cursor.close()
@@ -202,9 +254,24 @@ class PostgresConnection:
         self._conn = conn
         self._pool = _get_connection_pool()
     
-    def cursor(self) -> PostgresCursor:
-        """Create cursor"""
-        return PostgresCursor(self._conn.cursor(cursor_factory=RealDictCursor))
+    def cursor(self, name: Optional[str] = None) -> PostgresCursor:
+        """Create cursor; pass ``name`` for a server-side cursor that streams large result sets"""
+        return PostgresCursor(self._conn.cursor(name=name, cursor_factory=RealDictCursor))
+    
+    def prepare(self, name: str, query: str):
+        """
+        PREPARE ``query`` as ``name`` once per physical connection; later calls are no-ops.
+        Run it with ``EXECUTE name(?, ...)``: the server parses and plans the statement only once.
+        Prepared statements are session-level and survive transaction rollback.
+        """
+        with _prepared_lock:
+            if name in _prepared_names.get(self._conn, ()):
+                return
+        cur = self.cursor()
+        cur.execute(f"PREPARE {name} AS {_to_numbered_params(query)}")
+        cur.close()
+        with _prepared_lock:
+            _prepared_names.setdefault(self._conn, set()).add(name)
     
     def commit(self):
         """Commit transaction"""
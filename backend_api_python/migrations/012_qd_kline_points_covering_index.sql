@@ -0,0 +1,20 @@
+-- =============================================================================
+-- 增量迁移 012: qd_kline_points 覆盖索引
+-- 热点读取 WHERE market/symbol/interval_sec + time_sec 范围 ORDER BY time_sec
+-- 只取 OHLCV 列：INCLUDE 后可走 Index Only Scan，不再回表取行。
+-- 替代 004 的 idx_kline_points_interval_lookup（键列相同，反向扫描即可满足升序）。
+-- 需 PostgreSQL 11+。CONCURRENTLY 不锁写入，须在事务外执行（psql 默认自动提交）。可重复执行。
+-- =============================================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_kline_points_interval_covering
+  ON qd_kline_points (market, symbol, interval_sec, time_sec)
+  INCLUDE (open_price, high_price, low_price, close_price, volume);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_kline_points_interval_lookup;
+
+-- 验证：应看到 Index Only Scan using idx_kline_points_interval_covering，且无 Sort 节点
+-- EXPLAIN SELECT time_sec, open_price, high_price, low_price, close_price, volume
+--   FROM qd_kline_points
+--   WHERE market = 'Crypto' AND symbol = 'BTC/USDT' AND interval_sec = 60
+--     AND time_sec >= 0 AND time_sec <= 2000000000
+--   ORDER BY time_sec ASC;
@@ -403,7 +403,8 @@ CREATE TABLE IF NOT EXISTS qd_kline_points (
     PRIMARY KEY (market, symbol, time_sec, interval_sec)
 );
 CREATE INDEX IF NOT EXISTS idx_kline_points_lookup ON qd_kline_points(market, symbol, time_sec DESC);
-CREATE INDEX IF NOT EXISTS idx_kline_points_interval_lookup ON qd_kline_points(market, symbol, interval_sec, time_sec DESC);
+CREATE INDEX IF NOT EXISTS idx_kline_points_interval_covering ON qd_kline_points(market, symbol, interval_sec, time_sec)
+    INCLUDE (open_price, high_price, low_price, close_price, volume);
 
 -- =============================================================================
 -- 10.7. K-line Ranges (已缓存数据范围，用于增量拉取)
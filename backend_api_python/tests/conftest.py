@@ -12,6 +12,7 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "ForexRTH: Forex is_market_open integration tests (phase 09)")
 from unittest.mock import MagicMock
 from app.services.signal_processor import get_signal_deduplicator
+from app.services.kline_fetcher import clear_kline_caches
 
 
 def make_db_ctx(
@@ -41,6 +42,12 @@ def reset_signal_deduplicator():
     get_signal_deduplicator().clear()
 
 
+@pytest.fixture(autouse=True)
+def reset_kline_caches():
+    """每个测试前清空 K 线进程内缓存，避免跨测试命中。"""
+    clear_kline_caches()
+
+
 @pytest.fixture
 def strategy_client():
     """Flask test client for strategy_bp at /api with g.user_id=1 (same as legacy client_fixture)."""
@@ -0,0 +1,48 @@
+"""Tests for the PostgresCursor SQLite-compat wrapper."""
+
+from unittest.mock import MagicMock, patch
+
+from app.utils import db_postgres as dbp
+
+
+def test_execute_rewrites_placeholders_and_appends_returning_once():
+    raw = MagicMock()
+    raw.fetchone.return_value = {"id": 7}
+    cur = dbp.PostgresCursor(raw)
+    sql = "INSERT INTO t (a, b) VALUES (?, ?)"
+    cur.execute(sql, (1, 2))
+    cur.execute(sql, (3, 4))
+
+    assert raw.execute.call_args[0] == ("INSERT INTO t (a, b) VALUES (%s, %s) RETURNING id", (3, 4))
+    assert cur.lastrowid == 7
+    assert dbp._rewrite_for_execute.cache_info().hits >= 1
+
+
+def test_execute_leaves_with_statements_alone():
+    raw = MagicMock()
+    cur = dbp.PostgresCursor(raw)
+    cur.execute("WITH s AS (SELECT ?::int AS x) INSERT INTO t SELECT x FROM s", (1,))
+    assert raw.execute.call_args[0][0] == "WITH s AS (SELECT %s::int AS x) INSERT INTO t SELECT x FROM s"
+    raw.fetchone.assert_not_called()
+
+
+def test_executemany_batches_without_returning():
+    raw = MagicMock()
+    cur = dbp.PostgresCursor(raw)
+    with patch.object(dbp, "execute_batch") as batch:
+        cur.executemany("INSERT INTO t (a) VALUES (?)", [(1,), (2,)], page_size=50)
+    batch.assert_called_once_with(raw, "INSERT INTO t (a) VALUES (%s)", [(1,), (2,)], page_size=50)
+
+
+def test_prepare_runs_once_per_physical_connection():
+    raw_conn = MagicMock()
+    raw_cur = raw_conn.cursor.return_value
+    sql = "INSERT INTO t (a, b) VALUES (?, ?) ON CONFLICT (a) DO UPDATE SET b = EXCLUDED.b"
+    with patch.object(dbp, "_get_connection_pool"):
+        dbp.PostgresConnection(raw_conn).prepare("t_upsert", sql)
+        dbp.PostgresConnection(raw_conn).prepare("t_upsert", sql)
+        dbp.PostgresConnection(MagicMock()).prepare("t_upsert", sql)
+
+    raw_cur.execute.assert_called_once_with(
+        "PREPARE t_upsert AS INSERT INTO t (a, b) VALUES ($1, $2) ON CONFLICT (a) DO UPDATE SET b = EXCLUDED.b"
+    )
@@ -0,0 +1,548 @@
+"""Tests for kline_fetcher point storage helpers (DB read/write, slicing, aggregation)."""
+
+import json
+from contextlib import ExitStack
+from unittest.mock import MagicMock, patch
+
+from app.services import kline_fetcher as kf
+
+
+def _db_ctx(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    ctx = MagicMock()
+    ctx.__enter__.return_value = conn
+    ctx.__exit__.return_value = False
+    return ctx, conn
+
+
+def _db_row(t, price=1.0):
+    """读库 SQL 已按 K 线字段起别名并转 float8，游标行即 K 线 dict"""
+    return {"time": t, "open": price, "high": price, "low": price, "close": price, "volume": 2.0}
+
+
+def test_range_read_streams_through_named_cursor():
+    cursor = MagicMock()
+    cursor.__iter__.return_value = iter([_db_row(60), _db_row(120, 1.5)])
+    ctx, conn = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx):
+        out = kf._read_points_range_from_db("Crypto", "BTC/USDT", 0, 600, interval_sec=60)
+
+    conn.cursor.assert_called_once_with(name="qd_kline_stream")
+    assert cursor.itersize == kf.STREAM_ITERSIZE
+    cursor.close.assert_called_once()
+    assert out == [
+        {"time": 60, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 2.0},
+        {"time": 120, "open": 1.5, "high": 1.5, "low": 1.5, "close": 1.5, "volume": 2.0},
+    ]
+
+
+def test_tail_read_orders_newest_rows_ascending():
+    cursor = MagicMock()
+    cursor.__iter__.return_value = iter([_db_row(180), _db_row(120), _db_row(60)])
+    ctx, _ = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx):
+        out = kf._read_points_tail("Crypto", "BTC/USDT", 60, 3)
+        assert kf._read_points_tail("Crypto", "BTC/USDT", 60, 3) == out
+
+    cursor.execute.assert_called_once_with(kf._SELECT_POINTS_TAIL_SQL, ("Crypto", "BTC/USDT", 60, 3))
+    assert [b["time"] for b in out] == [60, 120, 180]
+
+
+def test_latest_1m_chart_reads_db_tail_once():
+    now = 1_700_000_000 // 60 * 60
+    tail = _bars(range(now - 9 * 60, now + 1, 60))
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(kf.time, "time", return_value=now + 30))
+        stack.enter_context(patch.object(kf, "_get_range", return_value=None))
+        read_tail = stack.enter_context(patch.object(kf, "_read_points_tail", return_value=tail))
+        read_range = stack.enter_context(patch.object(kf, "_read_points_range_from_db"))
+        max_time = stack.enter_context(patch.object(kf, "_read_points_max_time"))
+        assert kf._get_kline_1m("Crypto", "BTC/USDT", limit=10) == tail
+
+    read_tail.assert_called_once_with("Crypto", "BTC/USDT", 60, 10)
+    read_range.assert_not_called()
+    max_time.assert_not_called()
+
+
+def test_range_read_returns_empty_on_db_error():
+    with patch.object(kf, "get_db_connection", side_effect=RuntimeError("down")):
+        assert kf._read_points_range_from_db("Crypto", "BTC/USDT", 0, 600, interval_sec=300) == []
+
+
+def test_max_gap_lookup_table_matches_rules():
+    for (market, sec), gap in kf._GAP_LUT.items():
+        assert kf._get_max_gap(market, sec) == gap == kf._compute_max_gap(market, sec)
+    assert kf._get_max_gap("Crypto", 900) == kf.MAX_GAP[("Crypto", 60)]
+    assert kf._get_max_gap("USStock", 604800) == kf.MAX_GAP[("USStock", 86400)]
+    # 未登记市场仍走规则兜底
+    assert kf._get_max_gap("Metals", 300) == 3 * 86400
+    assert kf._get_max_gap("Metals", 604800) == 10 * 86400
+
+
+def _bars(times):
+    return [{"time": t, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 0.0} for t in times]
+
+
+def test_slice_tail_takes_last_bars_before_cutoff():
+    pts = _bars([60, 120, 180, 240, 300])
+    assert [b["time"] for b in kf._slice_tail(pts, 2, None)] == [240, 300]
+    assert [b["time"] for b in kf._slice_tail(pts, 2, 240)] == [120, 180]
+    assert [b["time"] for b in kf._slice_tail(pts, 10, 61)] == [60]
+    assert kf._slice_tail(pts, 3, 60) == []
+
+
+def test_write_updates_range_with_bounds_seen_while_writing():
+    cursor = MagicMock()
+    ctx, conn = _db_ctx(cursor)
+    klines = _bars([180, 60, 120]) + [{"time": None, "open": 1}]
+    with patch.object(kf, "get_db_connection", return_value=ctx), \
+            patch.object(kf, "_update_range") as upd:
+        kf._write_points_to_db("Crypto", "BTC/USDT", klines, interval_sec=60)
+
+    conn.commit.assert_called_once()
+    upd.assert_called_once_with("Crypto", "BTC/USDT", 60, 60, 180)
+
+
+def test_batch_write_binds_columns_for_all_symbols_in_one_statement():
+    cursor = MagicMock()
+    ctx, conn = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx) as get_conn, \
+            patch.object(kf, "_update_range") as upd:
+        kf._write_points_many([
+            ("Crypto", "BTC/USDT", _bars([600, 300]), 300),
+            ("Crypto", "ETH/USDT", _bars([900]), 300),
+            ("Crypto", "BTC/USDT", [dict(_bars([600])[0], close=2.0)], 300),
+            ("Crypto", "SOL/USDT", [], 300),
+        ])
+
+    get_conn.assert_called_once()
+    conn.commit.assert_called_once()
+    assert [c[0][0] for c in cursor.execute.call_args_list] == [kf._ASYNC_COMMIT_SQL, kf._UNNEST_UPSERT_POINTS_SQL]
+    sql, columns = cursor.execute.call_args[0]
+    assert sql.lstrip().startswith("WITH")
+    assert columns == [
+        ["Crypto", "Crypto", "Crypto"],
+        ["BTC/USDT", "BTC/USDT", "ETH/USDT"],
+        [600, 300, 900],
+        [300, 300, 300],
+        [1.0, 1.0, 1.0], [1.0, 1.0, 1.0], [1.0, 1.0, 1.0],
+        [2.0, 1.0, 1.0],
+        [0.0, 0.0, 0.0],
+    ]
+    assert sorted(c[0] for c in upd.call_args_list) == [
+        ("Crypto", "BTC/USDT", 300, 300, 600),
+        ("Crypto", "ETH/USDT", 300, 900, 900),
+    ]
+
+
+def test_batch_write_falls_back_per_symbol_on_error():
+    def fail_unnest(sql, params=None):
+        if sql == kf._UNNEST_UPSERT_POINTS_SQL:
+            raise RuntimeError("no unnest")
+
+    cursor = MagicMock()
+    cursor.execute.side_effect = fail_unnest
+    ctx, _ = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx), \
+            patch.object(kf, "_write_points_to_db") as single:
+        kf._write_points_many([("Crypto", "BTC/USDT", _bars([300]), 300)])
+
+    single.assert_called_once_with("Crypto", "BTC/USDT", _bars([300]), interval_sec=300)
+
+
+def _dense_1m_source(page_cap, floor_ts=0):
+    """模拟 1m 源：返回 before_time 之前最近 min(limit, page_cap) 根，最早到 floor_ts"""
+    calls = []
+
+    def fetch(market, symbol, limit, before_time=None):
+        calls.append(before_time)
+        n = min(limit, page_cap)
+        times = [t for t in range(before_time - 60 * n, before_time, 60) if t >= floor_ts]
+        return _bars(times), "1m"
+
+    return fetch, calls
+
+
+def test_paginated_fetch_prefetches_crypto_pages_without_holes():
+    fetch, calls = _dense_1m_source(page_cap=1000)
+    end = 600000 * 60
+    start = end - 3499 * 60
+    with patch.object(kf, "_fetch_1m_or_fallback_5m", side_effect=fetch), \
+            patch.object(kf.time, "sleep") as sleep:
+        out, tf = kf._fetch_1m_paginated("Crypto", "BTC/USDT", start, end, 3500)
+
+    assert tf == "1m"
+    times = [b["time"] for b in out]
+    assert times[0] <= start and times[-1] == end
+    assert all(b - a == 60 for a, b in zip(times, times[1:]))
+    assert len(calls) == 4
+    # 首页串行 + 一批 3 页并发，仅批间休眠一次
+    assert sleep.call_count == 1
+
+
+def test_paginated_fetch_refetches_when_source_page_is_short():
+    fetch, calls = _dense_1m_source(page_cap=300)
+    end = 600000 * 60
+    start = end - 1999 * 60
+    with patch.object(kf, "_fetch_1m_or_fallback_5m", side_effect=fetch), \
+            patch.object(kf.time, "sleep"):
+        out, _ = kf._fetch_1m_paginated("Crypto", "BTC/USDT", start, end, 2000)
+
+    times = [b["time"] for b in out]
+    assert times[0] <= start and times[-1] == end
+    assert all(b - a == 60 for a, b in zip(times, times[1:]))
+
+
+def test_paginated_fetch_stops_at_first_page_with_other_resolution():
+    dense, _ = _dense_1m_source(page_cap=1000)
+    end = 600000 * 60
+    start = end - 3499 * 60
+    fallback_anchor = end + 60 - 2000 * 60  # 第二批并发的中间一页回退到 5m
+
+    def fetch(market, symbol, limit, before_time=None):
+        if before_time == fallback_anchor:
+            return _bars(range(before_time - 300 * 200, before_time, 300)), "5m"
+        return dense(market, symbol, limit, before_time)
+
+    with patch.object(kf, "_fetch_1m_or_fallback_5m", side_effect=fetch), \
+            patch.object(kf.time, "sleep"):
+        out, tf = kf._fetch_1m_paginated("Crypto", "BTC/USDT", start, end, 3500)
+
+    assert tf == "1m"
+    times = [b["time"] for b in out]
+    assert len(times) == 2000 and times[-1] == end
+    assert all(b - a == 60 for a, b in zip(times, times[1:]))
+
+
+def test_get_kline_dispatches_to_specialized_entry():
+    assert kf._SPECIALIZED["1m"] is kf._get_kline_1m
+    tiered = kf._SPECIALIZED["4H"]
+    assert tiered.keywords == {
+        "timeframe": "4H", "interval_sec": 14400, "lower_tiers": (("1H", 3600), ("5m", 300), ("1m", 60)),
+    }
+    with patch.dict(kf._SPECIALIZED, {"4H": MagicMock(return_value=["x"])}):
+        assert kf.get_kline("Crypto", "BTC/USDT", "4H", 10) == ["x"]
+        kf._SPECIALIZED["4H"].assert_called_once_with("Crypto", "BTC/USDT", 10, None)
+
+
+def test_realtime_response_cached_until_points_written():
+    inner = MagicMock(side_effect=lambda m, s, lim, bt: _bars([60, 120]))
+    with patch.dict(kf._SPECIALIZED, {"1H": inner}):
+        first = kf.get_kline("Crypto", "BTC/USDT", "1H", 2)
+        assert kf.get_kline("Crypto", "BTC/USDT", "1H", 2) == first
+        assert inner.call_count == 1
+        # 历史请求不走缓存
+        kf.get_kline("Crypto", "BTC/USDT", "1H", 2, before_time=600)
+        assert inner.call_count == 2
+
+        cursor = MagicMock()
+        ctx, _ = _db_ctx(cursor)
+        with patch.object(kf, "get_db_connection", return_value=ctx), patch.object(kf, "_update_range"):
+            kf._write_points_to_db("Crypto", "BTC/USDT", _bars([180]), interval_sec=3600)
+        kf.get_kline("Crypto", "BTC/USDT", "1H", 2)
+        assert inner.call_count == 3
+
+
+def test_empty_realtime_response_not_cached():
+    inner = MagicMock(return_value=[])
+    with patch.dict(kf._SPECIALIZED, {"5m": inner}):
+        kf.get_kline("Crypto", "ETH/USDT", "5m", 5)
+        kf.get_kline("Crypto", "ETH/USDT", "5m", 5)
+    assert inner.call_count == 2
+
+
+def _fail_bulk_upsert(sql, params=None):
+    if sql == kf._BULK_UPSERT_POINTS_SQL:
+        raise RuntimeError("invalid json")
+
+
+def test_write_sends_single_json_statement_deduplicated_by_time():
+    cursor = MagicMock()
+    ctx, conn = _db_ctx(cursor)
+    klines = _bars([60, 120]) + [dict(_bars([60])[0], close=2.0)]
+    with patch.object(kf, "get_db_connection", return_value=ctx), patch.object(kf, "_update_range"):
+        kf._write_points_to_db("Crypto", "BTC/USDT", klines, interval_sec=60)
+
+    cursor.executemany.assert_not_called()
+    assert [c[0][0] for c in cursor.execute.call_args_list] == [kf._ASYNC_COMMIT_SQL, kf._BULK_UPSERT_POINTS_SQL]
+    sql, params = cursor.execute.call_args[0]
+    assert sql.lstrip().startswith("WITH") and "RETURNING" not in sql.upper()
+    payload, market, symbol, interval = params
+    assert (market, symbol, interval) == ("Crypto", "BTC/USDT", 60)
+    assert json.loads(payload) == [
+        {"t": 60, "o": 1.0, "h": 1.0, "l": 1.0, "c": 2.0, "v": 0.0},
+        {"t": 120, "o": 1.0, "h": 1.0, "l": 1.0, "c": 1.0, "v": 0.0},
+    ]
+    conn.commit.assert_called_once()
+
+
+def test_write_falls_back_to_executemany_when_bulk_fails():
+    cursor = MagicMock()
+    cursor.execute.side_effect = _fail_bulk_upsert
+    ctx, conn = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx), patch.object(kf, "_update_range"):
+        kf._write_points_to_db("Crypto", "BTC/USDT", _bars([60, 120]), interval_sec=60)
+
+    conn.rollback.assert_called_once()
+    # 回滚会撤销 SET LOCAL，兜底前需重新设置
+    assert cursor.execute.call_args_list[-1][0][0] == kf._ASYNC_COMMIT_SQL
+    sql, params = cursor.executemany.call_args[0]
+    assert "RETURNING" not in sql.upper()
+    assert params == [
+        ("Crypto", "BTC/USDT", 60, 60, 1.0, 1.0, 1.0, 1.0, 0.0),
+        ("Crypto", "BTC/USDT", 120, 60, 1.0, 1.0, 1.0, 1.0, 0.0),
+    ]
+    conn.commit.assert_called_once()
+
+
+def test_write_chunks_large_batches_and_commits_once():
+    cursor = MagicMock()
+    cursor.execute.side_effect = _fail_bulk_upsert
+    ctx, conn = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx), \
+            patch.object(kf, "_update_range"), patch.object(kf, "WRITE_CHUNK", 2):
+        kf._write_points_to_db("Crypto", "BTC/USDT", _bars([60, 120, 180, 240, 300]), interval_sec=60)
+
+    assert [len(c[0][1]) for c in cursor.executemany.call_args_list] == [2, 2, 1]
+    conn.commit.assert_called_once()
+
+
+def test_aggregate_bars_groups_unsorted_input_by_bucket():
+    bars = [
+        {"time": 3660, "open": 5.0, "high": 6.0, "low": 4.0, "close": 5.5, "volume": 1.0},
+        {"time": 0, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 2.0},
+        {"time": 60, "open": 1.5, "high": 3.0, "low": 1.0, "close": 2.5, "volume": 3.0},
+        {"time": 3600, "open": 4.0, "high": 4.5, "low": 3.5, "close": 5.0, "volume": 4.0},
+    ]
+    assert kf._aggregate_bars(bars, 3600) == [
+        {"time": 0, "open": 1.0, "high": 3.0, "low": 0.5, "close": 2.5, "volume": 5.0},
+        {"time": 3600, "open": 4.0, "high": 6.0, "low": 3.5, "close": 5.5, "volume": 5.0},
+    ]
+    assert kf._aggregate_bars(bars, 60) is bars
+    assert kf._aggregate_bars([], 3600) == []
+
+
+def test_sorted_scan_matches_vectorized_path_and_rejects_unsorted():
+    bars = [
+        {"time": t, "open": float(t), "high": t + 1.0, "low": t - 1.0, "close": t + 0.5, "volume": 1.0}
+        for t in range(0, 7200, 300)
+    ]
+    scanned = kf._aggregate_sorted_scan(bars, 3600)
+    with patch.object(kf, "AGG_NUMPY_MIN_BARS", 0):
+        assert kf._aggregate_bars(bars, 3600) == scanned
+    assert [b["time"] for b in scanned] == [0, 3600]
+    assert kf._aggregate_sorted_scan(bars[::-1], 3600) is None
+
+
+def test_aggregated_read_groups_in_sql():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [_db_row(3600, 2.0)]
+    ctx, _ = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx):
+        out = kf._read_aggregated_points_from_db("Crypto", "BTC/USDT", 0, 7200, 60, 3600)
+
+    sql, params = cursor.execute.call_args[0]
+    assert "GROUP BY" in sql
+    assert params == (3600, 3600, "Crypto", "BTC/USDT", 60, 0, 7200)
+    assert out == [{"time": 3600, "open": 2.0, "high": 2.0, "low": 2.0, "close": 2.0, "volume": 2.0}]
+
+
+def test_aggregated_read_returns_none_on_db_error():
+    with patch.object(kf, "get_db_connection", side_effect=RuntimeError("down")):
+        assert kf._read_aggregated_points_from_db("Crypto", "BTC/USDT", 0, 7200, 60, 3600) is None
+
+
+def test_range_reads_cached_until_symbol_written():
+    with patch.object(kf, "_read_points_range_uncached", return_value=_bars([60, 120])) as raw, \
+            patch.object(kf, "_read_points_max_time_uncached", return_value=120) as raw_max:
+        assert kf._read_points_range_from_db("Crypto", "BTC/USDT", 60, 600) == _bars([60, 120])
+        kf._read_points_range_from_db("Crypto", "BTC/USDT", 31, 630)  # 覆盖的分钟相同
+        assert kf._read_points_max_time("Crypto", "BTC/USDT") == 120
+        kf._read_points_max_time("Crypto", "BTC/USDT")
+        assert raw.call_count == 1 and raw_max.call_count == 1
+
+        with patch.object(kf, "get_db_connection", return_value=_db_ctx(MagicMock())[0]), \
+                patch.object(kf, "_update_range"):
+            kf._write_points_to_db("Crypto", "BTC/USDT", _bars([180]), interval_sec=60)
+        kf._read_points_range_from_db("Crypto", "BTC/USDT", 60, 600)
+        kf._read_points_max_time("Crypto", "BTC/USDT")
+        assert raw.call_count == 2 and raw_max.call_count == 2
+
+
+def test_range_cache_separates_aligned_and_unaligned_start_in_same_minute():
+    def read(market, symbol, start_ts, end_ts, interval_sec=60):
+        return [b for b in _bars([120, 180]) if start_ts <= b["time"] <= end_ts]
+
+    with patch.object(kf, "_read_points_range_uncached", side_effect=read):
+        assert [b["time"] for b in kf._read_points_range_from_db("Crypto", "ETH/USDT", 120, 600)] == [120, 180]
+        assert [b["time"] for b in kf._read_points_range_from_db("Crypto", "ETH/USDT", 121, 600)] == [180]
+        assert [b["time"] for b in kf._read_points_range_from_db("Crypto", "ETH/USDT", 120, 600)] == [120, 180]
+
+
+def _read_during_upsert(cursor, upsert_sql):
+    """在写事务提交前插入一次读：模拟并发读者在 upsert 与 commit 之间读到旧行并写入缓存"""
+    def execute(sql, params=None):
+        if sql == upsert_sql:
+            kf._read_points_range_from_db("Crypto", "BTC/USDT", 0, 600)
+    cursor.execute.side_effect = execute
+
+
+def test_read_between_upsert_and_commit_does_not_outlive_write():
+    cursor = MagicMock()
+    _read_during_upsert(cursor, kf._BULK_UPSERT_POINTS_SQL)
+    with patch.object(kf, "_read_points_range_uncached", return_value=_bars([60])) as raw, \
+            patch.object(kf, "get_db_connection", return_value=_db_ctx(cursor)[0]), \
+            patch.object(kf, "_update_range"):
+        kf._write_points_to_db("Crypto", "BTC/USDT", _bars([120]), interval_sec=60)
+        kf._read_points_range_from_db("Crypto", "BTC/USDT", 0, 600)
+
+    assert raw.call_count == 2
+
+
+def test_batch_read_between_upsert_and_commit_does_not_outlive_write():
+    cursor = MagicMock()
+    _read_during_upsert(cursor, kf._UNNEST_UPSERT_POINTS_SQL)
+    with patch.object(kf, "_read_points_range_uncached", return_value=_bars([60])) as raw, \
+            patch.object(kf, "get_db_connection", return_value=_db_ctx(cursor)[0]), \
+            patch.object(kf, "_update_range"):
+        kf._write_points_many([("Crypto", "BTC/USDT", _bars([120]), 60)])
+        kf._read_points_range_from_db("Crypto", "BTC/USDT", 0, 600)
+
+    assert raw.call_count == 2
+
+
+def test_merge_by_time_appends_tail_and_resolves_overlaps():
+    base = _bars([60, 120, 180])
+    tail = [dict(b, close=9.0) for b in _bars([180, 240])]
+    merged = kf._merge_by_time(base, tail)
+    assert [b["time"] for b in merged] == [60, 120, 180, 240]
+    assert merged[2]["close"] == 9.0
+    kept = kf._merge_by_time(base, tail, extra_wins=False)
+    assert kept[2]["close"] == 1.0 and kept[-1]["time"] == 240
+    # 乱序的拉网结果同样有序合并
+    assert [b["time"] for b in kf._merge_by_time(base, _bars([300, 0, 120]))] == [0, 60, 120, 180, 300]
+
+
+def test_range_read_as_array_aggregates_without_dicts():
+    cursor = MagicMock()
+    cursor.__iter__.return_value = iter([_db_row(0, 1.0), _db_row(60, 3.0), _db_row(300, 2.0)])
+    ctx, _ = _db_ctx(cursor)
+    with patch.object(kf, "get_db_connection", return_value=ctx):
+        arr = kf._read_points_range_uncached("Crypto", "BTC/USDT", 0, 600, 60, as_array=True)
+
+    assert arr.dtype == kf.KLINE_DTYPE and arr["time"].tolist() == [0, 60, 300]
+    assert kf._array_to_bars(kf._aggregate_array(arr, 300)) == [
+        {"time": 0, "open": 1.0, "high": 3.0, "low": 1.0, "close": 3.0, "volume": 4.0},
+        {"time": 300, "open": 2.0, "high": 2.0, "low": 2.0, "close": 2.0, "volume": 2.0},
+    ]
+    with patch.object(kf, "get_db_connection", side_effect=RuntimeError("down")):
+        empty = kf._read_points_range_uncached("Crypto", "BTC/USDT", 0, 600, 300, as_array=True)
+    assert empty.size == 0 and empty.dtype == kf.KLINE_DTYPE
+
+
+def test_lower_tier_probe_prefers_levels_order():
+    sizes = {14400: 1, 3600: 5, 300: 9, 60: 9}
+
+    def probe(market, symbol, start, end, lower_sec, interval_sec):
+        return _bars(range(0, sizes[lower_sec] * 60, 60))
+
+    levels = (("4H", 14400), ("1H", 3600), ("5m", 300), ("1m", 60))
+    for workers in (1, 4):
+        with patch.object(kf, "_probe_lower_tier", side_effect=probe), \
+                patch.object(kf, "LOWER_PROBE_WORKERS", workers):
+            tf, agg = kf._probe_lower_tiers("Crypto", "BTC/USDT", 0, 600, 86400, levels, 5)
+            assert tf == "1H" and len(agg) == 5
+            assert kf._probe_lower_tiers("Crypto", "BTC/USDT", 0, 600, 86400, levels, 10) is None
+
+
+def _tiered_network_env(from_same, fetched):
+    return [
+        patch.object(kf, "_get_range", return_value=None),
+        patch.object(kf, "_read_points_range_from_db", return_value=from_same),
+        patch.object(kf, "_probe_lower_tiers", return_value=None),
+        patch.object(kf.DataSourceFactory, "get_kline", return_value=fetched),
+        patch.object(kf, "_write_points_to_db"),
+    ]
+
+
+def test_tiered_network_fetch_returns_tail_without_db_merge():
+    now = 1_000_000 * 3600
+    fetched = _bars([now - 3600 * i for i in range(5, 0, -1)])
+    with ExitStack() as st:
+        for p in _tiered_network_env(_bars([now - 3600 * 9]), fetched):
+            st.enter_context(p)
+        st.enter_context(patch.object(kf.time, "time", return_value=now))
+        merge = st.enter_context(patch.object(kf, "_merge_by_time", wraps=kf._merge_by_time))
+        out = kf._SPECIALIZED["1H"]("Crypto", "BTC/USDT", 3, None)
+
+    assert [b["time"] for b in out] == [b["time"] for b in fetched[-3:]]
+    assert all(c.args[0] == [] for c in merge.call_args_list)
+
+
+def test_tiered_network_pages_stitch_in_order_without_overlap():
+    now = 1_000_000 * 3600
+
+    def source(market, symbol, tf, limit, before_time=None):
+        # 含 before_time 本身：相邻页重叠一根
+        return _bars(range(before_time - 3600 * (limit - 1), before_time + 1, 3600))
+
+    with ExitStack() as st:
+        for p in _tiered_network_env([], []):
+            st.enter_context(p)
+        st.enter_context(patch.object(kf.DataSourceFactory, "get_kline", side_effect=source))
+        st.enter_context(patch.object(kf.time, "time", return_value=now))
+        st.enter_context(patch.object(kf.time, "sleep"))
+        st.enter_context(patch.object(kf, "PAGINATE_CHUNK", 4))
+        write = kf._write_points_to_db
+        out = kf._SPECIALIZED["1H"]("Crypto", "BTC/USDT", 10, None)
+
+    times = [b["time"] for b in write.call_args.args[2]]
+    assert times == sorted(set(times)) and times[-1] == now
+    assert [b["time"] for b in out] == times[-10:]
+
+
+def test_edge_gaps_match_grid_enumeration():
+    def brute(first_ex, last_ex, start, end, iv, limit):
+        grid = [start + i * iv for i in range(limit) if start + i * iv <= end]
+        missing = [t for t in grid if not first_ex <= t <= last_ex]
+        return sum(t < first_ex for t in missing), sum(t > last_ex for t in missing)
+
+    cases = [
+        (600, 1200, 0, 1800, 60, 100),
+        (0, 1800, 600, 1200, 60, 100),
+        (630, 3000, 0, 2400, 60, 5),
+        (5000, 6000, 0, 1200, 60, 100),
+        (0, 100, 600, 300, 60, 10),
+    ]
+    for case in cases:
+        assert kf._edge_gaps(*case) == brute(*case)
+
+
+def test_symbols_without_1m_skip_the_1m_probe():
+    calls = []
+
+    def source(market, symbol, tf, limit, before_time=None):
+        calls.append(tf)
+        return _bars([300, 600]) if tf == "5m" else []
+
+    with patch.object(kf.DataSourceFactory, "get_kline", side_effect=source):
+        assert kf._fetch_1m_or_fallback_5m("USStock", "XYZ", 100)[1] == "5m"
+        assert kf._fetch_1m_or_fallback_5m("USStock", "XYZ", 100)[1] == "5m"
+    assert calls == ["1m", "5m", "5m"]
+
+
+def test_empty_historical_1m_page_does_not_mark_symbol_without_1m():
+    calls = []
+
+    def source(market, symbol, tf, limit, before_time=None):
+        calls.append((tf, before_time))
+        if tf == "5m":
+            return _bars([300, 600])
+        return [] if before_time is not None else _bars(range(60, 60 * 21, 60))
+
+    with patch.object(kf.DataSourceFactory, "get_kline", side_effect=source):
+        assert kf._fetch_1m_or_fallback_5m("USStock", "OLD1M", 100, before_time=600)[1] == "5m"
+        data, tf = kf._fetch_1m_or_fallback_5m("USStock", "OLD1M", 100)
+    assert tf == "1m" and len(data) == 20
+    assert calls == [("1m", 600), ("5m", 600), ("1m", None)]
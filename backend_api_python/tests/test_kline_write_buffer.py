@@ -0,0 +1,62 @@
+"""Tests for the background K-line write buffer used by the scheduled sync."""
+
+import threading
+
+from app.services.kline_write_buffer import KlineWriteBuffer
+
+
+def _bars(times):
+    return [{"time": t, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 0.0} for t in times]
+
+
+def test_flush_merges_submissions_per_symbol():
+    written = []
+    buf = KlineWriteBuffer(batch_size=1000, max_age_s=60, writer=written.extend)
+    buf.submit("Crypto", "BTC/USDT", _bars([300]), 300)
+    buf.submit("Crypto", "BTC/USDT", _bars([600]), 300)
+    buf.submit("Crypto", "ETH/USDT", _bars([300]), 300)
+
+    assert buf.pending_rows() == 3
+    assert buf.flush() == 3
+    assert buf.pending_rows() == 0
+    assert buf.flush() == 0
+    assert [(m, s, [b["time"] for b in k], iv) for m, s, k, iv in written] == [
+        ("Crypto", "BTC/USDT", [300, 600], 300),
+        ("Crypto", "ETH/USDT", [300], 300),
+    ]
+
+
+def test_background_thread_flushes_when_batch_is_full():
+    done = threading.Event()
+    written = []
+
+    def writer(batches):
+        written.extend(batches)
+        done.set()
+
+    buf = KlineWriteBuffer(batch_size=2, max_age_s=60, writer=writer)
+    buf.submit("Crypto", "BTC/USDT", _bars([300, 600]), 300)
+
+    assert done.wait(2)
+    assert buf.pending_rows() == 0
+    assert len(written) == 1
+
+
+def test_submit_flushes_inline_when_pending_limit_is_reached():
+    written = []
+    buf = KlineWriteBuffer(batch_size=100, max_age_s=60, max_pending=3, writer=written.extend)
+    buf.submit("Crypto", "BTC/USDT", _bars([300, 600, 900]), 300)
+
+    assert buf.pending_rows() == 0
+    assert len(written) == 1
+
+
+def test_writer_error_does_not_propagate():
+    def failing(batches):
+        raise RuntimeError("db down")
+
+    buf = KlineWriteBuffer(batch_size=100, max_age_s=60, writer=failing)
+    buf.submit("Crypto", "BTC/USDT", _bars([300]), 300)
+    assert buf.flush() == 0
+    assert buf.pending_rows() == 0
+    assert buf.pending_rows() == 0
@@ -0,0 +1,240 @@
+"""Tests for MacroDataService DB read/write and macro frame assembly (mocked DB and network)."""
+
+import json
+import threading
+from contextlib import ExitStack
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app.services.macro_data_service as mds
+from app.services.macro_data_service import MacroDataService
+
+
+@pytest.fixture(autouse=True)
+def _table_ready():
+    MacroDataService.clear_cache()
+    with patch.object(MacroDataService, "_db_ready", True):
+        yield
+    MacroDataService.clear_cache()
+
+
+def _db_ctx(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    ctx = MagicMock()
+    ctx.__enter__.return_value = conn
+    ctx.__exit__.return_value = False
+    return ctx, conn
+
+
+def test_write_db_sends_one_batched_upsert():
+    cursor = MagicMock()
+    ctx, conn = _db_ctx(cursor)
+    data = pd.DataFrame(
+        {"vix": [15.5, np.nan, 17.0]},
+        index=pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"]),
+    )
+    with patch.object(mds, "_get_db", return_value=ctx):
+        MacroDataService._write_db("vix", data)
+
+    cursor.execute.assert_not_called()
+    conn.prepare.assert_called_once_with(mds._UPSERT_MACRO_STMT, mds._UPSERT_MACRO_SQL)
+    cursor.executemany.assert_called_once_with(
+        mds._EXECUTE_MACRO_UPSERT_SQL,
+        [("vix", "2024-01-02", 15.5), ("vix", "2024-01-04", 17.0)],
+    )
+    conn.commit.assert_called_once()
+
+
+def test_read_db_builds_float_frame_indexed_by_date():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [
+        {"indicator": "vix", "date_val": date(2024, 1, 2), "value": 15.5},
+        {"indicator": "vix", "date_val": date(2024, 1, 3), "value": 16.0},
+    ]
+    ctx, _ = _db_ctx(cursor)
+    with patch.object(mds, "_get_db", return_value=ctx):
+        df = MacroDataService._read_db_many(["vix"], date(2024, 1, 1), date(2024, 1, 5))["vix"]
+
+    assert list(df.columns) == ["vix"] and df.index.name == "time"
+    assert df["vix"].dtype == np.float64
+    assert list(df.index) == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+    assert df["vix"].tolist() == [15.5, 16.0]
+
+
+def _frame(col, days, value):
+    return pd.DataFrame({col: [float(value)] * len(days)}, index=pd.to_datetime(days))
+
+
+def _patch_fetchers(fn):
+    """把各指标的网络拉取替换为 fn(indicator, start, end)"""
+    return [
+        patch.object(MacroDataService, f"_fetch_{name}_net", side_effect=lambda s, e, ind=ind: fn(ind, s, e))
+        for ind, name in [("vix", "vix"), ("vhsi", "vhsi"), ("civix", "civix"), ("dxy", "dxy"), ("fear_greed", "fg")]
+    ]
+
+
+def test_macro_df_fetches_missing_indicators_concurrently_and_keeps_column_order():
+    barrier = threading.Barrier(len(MacroDataService.MACRO_COLUMNS), timeout=5)
+
+    def fetch(indicator, start, end):
+        barrier.wait()  # 全部指标同时在途才放行，串行实现会超时
+        return _frame(indicator, ["2024-01-02", "2024-01-03"], 1)
+
+    with ExitStack() as st:
+        for p in _patch_fetchers(fetch):
+            st.enter_context(p)
+        st.enter_context(patch.object(MacroDataService, "_read_db_many", return_value={}))
+        write = st.enter_context(patch.object(MacroDataService, "_write_db_many"))
+        df = MacroDataService._get_macro_df(datetime(2024, 1, 1), datetime(2024, 1, 5))
+
+    assert list(df.columns) == MacroDataService.MACRO_COLUMNS
+    assert len(df) == 2
+    assert list(write.call_args.args[0]) == MacroDataService.MACRO_COLUMNS
+
+
+def test_macro_df_reads_all_indicators_in_one_query():
+    days = [d.strftime("%Y-%m-%d") for d in pd.date_range("2023-12-20", "2024-01-06")]
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [
+        {"indicator": ind, "date_val": pd.Timestamp(d).date(), "value": 1.0}
+        for ind in MacroDataService.MACRO_COLUMNS for d in days
+    ]
+    ctx, _ = _db_ctx(cursor)
+    fetch = MagicMock(return_value=None)
+    with ExitStack() as st:
+        for p in _patch_fetchers(fetch):
+            st.enter_context(p)
+        get_db = st.enter_context(patch.object(mds, "_get_db", return_value=ctx))
+        df = MacroDataService._get_macro_df(datetime(2024, 1, 1), datetime(2024, 1, 5))
+
+    get_db.assert_called_once()
+    cursor.execute.assert_called_once()
+    assert cursor.execute.call_args.args[1][:-2] == tuple(MacroDataService.MACRO_COLUMNS)
+    fetch.assert_not_called()
+    assert list(df.columns) == MacroDataService.MACRO_COLUMNS
+
+
+def test_ensure_table_creates_once_under_concurrent_first_calls():
+    created = []
+    gate = threading.Event()
+
+    def create():
+        gate.wait(1)
+        created.append(1)
+        MacroDataService._db_ready = True
+
+    with patch.object(MacroDataService, "_db_ready", False), \
+            patch.object(MacroDataService, "_create_table", side_effect=create):
+        threads = [threading.Thread(target=MacroDataService._ensure_table) for _ in range(4)]
+        for t in threads:
+            t.start()
+        gate.set()
+        for t in threads:
+            t.join()
+
+    assert created == [1]
+
+
+def test_macro_df_aligns_indicators_on_union_of_dates_and_forward_fills():
+    frames = {
+        "vix": _frame("vix", ["2024-01-02", "2024-01-04"], 15),
+        "fear_greed": pd.DataFrame({"fear_greed": [40, 60]}, index=pd.to_datetime(["2024-01-03", "2024-01-04"])),
+    }
+    with ExitStack() as st:
+        for p in _patch_fetchers(lambda ind, s, e: frames.get(ind)):
+            st.enter_context(p)
+        st.enter_context(patch.object(MacroDataService, "_read_db_many", return_value={}))
+        st.enter_context(patch.object(MacroDataService, "_write_db_many"))
+        df = MacroDataService._get_macro_df(datetime(2024, 1, 1), datetime(2024, 1, 5))
+
+    assert list(df.columns) == ["vix", "fear_greed"]
+    assert list(df.index) == list(pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"]))
+    assert df["vix"].tolist() == [15.0, 15.0, 15.0]
+    assert df["fear_greed"].tolist()[1:] == [40.0, 60.0] and np.isnan(df["fear_greed"].iloc[0])
+    assert (df.dtypes == np.float64).all()
+
+
+def test_enrich_dataframe_forward_fills_macro_onto_bar_times():
+    macro = pd.DataFrame(
+        {"vix": [15.0, 16.0], "dxy": [100.0, 101.0]},
+        index=pd.to_datetime(["2024-01-02", "2024-01-03"]),
+    )
+    bars = pd.DataFrame(
+        {"close": [1.0, 2.0, 3.0]},
+        index=pd.to_datetime(["2024-01-01 12:00", "2024-01-02 12:00", "2024-01-03 12:00"]),
+    )
+    with patch.object(MacroDataService, "_get_macro_df", return_value=macro):
+        out = MacroDataService.enrich_dataframe(bars, datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    assert np.isnan(out["vix"].iloc[0])
+    assert out["vix"].tolist()[1:] == [15.0, 16.0]
+    assert out["dxy"].tolist()[1:] == [100.0, 101.0]
+    assert out[["vhsi", "civix", "fear_greed"]].isna().all().all()
+    assert list(out.columns) == ["close"] + MacroDataService.MACRO_COLUMNS
+
+
+def test_rolling_window_is_served_from_indicator_cache():
+    days = pd.date_range("2023-12-01", "2024-02-01")
+    fetch = MagicMock(side_effect=lambda ind, s, e: pd.DataFrame({ind: 1.0}, index=days))
+    with ExitStack() as st:
+        for p in _patch_fetchers(fetch):
+            st.enter_context(p)
+        read = st.enter_context(patch.object(MacroDataService, "_read_db_many", return_value={}))
+        st.enter_context(patch.object(MacroDataService, "_write_db_many"))
+        MacroDataService._get_macro_df(datetime(2024, 1, 1), datetime(2024, 1, 10))
+        df = MacroDataService._get_macro_df(datetime(2024, 1, 2), datetime(2024, 1, 11))
+
+    assert read.call_count == 1
+    assert fetch.call_count == len(MacroDataService.MACRO_COLUMNS)
+    assert df.index[0] == pd.Timestamp("2023-12-23") and df.index[-1] == pd.Timestamp("2024-01-12")
+
+
+def test_realtime_enrich_overwrites_only_last_bar():
+    bars = pd.DataFrame(
+        {"close": [1.0, 2.0]},
+        index=pd.to_datetime(["2024-01-02", "2024-01-03"]),
+    )
+    macro = pd.DataFrame({"vix": [15.0, 16.0]}, index=pd.to_datetime(["2024-01-02", "2024-01-03"]))
+    with patch.object(MacroDataService, "_get_macro_df", return_value=macro), \
+            patch.object(MacroDataService, "_get_realtime_snapshot", return_value={"vix": 20.0, "fear_greed": 55}):
+        out = MacroDataService.enrich_dataframe_realtime(bars)
+
+    assert out["vix"].tolist() == [15.0, 20.0]
+    assert np.isnan(out["fear_greed"].iloc[0]) and out["fear_greed"].iloc[-1] == 55
+
+
+def test_fear_greed_feed_parsed_into_sorted_utc_daily_frame():
+    payload = {"data": [
+        {"value": "55", "timestamp": "1704240000"},
+        {"value": "40", "timestamp": "1704153600"},
+    ]}
+    resp = MagicMock(content=json.dumps(payload).encode())
+    with patch.object(mds._requests, "get", return_value=resp):
+        df = MacroDataService._fetch_fg_net(datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    assert df.index.name == "time"
+    assert list(df.index) == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+    assert df["fear_greed"].tolist() == [40, 55]
+
+
+def test_enrich_dataframe_matches_reindex_ffill_on_tz_aware_bars():
+    rng = np.random.default_rng(7)
+    macro_days = pd.to_datetime(sorted(rng.choice(pd.date_range("2024-01-01", "2024-03-01").values, 30, replace=False)))
+    macro = pd.DataFrame({"vix": rng.random(30), "fear_greed": rng.random(30)}, index=macro_days)
+    bars = pd.DataFrame(
+        {"close": 1.0},
+        index=pd.date_range("2023-12-30", "2024-03-05", freq="7h", tz="UTC"),
+    )
+    expected = macro.copy()
+    expected.index = expected.index.tz_localize("UTC")
+    expected = expected.reindex(bars.index, method="ffill")
+    with patch.object(MacroDataService, "_get_macro_df", return_value=macro.copy()):
+        out = MacroDataService.enrich_dataframe(bars.copy(), datetime(2024, 1, 1), datetime(2024, 3, 1))
+
+    np.testing.assert_array_equal(out["vix"].to_numpy(), expected["vix"].to_numpy())
+    np.testing.assert_array_equal(out["fear_greed"].to_numpy(), expected["fear_greed"].to_numpy())
@@ -0,0 +1,575 @@
+"""
+Tests for the K-line sync job in scheduler_service (_run_kline_sync and its per-symbol workers).
+"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import app.services.scheduler_service as sched
+from app.data_sources.base import RateLimitError
+from app.utils.cache import CacheManager
+
+
+@pytest.fixture(autouse=True)
+def _reset_throttles():
+    def reset():
+        sched._aimd.reset()
+        sched._request_windows.clear()
+        sched._host_buckets.clear()
+        sched._last_host_call_ns.clear()
+        sched._last_bar_ts.clear()
+        CacheManager().delete(sched._MARKET_STATE_KEY.format(market="Crypto"))
+
+    reset()
+    yield
+    reset()
+
+
+@pytest.fixture
+def task_type():
+    """Publish a throwaway task type; the registry snapshot is restored afterwards."""
+    name = "test_sync_task"
+    cfg = {
+        "market": "Crypto",
+        "symbols": [f"S{i}/USDT" for i in range(8)],
+        "interval_minutes": 400,
+    }
+    with patch.object(sched, "_task_snapshot", sched.MappingProxyType({name: sched.MappingProxyType(cfg)})):
+        yield name
+
+
+def _plan(timeframes, tf_delay=0.5):
+    with patch.dict(sched.MARKET_TIMEFRAMES, {"Crypto": timeframes}), \
+            patch.dict(sched.MARKET_DELAYS, {"Crypto": {"between_symbols": 0, "between_timeframes": tf_delay}}):
+        return sched._build_fetch_plan("Crypto")
+
+
+@pytest.fixture
+def no_delays():
+    with patch.dict(sched.MARKET_DELAYS, {"Crypto": {"between_symbols": 0, "between_timeframes": 0}}), \
+            patch.dict(sched.MARKET_TIMEFRAMES, {"Crypto": ["1H"]}):
+        yield
+
+
+def test_symbols_are_synced_concurrently(task_type, no_delays):
+    active = 0
+    peak = 0
+    seen = []
+    lock = threading.Lock()
+
+    def fake_kline(market, symbol, tf, limit=500):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+            seen.append(symbol)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return [{"time": 1}]
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=fake_kline), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 4}):
+        sched._run_kline_sync(task_type)
+
+    assert sorted(seen) == sorted(sched._task_snapshot[task_type]["symbols"])
+    assert 1 < peak <= 4
+
+
+def test_consecutive_failures_skip_remaining_symbols(task_type, no_delays):
+    calls = []
+
+    def failing_kline(market, symbol, tf, limit=500):
+        calls.append(symbol)
+        return []
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=failing_kline), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 1}), \
+            patch.object(sched, "CIRCUIT_BREAK_THRESHOLD", 100), \
+            patch.object(sched, "CIRCUIT_SKIP_THRESHOLD", 3):
+        sched._run_kline_sync(task_type)
+
+    assert len(calls) == 3
+
+
+def test_circuit_skip_cancels_queued_symbols(task_type, no_delays):
+    admitted = []
+    real_admit = sched._MarketSyncState.admit
+
+    def counting_admit(self, symbol=""):
+        admitted.append(symbol)
+        return real_admit(self, symbol)
+
+    with patch("app.services.kline_fetcher.get_kline", return_value=[]), \
+            patch.object(sched._MarketSyncState, "admit", counting_admit), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 1}), \
+            patch.object(sched, "CIRCUIT_BREAK_THRESHOLD", 100), \
+            patch.object(sched, "CIRCUIT_SKIP_THRESHOLD", 2):
+        sched._run_kline_sync(task_type)
+
+    # 第 3 个标的触发跳过，其余排队中的标的被撤销，不再进入 admit
+    assert len(admitted) == 3
+
+
+def test_rate_limit_waits_and_skips_remaining_timeframes():
+    calls = []
+
+    def limited_kline(market, symbol, tf, limit=500):
+        calls.append(tf)
+        if tf == "4H":
+            raise RateLimitError("binance", retry_after=7)
+        return [{"time": 1}]
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=limited_kline), \
+            patch.object(sched.time, "sleep") as sleep:
+        synced, limited = sched._sync_one_symbol("t", "Crypto", "BTC/USDT", _plan(["1D", "4H", "1H"]))
+
+    assert calls == ["1D", "4H"]
+    assert synced == ["1D:1"]
+    assert limited is True
+    sleep.assert_any_call(7)
+
+
+def test_aimd_decreases_on_rate_limit_and_recovers_additively():
+    aimd = sched.MarketAIMD()
+    with patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 4}):
+        assert aimd.concurrency("Crypto") == 4
+        aimd.on_error("Crypto")
+        assert aimd.concurrency("Crypto") == 2
+        aimd.on_error("Crypto", retry_after=30)
+        assert aimd.concurrency("Crypto") == sched.AIMD_MIN_CONCURRENCY
+        for _ in range(10):
+            aimd.on_success("Crypto", 0.1)
+        assert aimd.concurrency("Crypto") == 4
+        assert aimd.latency("Crypto") == pytest.approx(0.1)
+
+
+def test_rate_limit_during_sync_drops_market_concurrency(task_type, no_delays):
+    def fake_kline(market, symbol, tf, limit=500):
+        if symbol == "S0/USDT":
+            raise RateLimitError("binance", retry_after=1)
+        return [{"time": 1}]
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=fake_kline), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 4}), \
+            patch.object(sched, "AIMD_ALPHA", 0), \
+            patch.object(sched.time, "sleep"):
+        sched._run_kline_sync(task_type)
+
+    assert sched._aimd.concurrency("Crypto") == sched.AIMD_MIN_CONCURRENCY
+
+
+def test_request_window_pauses_before_budget_is_exhausted():
+    clock = [1000.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    window = sched._RequestWindow(limit=20)
+    with patch.object(sched.time, "monotonic", side_effect=lambda: clock[0]), \
+            patch.object(sched.time, "sleep", side_effect=fake_sleep):
+        for _ in range(18):
+            assert window.acquire() == 0
+            clock[0] += 1
+        waited = window.acquire()
+
+    # 20 * 10% = 2 reserved: the 19th request waits for the first stamp to leave the 60s window
+    assert waited == pytest.approx(42)
+    assert sleeps == [pytest.approx(42)]
+
+
+def test_retry_after_pauses_the_whole_market():
+    def limited():
+        raise RateLimitError("binance", retry_after=5)
+
+    window = sched._request_window("Crypto")
+    with patch.object(sched.time, "sleep") as sleep, \
+            pytest.raises(RateLimitError):
+        sched._measure_latency("Crypto", limited)
+    sleep.assert_not_called()
+    assert window._paused_until > sched.time.monotonic() + 4
+
+
+def test_interrupted_run_resumes_after_last_processed_symbol(task_type, no_delays):
+    calls = []
+
+    def fake_kline(market, symbol, tf, limit=500):
+        calls.append(symbol)
+        return [{"time": 1}]
+
+    sched._save_market_state("Crypto", {
+        "concurrency": 2, "consecutive_failures": 0, "cooldown_until": 0,
+        "last_done_idx": 4, "total": 8,
+    })
+    with patch("app.services.kline_fetcher.get_kline", side_effect=fake_kline), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 4}):
+        sched._run_kline_sync(task_type)
+
+    assert sorted(calls) == ["S5/USDT", "S6/USDT", "S7/USDT"]
+    assert sched._aimd.concurrency("Crypto") == 3.5
+    saved = sched._load_market_state("Crypto")
+    assert saved["last_done_idx"] == -1
+    assert saved["concurrency"] == 3.5
+
+
+def test_skipped_run_persists_resume_point(task_type, no_delays):
+    with patch("app.services.kline_fetcher.get_kline", return_value=[]), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 1}), \
+            patch.object(sched, "CIRCUIT_BREAK_THRESHOLD", 100), \
+            patch.object(sched, "CIRCUIT_SKIP_THRESHOLD", 3):
+        sched._run_kline_sync(task_type)
+
+    saved = sched._load_market_state("Crypto")
+    assert saved["last_done_idx"] == -1
+    assert saved["consecutive_failures"] == 3
+
+
+def test_resume_point_stops_before_first_failed_symbol(task_type, no_delays):
+    def kline(market, symbol, tf, limit=500):
+        return [{"time": 1}] if symbol in ("S0/USDT", "S1/USDT", "S3/USDT") else []
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=kline), \
+            patch.dict(sched.MARKET_CONCURRENCY, {"Crypto": 1}), \
+            patch.object(sched, "CIRCUIT_BREAK_THRESHOLD", 100), \
+            patch.object(sched, "CIRCUIT_SKIP_THRESHOLD", 3):
+        sched._run_kline_sync(task_type)
+
+    # S2 失败、S3 成功、S4..S6 连败触发跳过：续跑点停在 S1，S2 下一轮重试
+    assert sched._load_market_state("Crypto")["last_done_idx"] == 1
+
+
+def test_markets_sync_in_parallel_and_same_market_types_run_in_order():
+    types = {
+        "crypto": {"market": "Crypto", "symbols": ["BTC/USDT"], "interval_minutes": 400},
+        "crypto_extra": {"market": "Crypto", "symbols": ["ETH/USDT"], "interval_minutes": 400},
+        "forex": {"market": "Forex", "symbols": ["EURUSD"], "interval_minutes": 400},
+    }
+    barrier = threading.Barrier(2, timeout=2)
+    order = []
+
+    def fake_sync(task_type):
+        if task_type in ("crypto", "forex"):
+            barrier.wait()  # both markets must be in flight at the same time
+        order.append(task_type)
+
+    with patch.object(sched, "_task_snapshot", sched.MappingProxyType(types)), \
+            patch.object(sched, "ensure_default_task_types"), \
+            patch.object(sched, "_run_kline_sync", side_effect=fake_sync), \
+            patch.object(sched, "_run_macro_sync"), \
+            patch.object(sched, "_run_sentiment_sync"), \
+            patch.object(sched, "_run_news_sync"), \
+            patch.object(sched.time, "sleep"):
+        sched._run_all_kline_sync()
+
+    assert sorted(order) == ["crypto", "crypto_extra", "forex"]
+    assert order.index("crypto") < order.index("crypto_extra")
+
+
+def test_add_task_type_publishes_read_only_snapshot():
+    with patch.object(sched, "_task_snapshot", sched.MappingProxyType({})):
+        before = sched._task_snapshot
+        sched.add_task_type("kline_1m_sync_snapshot_test", "Crypto", ["BTC/USDT"])
+        snap = sched._task_snapshot
+
+    assert snap is not before
+    assert "kline_1m_sync_snapshot_test" not in before
+    cfg = snap["kline_1m_sync_snapshot_test"]
+    assert cfg["symbols"] == ("BTC/USDT",)
+    with pytest.raises(TypeError):
+        snap["x"] = {}
+    with pytest.raises(TypeError):
+        cfg["market"] = "Forex"
+
+
+def test_symbols_are_stored_as_tuples_and_listed_as_lists():
+    symbols = ["BTC/USDT", "ETH/USDT"]
+    with patch.object(sched, "_task_snapshot", sched.MappingProxyType({})):
+        added = sched.add_task_type("kline_1m_sync_tuple_test", "Crypto", symbols)
+        symbols.append("SOL/USDT")
+        stored = sched._task_snapshot["kline_1m_sync_tuple_test"]["symbols"]
+        listed = sched.list_task_types()
+
+    assert stored == ("BTC/USDT", "ETH/USDT")
+    assert added["symbols"] == ["BTC/USDT", "ETH/USDT"]
+    assert listed[0]["symbols"] == ["BTC/USDT", "ETH/USDT"]
+
+
+def test_inflight_cache_coalesces_concurrent_duplicates():
+    cache = sched._InFlightCache()
+    cache.open()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return ["bars"]
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.call(("k",), slow_fetch)))
+    owner.start()
+    started.wait(2)
+    waiter = threading.Thread(target=lambda: results.append(cache.call(("k",), slow_fetch)))
+    waiter.start()
+    release.set()
+    owner.join(2)
+    waiter.join(2)
+
+    assert results == [["bars"], ["bars"]]
+    assert len(calls) == 1
+    assert cache.call(("k",), slow_fetch) == ["bars"]
+    assert len(calls) == 1
+
+
+def test_inflight_cache_drops_failures_and_is_bypassed_when_closed():
+    cache = sched._InFlightCache()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimitError("binance", retry_after=1)
+        return ["bars"]
+
+    cache.open()
+    with pytest.raises(RateLimitError):
+        cache.call(("k",), flaky)
+    assert cache.call(("k",), flaky) == ["bars"]
+    cache.close()
+    assert cache.call(("k",), flaky) == ["bars"]
+    assert len(attempts) == 3
+
+
+def test_inflight_cache_survives_overlapping_rounds():
+    cache = sched._InFlightCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return ["bars"]
+
+    cache.open()
+    cache.call(("k",), fetch)
+    cache.open()   # 手动触发与定时轮次重叠
+    cache.call(("k",), fetch)
+    cache.close()  # 先结束的一轮不能关掉仍在进行的一轮
+    cache.call(("k",), fetch)
+    assert len(calls) == 1
+    cache.close()
+    cache.call(("k",), fetch)
+    assert len(calls) == 2
+
+
+def test_coalesced_fetch_keeps_only_summary_and_sinks_once():
+    sunk = []
+    with patch.object(sched, "_inflight", sched._InFlightCache()) as cache:
+        cache.open()
+        fetch = MagicMock(return_value=[{"time": 60}, {"time": 120}])
+        fetch.__qualname__ = "fetch"
+        first = sched._coalesced_fetch("Crypto", fetch, "BTC/USDT", "5m", 40, sink=sunk.append)
+        second = sched._coalesced_fetch("Crypto", fetch, "BTC/USDT", "5m", 40, sink=sunk.append)
+        cache.close()
+
+    assert first == second == (2, 120)
+    assert fetch.call_count == 1
+    assert sunk == [[{"time": 60}, {"time": 120}]]
+
+
+def test_sparse_1m_falls_back_to_5m_and_buffers_the_bars():
+    bars_5m = [{"time": 300}, {"time": 600}]
+    buffer = MagicMock()
+    with patch("app.services.kline_fetcher.get_kline", return_value=[{"time": 60}]), \
+            patch("app.data_sources.DataSourceFactory.get_kline", return_value=bars_5m), \
+            patch("app.services.kline_write_buffer.get_kline_write_buffer", return_value=buffer):
+        summary = sched._sync_one_tf("Crypto", "BTC/USDT", sched.PlanStep("1m", 1000, 0.0))
+
+    assert summary == "5m(fb):2"
+    buffer.submit.assert_called_once_with("Crypto", "BTC/USDT", bars_5m, interval_sec=300)
+
+
+def test_multi_tf_source_fetches_timeframes_concurrently_without_tf_sleeps():
+    barrier = threading.Barrier(3, timeout=2)
+
+    def fake_kline(market, symbol, tf, limit=500):
+        barrier.wait()  # all three timeframes must be in flight together
+        return [{"time": 1}]
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=fake_kline), \
+            patch.object(sched.time, "sleep") as sleep:
+        synced, limited = sched._sync_one_symbol(
+            "t", "Crypto", "BTC/USDT", _plan(["1D", "4H", "1H"]), multi_tf=True)
+
+    assert synced == ["1D:1", "4H:1", "1H:1"]
+    assert limited is False
+    sleep.assert_not_called()
+
+
+def test_multi_tf_support_is_read_from_data_source():
+    from app.data_sources.crypto import CryptoDataSource
+    from app.data_sources.base import BaseDataSource
+
+    assert CryptoDataSource.supports_multi_tf is True
+    assert BaseDataSource.supports_multi_tf is False
+    with patch("app.data_sources.DataSourceFactory.get_source") as get_source:
+        get_source.return_value = MagicMock(supports_multi_tf=True)
+        assert sched._supports_multi_tf("Crypto") is True
+        get_source.return_value = object()
+        assert sched._supports_multi_tf("Forex") is False
+
+
+def test_token_bucket_allows_burst_then_paces_at_rate():
+    clock = [50.0]
+
+    def fake_sleep(seconds):
+        clock[0] += seconds
+
+    with patch.object(sched.time, "monotonic", side_effect=lambda: clock[0]), \
+            patch.object(sched.time, "sleep", side_effect=fake_sleep):
+        bucket = sched.TokenBucket(rate=2.0, burst=3)
+        assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+        assert bucket.acquire() == pytest.approx(0.5)
+        bucket.pause(10)
+        assert bucket.acquire() == pytest.approx(10.5)
+
+
+def test_markets_on_the_same_provider_share_one_bucket():
+    assert sched._host_bucket("USStock") is sched._host_bucket("Futures")
+    assert sched._host_bucket("AShare") is sched._host_bucket("HShare")
+    assert sched._host_bucket("Crypto") is not sched._host_bucket("Forex")
+
+    def limited():
+        raise RateLimitError("yahoo", retry_after=30)
+
+    with patch.object(sched.time, "sleep"), pytest.raises(RateLimitError):
+        sched._measure_latency("USStock", limited)
+    assert sched._host_bucket("Futures")._stamp > sched.time.monotonic() + 29
+
+
+def test_running_flag_follows_start_and_stop_without_polling_jobstore():
+    fake = MagicMock()
+    fake.get_job.return_value = None
+    with patch.object(sched, "get_scheduler", return_value=fake), \
+            patch.object(sched, "ensure_default_task_types"), \
+            patch.object(sched, "_task_snapshot", sched.MappingProxyType(
+                {"kline_1m_sync_crypto": {"market": "Crypto", "symbols": [], "interval_minutes": 400}})):
+        assert sched.get_job_status()["exists"] is False
+        assert sched.start_task() is True
+        assert sched._is_scheduler_running() is True
+        fake.add_job.assert_called_once()
+
+        fake.get_job.reset_mock()
+        assert sched._is_scheduler_running() is True
+        fake.get_job.assert_not_called()
+
+        fake.get_job.return_value = MagicMock()
+        assert sched.stop_task() is True
+        assert sched._is_scheduler_running() is False
+        assert sched.get_job_status() == {
+            "job_id": sched.SCHEDULER_JOB_ID, "exists": False, "next_run_time": None,
+        }
+
+
+def test_default_task_types_load_all_markets_with_one_query():
+    rows = [
+        {"market": "Crypto", "symbol": "ETH/USDT"},
+        {"market": "Crypto", "symbol": "BTC/USDT"},
+        {"market": "USStock", "symbol": "AAPL"},
+    ]
+    with patch("app.data.market_symbols_seed.get_all_symbols", return_value=rows) as get_all, \
+            patch.object(sched, "_task_snapshot", sched.MappingProxyType({})):
+        sched.ensure_default_task_types()
+        snap = sched._task_snapshot
+
+    get_all.assert_called_once_with()
+    assert snap["kline_1m_sync_crypto"]["symbols"] == ("ETH/USDT", "BTC/USDT")
+    assert snap["kline_1m_sync_us"]["symbols"] == ("AAPL",)
+    # 库中无该市场标的时回退到内置列表
+    assert snap["kline_1m_sync_forex"]["symbols"][0] == "XAUUSD"
+
+
+def test_symbol_jitter_is_stable_and_spreads_within_slot():
+    first = [sched._symbol_jitter("Crypto", f"S{i}/USDT") for i in range(50)]
+    assert first == [sched._symbol_jitter("Crypto", f"S{i}/USDT") for i in range(50)]
+    assert all(0 <= j < 1 for j in first)
+    assert len(set(first)) > 40
+
+    with patch.object(sched, "_INSTANCE_ID", "other-host"):
+        assert [sched._symbol_jitter("Crypto", f"S{i}/USDT") for i in range(50)] != first
+
+
+def test_admit_offsets_start_by_symbol_jitter():
+    clock = [100.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    state = sched._MarketSyncState("t", "Crypto", 2, sym_delay=2.0)
+    with patch.object(sched.time, "monotonic", side_effect=lambda: clock[0]), \
+            patch.object(sched.time, "sleep", side_effect=fake_sleep), \
+            patch.object(sched, "_symbol_jitter", side_effect=[0.5, 0.0]):
+        assert state.admit("A") is True
+        assert state.admit("B") is True
+
+    # A: slot 100 + 0.5*2*0.5 = 100.5; B: slot 102 + 0
+    assert sleeps == [pytest.approx(0.5), pytest.approx(1.5)]
+
+
+def test_timeframe_delay_only_sleeps_what_remains_since_last_host_call():
+    clock = [10_000_000_000]
+    sleeps = []
+
+    def slow_kline(market, symbol, tf, limit=500):
+        clock[0] += {"1D": 2, "4H": 5}.get(tf, 0) * 1_000_000_000
+        return [{"time": 1}]
+
+    with patch("app.services.kline_fetcher.get_kline", side_effect=slow_kline), \
+            patch.object(sched.time, "monotonic_ns", side_effect=lambda: clock[0]), \
+            patch.object(sched.time, "sleep", side_effect=sleeps.append):
+        synced, _ = sched._sync_one_symbol("t", "Crypto", "BTC/USDT", _plan(["1D", "4H", "1H"], tf_delay=3.0))
+
+    assert synced == ["1D:1", "4H:1", "1H:1"]
+    # 1D 耗时 2s → 只补 1s；4H 耗时 5s 已超过间隔 → 不再等待
+    assert sleeps == [pytest.approx(1.0)]
+
+
+def test_timeframe_is_skipped_until_next_bar_opens():
+    now = time.time()
+    bars = {"1D": [{"time": int(now) - 3600}], "1H": [{"time": int(now) - 7200}]}
+    calls = []
+
+    def fake_kline(market, symbol, tf, limit=500):
+        calls.append(tf)
+        return bars[tf]
+
+    plan = _plan(["1D", "1H"], tf_delay=0)
+    with patch("app.services.kline_fetcher.get_kline", side_effect=fake_kline):
+        first, _ = sched._sync_one_symbol("t", "Crypto", "BTC/USDT", plan)
+        second, _ = sched._sync_one_symbol("t", "Crypto", "BTC/USDT", plan)
+
+    assert first == ["1D:1", "1H:1"]
+    # 日线一小时前才开盘 → 跳过；1H 最新一根已收盘 → 继续拉取
+    assert second == ["1D:fresh", "1H:1"]
+    assert calls == ["1D", "1H", "1H"]
+
+
+def test_fetch_plan_is_compiled_at_registration():
+    with patch.object(sched, "_task_snapshot", sched.MappingProxyType({})):
+        sched.add_task_type("kline_1m_sync_plan_test", "Forex", ["EURUSD"])
+        plan = sched._task_snapshot["kline_1m_sync_plan_test"]["plan"]
+
+    assert plan.timeframes == sched.MARKET_TIMEFRAMES["Forex"]
+    assert plan.sym_delay == sched.MARKET_DELAYS["Forex"]["between_symbols"]
+    assert [s.limit for s in plan.steps] == [sched.SYNC_LIMITS.get(tf, 500) for tf in plan.timeframes]
+    assert [s.delay_after for s in plan.steps[:-1]] == [3.0] * (len(plan.steps) - 1)
+    assert plan.steps[-1].delay_after == 0
+    with pytest.raises(AttributeError):
+        plan.steps[0].limit = 1